@@ -2,19 +2,18 @@ import json
 import os
 from openai import OpenAI
 
-# Conecta no LM Studio
-client = OpenAI(
-    api_key="dummy",
-    base_url="http://localhost:1234/v1"
-)
+from openagent.tools import ToolRegistry
+from openagent.uds import openai_client_options
+
+# Conecta no servidor local; com OPENAGENT_SOCKET usa o Unix domain socket
+# do OpenAgent em vez do loopback TCP
+client = OpenAI(api_key="dummy", **openai_client_options())
 
 # ========= TOOLS =========
 
-def write_file(path: str, content: str):
-    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
-    return f"Arquivo criado: {os.path.abspath(path)}"
+tool_registry = ToolRegistry()
+# Mostra a saída dos comandos enquanto eles rodam
+tool_registry.on_command_output = lambda stream, text: print(text, end="", flush=True)
 
 TOOLS = [
     {
@@ -46,33 +45,44 @@ messages = [
     }
 ]
 
-while True:
-    user = input("\n🧑 Você: ")
-    messages.append({"role": "user", "content": user})
 
-    response = client.chat.completions.create(
-        model="mistralai/ministral-3-14b-reasoning",
-        messages=messages,
-        tools=TOOLS,
-        tool_choice="auto"
-    )
+def main():
+    while True:
+        user = input("\n🧑 Você: ")
+        messages.append({"role": "user", "content": user})
+
+        response = client.chat.completions.create(
+            model="mistralai/ministral-3-14b-reasoning",
+            messages=messages,
+            tools=TOOLS,
+            tool_choice="auto"
+        )
 
-    msg = response.choices[0].message
+        msg = response.choices[0].message
 
-    # Se a LLM pedir uma tool
-    if msg.tool_calls:
-        for call in msg.tool_calls:
-            args = json.loads(call.function.arguments)
-            result = write_file(**args)
+        # Se a LLM pedir tools: chamadas independentes rodam em paralelo e os
+        # resultados voltam na ordem em que foram pedidas
+        if msg.tool_calls:
+            results = tool_registry.execute_tools([
+                {"name": call.function.name, "arguments": call.function.arguments}
+                for call in msg.tool_calls
+            ])
 
             messages.append(msg)
-            messages.append({
-                "role": "tool",
-                "tool_call_id": call.id,
-                "content": result
-            })
-
-            print("🛠️", result)
-    else:
-        messages.append({"role": "assistant", "content": msg.content})
-        print("\n🤖", msg.content)
+            for call, result in zip(msg.tool_calls, results):
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": call.id,
+                    "content": result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+                })
+
+                print("🛠️", result)
+        else:
+            messages.append({"role": "assistant", "content": msg.content})
+            print("\n🤖", msg.content)
+
+
+# A busca usa workers em processos próprios, que importam este script de
+# novo: o loop só roda quando ele é executado diretamente
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,682 @@
+"""
+Backends de inferência plugáveis
+
+Cada modelo carregado usa um backend (llama.cpp, ONNX Runtime ou a referência
+em Python puro) escolhido pelas configurações de runtime do modelo. Toda a
+execução de um backend acontece em threads próprias, fixadas nas CPUs (ou no
+nó NUMA) configuradas, para que vários modelos no mesmo host não disputem os
+mesmos núcleos e caches.
+"""
+
+import os
+import json
+import time
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterator, Type
+
+from .runtime import MappedModel
+from .scheduler import DEFAULT_PRIORITY, BatchScheduler, GenerationRequest
+
+DEFAULT_SETTINGS = {
+    "backend": "reference",
+    "threads": None,
+    "batch_size": 512,
+    "n_ctx": 4096,
+    "cpu_affinity": None,
+    "numa_node": None,
+    "mlock": False,
+    "max_batch": 8,
+}
+
+
+def parse_cpu_list(value: Any) -> List[int]:
+    """Converte "0-3,8,10-11" (ou uma lista) em uma lista de CPUs"""
+    if isinstance(value, (list, tuple)):
+        return sorted(int(cpu) for cpu in value)
+
+    cpus = set()
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def numa_node_cpus(node: int) -> List[int]:
+    """CPUs pertencentes a um nó NUMA (somente Linux)"""
+    cpulist = Path(f"/sys/devices/system/node/node{node}/cpulist")
+    if not cpulist.exists():
+        raise ValueError(f"Nó NUMA não encontrado: {node}")
+    return parse_cpu_list(cpulist.read_text())
+
+
+def resolve_cpus(settings: Dict[str, Any]) -> Optional[List[int]]:
+    """CPUs onde o backend deve rodar (None = sem restrição)"""
+    cpus = None
+    if settings.get("numa_node") is not None:
+        cpus = numa_node_cpus(int(settings["numa_node"]))
+    if settings.get("cpu_affinity"):
+        affinity = parse_cpu_list(settings["cpu_affinity"])
+        cpus = [cpu for cpu in cpus if cpu in affinity] if cpus else affinity
+    return cpus
+
+
+class InferenceBackend:
+    """Interface base dos backends de inferência
+
+    Subclasses implementam ``_load``, ``_generate_stream`` e ``_unload``; esses
+    métodos sempre rodam nas threads fixadas do backend, então threads criadas
+    pela biblioteca de inferência herdam a afinidade de CPU.
+    """
+
+    name = "base"
+    # Requisições de um lote podem ser intercaladas token a token
+    interleave_batches = False
+
+    def __init__(self, model_id: str, model_path: str, settings: Optional[Dict[str, Any]] = None):
+        self.model_id = model_id
+        self.model_path = model_path
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.cpus = resolve_cpus(self.settings)
+        self.threads = self.settings.get("threads") or self._default_threads()
+        self.load_time = 0.0
+        self.adapters: Dict[str, Dict[str, Any]] = {}
+        self.scheduler = BatchScheduler(max_batch=int(self.settings.get("max_batch") or 1))
+        self.batches_run = 0
+        self.batched_requests = 0
+        self._batch_lock = threading.Lock()
+        self._batch_running = False
+        # Requisições em andamento de um lote intercalado, entre uma rodada e outra
+        self._active: List[tuple] = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"backend-{model_id}",
+            initializer=self._pin_thread
+        )
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Indica se as dependências do backend estão instaladas"""
+        return True
+
+    def _default_threads(self) -> int:
+        """Uma thread por CPU disponível para o backend"""
+        if self.cpus:
+            return len(self.cpus)
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    def _pin_thread(self):
+        """Fixa a thread de trabalho nas CPUs configuradas"""
+        if not self.cpus:
+            return
+        if not hasattr(os, "sched_setaffinity"):
+            print(f"Aviso: afinidade de CPU não suportada nesta plataforma ({self.model_id})")
+            return
+        os.sched_setaffinity(0, self.cpus)
+
+    def load(self):
+        """Carrega o modelo nas threads do backend"""
+        started = time.perf_counter()
+        self._executor.submit(self._load).result()
+        self.load_time = time.perf_counter() - started
+
+    def generate_stream(self, prompt: str, prefix_state: Optional[bytes] = None,
+                        adapter: Optional[str] = None, priority: str = DEFAULT_PRIORITY,
+                        client: Optional[str] = None, stop: Optional[List[str]] = None,
+                        **kwargs) -> Iterator[str]:
+        """Gera texto incrementalmente, pedaço a pedaço
+
+        ``prefix_state`` (produzido por ``prefill``) é restaurado antes da
+        geração, de modo que só o trecho do prompt após o prefixo precisa ser
+        avaliado. ``adapter`` seleciona um adaptador LoRA carregado com
+        ``load_adapter``. Requisições concorrentes são agrupadas em lotes pelo
+        ``BatchScheduler`` do backend, que ordena a fila por ``priority``
+        (interactive, default, batch) e de forma justa entre cada ``client``.
+        A geração é interrompida no próximo token se o consumidor parar de
+        iterar ou se o texto contiver uma das sequências de ``stop`` (que não
+        é incluída na saída).
+        """
+        if adapter is not None and adapter not in self.adapters:
+            raise KeyError(f"Adaptador não carregado em {self.model_id}: {adapter}")
+
+        request = GenerationRequest(prompt, kwargs, adapter=adapter, prefix_state=prefix_state,
+                                    priority=priority, client=client, stop=stop)
+        self.scheduler.submit(request)
+        with self._batch_lock:
+            if not self._batch_running:
+                self._batch_running = True
+                self._executor.submit(self._run_batches)
+        return request.stream()
+
+    def _run_batches(self):
+        """Executa uma rodada e se reagenda enquanto houver trabalho (roda na thread do backend)
+
+        Cada rodada é uma tarefa separada do executor, então tarefas enviadas
+        durante a geração (carregar adaptadores, salvar estado) rodam entre
+        uma rodada e outra em vez de esperar a fila esvaziar. Uma rodada é um
+        token de cada requisição do lote intercalado ou, nos backends
+        sequenciais, uma requisição inteira: assim a ordem da fila justa é
+        reavaliada a cada requisição.
+        """
+        if self.interleave_batches:
+            self._interleaved_round()
+        else:
+            batch = self.scheduler.next_batch(1)
+            if batch:
+                self.batches_run += 1
+                self.batched_requests += 1
+                self._generate_one(batch[0])
+
+        with self._batch_lock:
+            if not self._active and not self.scheduler.pending():
+                self._batch_running = False
+                return
+            try:
+                self._executor.submit(self._run_batches)
+            except RuntimeError:
+                # Executor encerrado por unload: ninguém mais vai atender a fila
+                self._batch_running = False
+                error = RuntimeError(f"Modelo {self.model_id} foi descarregado")
+                for request, _ in self._active:
+                    request.finish(error)
+                self._active = []
+                for request in self.scheduler.next_batch(self.scheduler.pending(), wait=False):
+                    request.finish(error)
+
+    def _start_request(self, request: GenerationRequest) -> Iterator[str]:
+        if request.prefix_state is not None:
+            self._load_state(request.prefix_state)
+        return iter(self._generate_stream(request.prompt, adapter=request.adapter, **request.kwargs))
+
+    def _interleaved_round(self):
+        """Avança um token de cada requisição do lote intercalado
+
+        Backends sem estado compartilhado entre requisições
+        (``interleave_batches``) avançam todas as requisições do lote token a
+        token, independentemente do adaptador de cada uma, e admitem novas
+        requisições da fila assim que uma vaga é liberada.
+        """
+        # Só um lote novo espera a janela de agrupamento; vagas liberadas em
+        # um lote em andamento são preenchidas sem esperar
+        batch = self.scheduler.next_batch(self.scheduler.max_batch - len(self._active),
+                                          wait=not self._active)
+        if batch:
+            if not self._active:
+                self.batches_run += 1
+            self.batched_requests += len(batch)
+        for request in batch:
+            try:
+                self._active.append((request, self._start_request(request)))
+            except Exception as e:
+                self._finish_request(request, e)
+        if not self._active:
+            return
+
+        self._batch_step(len(self._active))
+        still_active = []
+        for request, chunks in self._active:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                self._finish_request(request)
+                continue
+            except Exception as e:
+                self._finish_request(request, e)
+                continue
+            if request.emit(chunk):
+                still_active.append((request, chunks))
+            else:
+                self._finish_request(request)
+        self._active = still_active
+
+    def _finish_request(self, request: GenerationRequest, error: Optional[Exception] = None):
+        request.finish(error)
+        self.scheduler.complete(request)
+
+    def _batch_step(self, batch_size: int):
+        """Chamado uma vez por token em cada rodada de um lote intercalado"""
+
+    def _generate_one(self, request: GenerationRequest):
+        try:
+            for chunk in self._start_request(request):
+                if not request.emit(chunk):
+                    break
+        except Exception as e:
+            self._finish_request(request, e)
+            return
+        self._finish_request(request)
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        """Gera o texto completo"""
+        return "".join(self.generate_stream(prompt, **kwargs))
+
+    def save_state(self) -> Optional[bytes]:
+        """Serializa o estado de runtime (ex: cache KV do último prompt)
+
+        Retorna None quando o backend não tem estado a preservar.
+        """
+        return self._executor.submit(self._save_state).result()
+
+    def load_state(self, data: bytes):
+        """Restaura um estado produzido por ``save_state``"""
+        self._executor.submit(self._load_state, data).result()
+
+    def prefill(self, text: str) -> Optional[bytes]:
+        """Avalia um prefixo estático e retorna o estado resultante
+
+        Retorna None quando o backend não suporta reaproveitar estado.
+        """
+        def run() -> Optional[bytes]:
+            if not self._prefill(text):
+                return None
+            return self._save_state()
+
+        return self._executor.submit(run).result()
+
+    def load_adapter(self, name: str, path: str, scale: float = 1.0):
+        """Carrega um adaptador LoRA sobre os pesos base já carregados"""
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Adaptador não encontrado: {path}")
+        self._executor.submit(self._load_adapter, name, path, scale).result()
+        self.adapters[name] = {"path": str(path), "scale": scale}
+
+    def unload_adapter(self, name: str):
+        """Descarrega um adaptador LoRA"""
+        if name not in self.adapters:
+            return
+        self._executor.submit(self._unload_adapter, name).result()
+        del self.adapters[name]
+
+    def unload(self):
+        """Libera o modelo e as threads do backend"""
+        try:
+            self._executor.submit(self._unload).result()
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuração efetiva e métricas do backend"""
+        return {
+            "backend": self.name,
+            "threads": self.threads,
+            "batch_size": self.settings.get("batch_size"),
+            "cpus": self.cpus,
+            "numa_node": self.settings.get("numa_node"),
+            "load_time": round(self.load_time, 4),
+            "adapters": sorted(self.adapters),
+            "max_batch": self.scheduler.max_batch,
+            "batches": self.batches_run,
+            "batched_requests": self.batched_requests,
+        }
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _generate_stream(self, prompt: str, adapter: Optional[str] = None,
+                         **kwargs) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _load_adapter(self, name: str, path: str, scale: float):
+        raise NotImplementedError(f"O backend {self.name} não suporta adaptadores LoRA")
+
+    def _unload_adapter(self, name: str):
+        pass
+
+    def _unload(self):
+        pass
+
+    def _save_state(self) -> Optional[bytes]:
+        return None
+
+    def _load_state(self, data: bytes):
+        pass
+
+    def _prefill(self, text: str) -> bool:
+        return False
+
+
+class ReferenceBackend(InferenceBackend):
+    """Backend de referência em Python puro
+
+    Mapeia os pesos via mmap (veja ``MappedModel``) e produz uma resposta
+    simulada token a token; serve para testes e para hosts sem bibliotecas de
+    inferência instaladas.
+    """
+
+    name = "reference"
+    interleave_batches = True
+    STEP_TIME = 0.05
+
+    def _load(self):
+        self.weights = MappedModel(
+            self.model_path,
+            mlock=self.settings.get("mlock", False)
+        )
+        # Equivalente ao cache KV: tokens do último prompt avaliado
+        self.context: List[str] = []
+        self.reused_tokens = 0
+        self.lora: Dict[str, MappedModel] = {}
+
+    def _prefill(self, text: str) -> bool:
+        self.context = text.split()
+        return True
+
+    def _load_adapter(self, name: str, path: str, scale: float):
+        self.lora[name] = MappedModel(path)
+
+    def _unload_adapter(self, name: str):
+        self.lora.pop(name).close()
+
+    def _generate_stream(self, prompt: str, adapter: Optional[str] = None,
+                         max_tokens: int = 1000, **kwargs) -> Iterator[str]:
+        tokens = prompt.split()
+        reused = 0
+        while reused < min(len(tokens), len(self.context)) and tokens[reused] == self.context[reused]:
+            reused += 1
+        self.reused_tokens += reused
+        self.context = tokens
+        model = f"{self.model_id}+{adapter}" if adapter else self.model_id
+        text = f"Resposta gerada pelo modelo {model} para: {prompt[:50]}..."
+        words = text.split(" ")[:max_tokens]
+        for i, word in enumerate(words):
+            yield word if i == 0 else " " + word
+
+    def _batch_step(self, batch_size: int):
+        # Simula um passo de decodificação: o custo é de um forward pass,
+        # compartilhado por todas as requisições do lote
+        time.sleep(self.STEP_TIME)
+
+    def _unload(self):
+        # Também roda depois de um _load que falhou no meio
+        for adapter in getattr(self, "lora", {}).values():
+            adapter.close()
+        if getattr(self, "weights", None) is not None:
+            self.weights.close()
+
+    def _save_state(self) -> Optional[bytes]:
+        return json.dumps({"context": self.context}).encode("utf-8")
+
+    def _load_state(self, data: bytes):
+        self.context = json.loads(data.decode("utf-8"))["context"]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if getattr(self, "weights", None) is not None:
+            stats.update(self.weights.stats())
+            stats["load_time"] = round(self.load_time, 4)
+            stats["reused_prompt_tokens"] = self.reused_tokens
+        return stats
+
+
+LLAMA_STATE_MAGIC = b"OALS1"
+
+
+def _pack_llama_state(state) -> bytes:
+    """Serializa um ``LlamaState`` sem pickle
+
+    Snapshots ficam em disco e são lidos de volta pelo servidor; com pickle,
+    quem conseguisse escrever em ``snapshots/`` executaria código ao retomar
+    o modelo. O formato é um cabeçalho JSON (tamanhos e dtypes) seguido dos
+    tokens, dos logits e do estado bruto do contexto.
+    """
+    import numpy as np
+
+    arrays = {name: np.ascontiguousarray(getattr(state, name)) for name in ("input_ids", "scores")}
+    header = {
+        "n_tokens": int(state.n_tokens),
+        "llama_state_size": int(state.llama_state_size),
+        "seed": getattr(state, "seed", None),
+        "arrays": {name: [array.dtype.str, list(array.shape)] for name, array in arrays.items()}
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    parts = [LLAMA_STATE_MAGIC, struct.pack("<I", len(header_bytes)), header_bytes]
+    parts.extend(array.tobytes() for array in arrays.values())
+    parts.append(bytes(state.llama_state))
+    return b"".join(parts)
+
+
+def _unpack_llama_state(data: bytes):
+    """Reconstrói o ``LlamaState`` gravado por ``_pack_llama_state``"""
+    import numpy as np
+    from llama_cpp import LlamaState
+
+    if not data.startswith(LLAMA_STATE_MAGIC):
+        raise ValueError("Estado do llama.cpp em formato desconhecido")
+    offset = len(LLAMA_STATE_MAGIC)
+    (header_size,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + header_size].decode("utf-8"))
+    offset += header_size
+
+    arrays = {}
+    for name, (dtype, shape) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise ValueError("Estado do llama.cpp com dtype inválido")
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape).copy()
+        offset += count * dtype.itemsize
+
+    llama_state = data[offset:]
+    if len(llama_state) != header["llama_state_size"]:
+        raise ValueError("Estado do llama.cpp truncado")
+
+    kwargs = {"seed": header["seed"]} if header.get("seed") is not None else {}
+    return LlamaState(
+        input_ids=arrays["input_ids"],
+        scores=arrays["scores"],
+        n_tokens=header["n_tokens"],
+        llama_state=llama_state,
+        llama_state_size=header["llama_state_size"],
+        **kwargs
+    )
+
+
+class LlamaCppBackend(InferenceBackend):
+    """Backend usando llama-cpp-python (pesos GGUF via mmap do próprio llama.cpp)"""
+
+    name = "llama.cpp"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import llama_cpp  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _load(self):
+        from llama_cpp import Llama
+
+        self.llm = Llama(
+            model_path=self.model_path,
+            n_ctx=self.settings.get("n_ctx", 4096),
+            n_threads=self.threads,
+            n_threads_batch=self.threads,
+            n_batch=self.settings.get("batch_size", 512),
+            use_mmap=True,
+            use_mlock=self.settings.get("mlock", False),
+            verbose=False
+        )
+        self.lora: Dict[str, Any] = {}
+        self.active_adapter: Optional[str] = None
+
+    def _load_adapter(self, name: str, path: str, scale: float):
+        import llama_cpp
+
+        # API de baixo nível do llama.cpp: o adaptador compartilha os pesos do
+        # modelo base e é ativado por contexto
+        adapter = llama_cpp.llama_adapter_lora_init(self.llm.model, path.encode("utf-8"))
+        if not adapter:
+            raise RuntimeError(f"Falha ao carregar o adaptador LoRA: {path}")
+        self.lora[name] = (adapter, scale)
+
+    def _unload_adapter(self, name: str):
+        import llama_cpp
+
+        if self.active_adapter == name:
+            self._activate_adapter(None)
+        adapter, _ = self.lora.pop(name)
+        llama_cpp.llama_adapter_lora_free(adapter)
+
+    def _activate_adapter(self, name: Optional[str]):
+        import llama_cpp
+
+        if name == self.active_adapter:
+            return
+        llama_cpp.llama_clear_adapter_lora(self.llm.ctx)
+        if name is not None:
+            adapter, scale = self.lora[name]
+            llama_cpp.llama_set_adapter_lora(self.llm.ctx, adapter, scale)
+        # O cache KV calculado com outro adaptador não vale mais
+        self.llm.reset()
+        self.active_adapter = name
+
+    def _generate_stream(self, prompt: str, adapter: Optional[str] = None,
+                         max_tokens: int = 1000, temperature: float = 0.7,
+                         **kwargs) -> Iterator[str]:
+        self._activate_adapter(adapter)
+        for chunk in self.llm(prompt, max_tokens=max_tokens, temperature=temperature, stream=True):
+            yield chunk["choices"][0]["text"]
+
+    def _unload(self):
+        # Também roda depois de um _load que falhou no meio
+        for name in list(getattr(self, "lora", {})):
+            self._unload_adapter(name)
+        self.llm = None
+
+    def _save_state(self) -> Optional[bytes]:
+        return _pack_llama_state(self.llm.save_state())
+
+    def _load_state(self, data: bytes):
+        # Estados salvos (prefixos, snapshots) são sempre do modelo base
+        self._activate_adapter(None)
+        self.llm.load_state(_unpack_llama_state(data))
+
+    def _prefill(self, text: str) -> bool:
+        # O llama.cpp reaproveita o maior prefixo comum entre o estado
+        # restaurado e o próximo prompt, avaliando só o restante
+        self._activate_adapter(None)
+        self.llm.reset()
+        self.llm.eval(self.llm.tokenize(text.encode("utf-8")))
+        return True
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Backend usando onnxruntime-genai (diretório de modelo ONNX)"""
+
+    name = "onnxruntime"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import onnxruntime_genai  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _load(self):
+        import onnxruntime_genai as og
+
+        model_dir = Path(self.model_path)
+        self.model = og.Model(str(model_dir if model_dir.is_dir() else model_dir.parent))
+        self.tokenizer = og.Tokenizer(self.model)
+        self.lora = og.Adapters(self.model)
+
+    def _load_adapter(self, name: str, path: str, scale: float):
+        # O onnxruntime-genai aplica o adaptador com o peso fixado na exportação
+        self.lora.load(path, name)
+
+    def _unload_adapter(self, name: str):
+        self.lora.unload(name)
+
+    def _generate_stream(self, prompt: str, adapter: Optional[str] = None,
+                         max_tokens: int = 1000, temperature: float = 0.7,
+                         **kwargs) -> Iterator[str]:
+        import onnxruntime_genai as og
+
+        input_tokens = self.tokenizer.encode(prompt)
+        params = og.GeneratorParams(self.model)
+        params.set_search_options(
+            max_length=len(input_tokens) + max_tokens,
+            temperature=temperature,
+            do_sample=temperature > 0
+        )
+        generator = og.Generator(self.model, params)
+        if adapter is not None:
+            generator.set_active_adapter(self.lora, adapter)
+        generator.append_tokens(input_tokens)
+        stream = self.tokenizer.create_stream()
+
+        while not generator.is_done():
+            generator.generate_next_token()
+            yield stream.decode(generator.get_next_tokens()[0])
+
+    def _unload(self):
+        self.lora = None
+        self.model = None
+        self.tokenizer = None
+
+
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    ReferenceBackend.name: ReferenceBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+}
+
+
+def register_backend(name: str, backend_class: Type[InferenceBackend]):
+    """Registra um backend de inferência adicional"""
+    BACKENDS[name] = backend_class
+
+
+def _load_plugin_backends():
+    """Registra backends publicados no entry point ``openagent.backends``"""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+
+    try:
+        points = entry_points()
+        if hasattr(points, "select"):
+            group = points.select(group="openagent.backends")
+        else:
+            group = points.get("openagent.backends", [])
+        for point in group:
+            register_backend(point.name, point.load())
+    except Exception as e:
+        print(f"Aviso: falha ao carregar plugins de backend: {e}")
+
+
+def available_backends() -> Dict[str, bool]:
+    """Backends registrados e se suas dependências estão instaladas"""
+    return {name: backend.is_available() for name, backend in BACKENDS.items()}
+
+
+def create_backend(model_id: str, model_path: str, settings: Optional[Dict[str, Any]] = None) -> InferenceBackend:
+    """Instancia o backend configurado para um modelo"""
+    settings = settings or {}
+    name = settings.get("backend") or DEFAULT_SETTINGS["backend"]
+    backend_class = BACKENDS.get(name)
+
+    if backend_class is None:
+        raise ValueError(f"Backend desconhecido: {name} (disponíveis: {', '.join(BACKENDS)})")
+    if not backend_class.is_available():
+        raise ValueError(f"Backend {name} não está instalado")
+
+    return backend_class(model_id, model_path, settings)
+
+
+_load_plugin_backends()
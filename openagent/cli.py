@@ -17,6 +17,16 @@ if sys.platform == "win32":
 
 from .core import OpenAgent
 
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+def parse_size(value: str) -> int:
+    """Converte tamanhos como '50GB' ou '512MB' em bytes"""
+    text = value.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)].strip()) * SIZE_UNITS[unit])
+    return int(text)
+
 def create_parser():
     """Cria o parser de argumentos da CLI"""
     parser = argparse.ArgumentParser(
@@ -29,8 +39,14 @@ Exemplos de uso:
   openagent --port 8080              # Servidor na porta 8080
   openagent --search mistral         # Buscar modelos
   openagent --download mistral       # Baixar modelo
+  openagent --delete mistral         # Remover modelo local
   openagent --models                 # Listar modelos locais
+  openagent --load MODEL --backend llama.cpp --numa-node 1
+  openagent --quota 50GB --gc        # Limitar disco e remover modelos antigos
+  openagent --gc --dry-run           # Mostrar o que seria removido
   openagent --status                 # Mostrar status
+  openagent --server-only --socket ~/.openagent/openagent.sock
+  openagent --router --port 8000 --upstream http://127.0.0.1:1234 --upstream http://127.0.0.1:1235
         """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
@@ -48,6 +64,11 @@ Exemplos de uso:
         default=True,
         help="Iniciar modo interativo (padrão)"
     )
+    mode_group.add_argument(
+        "--router",
+        action="store_true",
+        help="Rotear requisições entre vários servidores OpenAgent (veja --upstream)"
+    )
     
     # Grupo de operações de modelos
     model_group = parser.add_argument_group("Operações de Modelos")
@@ -66,12 +87,79 @@ Exemplos de uso:
         metavar="MODEL_ID", 
         help="Carregar modelo na memória"
     )
+    model_group.add_argument(
+        "--delete",
+        metavar="MODEL_ID",
+        help="Remover modelo local (o blob é apagado quando não houver mais referências)"
+    )
     model_group.add_argument(
         "--models", "-m",
         action="store_true",
         help="Listar modelos locais"
     )
     
+    # Grupo de runtime (aplicado ao modelo de --load)
+    runtime_group = parser.add_argument_group("Runtime de Inferência (usado com --load)")
+    runtime_group.add_argument(
+        "--backend",
+        metavar="NAME",
+        help="Backend de inferência: reference, llama.cpp, onnxruntime ou plugin"
+    )
+    runtime_group.add_argument(
+        "--threads",
+        type=int,
+        help="Número de threads de inferência (padrão: uma por CPU permitida)"
+    )
+    runtime_group.add_argument(
+        "--batch-size",
+        type=int,
+        help="Tamanho do lote de prefill"
+    )
+    runtime_group.add_argument(
+        "--cpu-affinity",
+        metavar="CPUS",
+        help="CPUs permitidas para o modelo (ex: 0-7,16-23)"
+    )
+    runtime_group.add_argument(
+        "--numa-node",
+        type=int,
+        metavar="NODE",
+        help="Fixar o modelo nas CPUs de um nó NUMA"
+    )
+    runtime_group.add_argument(
+        "--mlock",
+        action="store_true",
+        help="Fixar os pesos do modelo na RAM"
+    )
+    
+    # Grupo de armazenamento
+    storage_group = parser.add_argument_group("Armazenamento de Modelos")
+    storage_group.add_argument(
+        "--gc",
+        action="store_true",
+        help="Remover modelos menos usados até ficar abaixo da cota de disco"
+    )
+    storage_group.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Com --gc, apenas mostrar o que seria removido"
+    )
+    storage_group.add_argument(
+        "--quota",
+        metavar="SIZE",
+        help="Definir cota de disco para os modelos (ex: 50GB, 'none' remove a cota)"
+    )
+    storage_group.add_argument(
+        "--pin",
+        metavar="MODEL_ID",
+        help="Fixar modelo (nunca removido pela coleta de lixo)"
+    )
+    storage_group.add_argument(
+        "--unpin",
+        metavar="MODEL_ID",
+        help="Desfixar modelo"
+    )
+    
     # Grupo de configuração
     config_group = parser.add_argument_group("Configuração")
     config_group.add_argument(
@@ -85,11 +173,33 @@ Exemplos de uso:
         default=1234,
         help="Porta do servidor (padrão: 1234)"
     )
+    config_group.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Também ouvir em um Unix domain socket (clientes no mesmo host)"
+    )
+    config_group.add_argument(
+        "--no-tcp",
+        action="store_true",
+        help="Com --socket, não abrir a porta TCP"
+    )
     config_group.add_argument(
         "--config",
         metavar="PATH",
         help="Caminho do diretório de configuração"
     )
+    config_group.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Suspender modelos sem uso após SECONDS segundos (0 desativa)"
+    )
+    config_group.add_argument(
+        "--upstream",
+        action="append",
+        metavar="URL",
+        help="Servidor OpenAgent atrás do roteador (repetível; padrão: router.upstreams da configuração)"
+    )
     config_group.add_argument(
         "--source",
         choices=["all", "huggingface", "ollama"],
@@ -134,20 +244,73 @@ def handle_model_operations(agent, args):
         return success
     
     if args.load:
+        runtime_settings = {
+            "backend": args.backend,
+            "threads": args.threads,
+            "batch_size": args.batch_size,
+            "cpu_affinity": args.cpu_affinity,
+            "numa_node": args.numa_node,
+            "mlock": True if args.mlock else None,
+        }
+        runtime_settings = {k: v for k, v in runtime_settings.items() if v is not None}
+        if runtime_settings and not agent.model_manager.configure_model(args.load, **runtime_settings):
+            return False
+        
         print(f"[LOAD] Carregando modelo: {args.load}")
         success = agent.load_model_interactive(args.load)
         return success
     
+    if args.delete:
+        print(f"[DELETE] Removendo modelo: {args.delete}")
+        success = agent.delete_model_interactive(args.delete)
+        return success
+    
     if args.models:
         agent.list_local_models()
         return True
     
+    if args.quota or args.pin or args.unpin or args.gc:
+        if args.quota:
+            quota = None if args.quota.lower() == "none" else parse_size(args.quota)
+            agent.model_manager.set_quota(quota)
+            print(f"[QUOTA] Cota de disco: {args.quota}")
+        if args.pin and not agent.model_manager.pin_model(args.pin):
+            return False
+        if args.unpin and not agent.model_manager.pin_model(args.unpin, pinned=False):
+            return False
+        if args.gc:
+            return agent.garbage_collect_interactive(dry_run=args.dry_run)
+        return True
+    
     if args.status:
         agent._show_status()
         return True
     
     return None
 
+def run_router(agent, args):
+    """Inicia o roteador na frente dos servidores configurados"""
+    from .router import ModelRouter
+    
+    upstreams = args.upstream or agent.config.get("router", {}).get("upstreams", [])
+    if not upstreams:
+        print("[ERROR] Nenhum servidor informado (use --upstream URL)")
+        return 1
+    
+    router = ModelRouter(upstreams, host=args.host, port=args.port)
+    print(f"[START] Iniciando roteador para {len(upstreams)} servidores...")
+    router.start()
+    print("Pressione Ctrl+C para parar...")
+    
+    try:
+        import time
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[STOP] Encerrando roteador...")
+        router.stop()
+        return 0
+
 def main():
     """Função principal da CLI"""
     parser = create_parser()
@@ -168,11 +331,23 @@ def main():
             agent.llm_server.host = args.host
             agent.llm_server.port = args.port
         
+        if args.socket:
+            agent.llm_server.socket_path = args.socket
+        if args.no_tcp:
+            agent.llm_server.tcp = False
+        
+        if args.idle_timeout is not None:
+            agent.model_manager.set_idle_timeout(args.idle_timeout or None)
+        
         # Handle operações de modelos
         model_result = handle_model_operations(agent, args)
         if model_result is not None:
             return 0 if model_result else 1
         
+        # Modo roteador
+        if args.router:
+            return run_router(agent, args)
+        
         # Modo servidor apenas
         if args.server_only:
             print("[START] Iniciando OpenAgent em modo servidor...")
@@ -180,7 +355,8 @@ def main():
                 print("[ERROR] Falha ao iniciar servidor")
                 return 1
             
-            print(f"[SERVER] Servidor rodando em http://{args.host}:{args.port}")
+            if agent.llm_server.tcp:
+                print(f"[SERVER] Servidor rodando em http://{args.host}:{args.port}")
             print("Pressione Ctrl+C para parar...")
             
             try:
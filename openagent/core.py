@@ -15,9 +15,16 @@ from typing import Dict, List, Any, Optional
 
 # Importar módulos locais
 from .model_manager import ModelManager
-from .llm_server import LLMServer
+from .llm_server import LLMServer, render_prompt
 from .tools import ToolRegistry
 
+SYSTEM_PROMPT = (
+    "Você é o OpenAgent, um assistente de IA local com acesso a ferramentas. "
+    "Você pode ajudar com tarefas como criar/editar arquivos, executar comandos, "
+    "buscar informações e processar imagens. Use as ferramentas disponíveis "
+    "sempre que apropriado."
+)
+
 class OpenAgent:
     """Classe principal do OpenAgent"""
     
@@ -25,15 +32,30 @@ class OpenAgent:
         self.config_path = Path(config_path)
         self.config_path.mkdir(exist_ok=True)
         
-        self.model_manager = ModelManager(str(self.config_path / "models"))
-        self.llm_server = LLMServer()
-        self.tool_registry = ToolRegistry()
-        
         self.config_file = self.config_path / "openagent.json"
         self.config = self._load_config()
         
+        server_config = self.config.get("server", {})
+        self.model_manager = ModelManager(str(self.config_path / "models"))
+        self.llm_server = LLMServer(
+            model_manager=self.model_manager,
+            socket_path=server_config.get("socket_path"),
+            tcp=server_config.get("tcp", True)
+        )
+        self.tool_registry = ToolRegistry(index_dir=str(self.config_path / "index"))
+        
         self.running = False
         self.server_thread = None
+        
+        # O prompt de sistema do shell + tools é idêntico em toda sessão:
+        # registrado como prefixo, seu estado é pré-calculado por modelo
+        self.model_manager.register_prefix(
+            render_prompt(
+                [{"role": "system", "content": SYSTEM_PROMPT}],
+                self.tool_registry.get_tool_definitions()
+            ) + "\n",
+            name="openagent-shell"
+        )
     
     def _load_config(self) -> Dict:
         """Carrega configuração do arquivo"""
@@ -51,6 +73,7 @@ class OpenAgent:
             },
             "models": {
                 "auto_load_last": True,
+                "warmup": True,
                 "preferred_source": "all"
             }
         }
@@ -61,8 +84,26 @@ class OpenAgent:
             json.dump(self.config, f, indent=2)
     
     def start_server(self) -> bool:
-        """Inicia o servidor LLM"""
+        """Inicia o servidor LLM
+
+        Com ``models.auto_load_last``, o último modelo usado é carregado em
+        segundo plano enquanto o servidor já aceita conexões.
+        """
         try:
+            models_config = self.config.get("models", {})
+            last_loaded = models_config.get("last_loaded")
+            
+            server_config = self.config.get("server", {})
+            self.llm_server.configure_clients(
+                server_config.get("clients"),
+                server_config.get("default_tokens_per_minute"),
+                server_config.get("trusted_routers")
+            )
+            
+            if models_config.get("auto_load_last") and last_loaded in self.model_manager.config.get("models", {}):
+                print(f"🔄 Carregando {last_loaded} em segundo plano...")
+                self.llm_server.warm_start(last_loaded, warmup=models_config.get("warmup", True))
+            
             self.llm_server.start()
             self.running = True
             return True
@@ -145,6 +186,46 @@ class OpenAgent:
         
         return success
     
+    def delete_model_interactive(self, model_id: str) -> bool:
+        """Remove um modelo local de forma interativa"""
+        print(f"🗑️ Removendo modelo: {model_id}")
+        
+        success = self.model_manager.delete_model(model_id)
+        
+        if success:
+            print(f"✅ Modelo {model_id} removido!")
+            if self.config["models"].get("last_loaded") == model_id:
+                self.config["models"]["last_loaded"] = None
+                self._save_config()
+        else:
+            print(f"❌ Falha ao remover modelo {model_id}")
+        
+        return success
+    
+    def garbage_collect_interactive(self, dry_run: bool = False) -> bool:
+        """Executa a coleta de lixo do armazenamento de modelos"""
+        report = self.model_manager.garbage_collect(dry_run=dry_run)
+        quota = report["quota_bytes"]
+        
+        print(f"\n🧹 Coleta de lixo{' (simulação)' if dry_run else ''}:")
+        print(f"   💾 Uso atual: {report['usage_bytes'] / (1024 * 1024):.1f} MB")
+        print(f"   📏 Cota: {f'{quota / (1024 * 1024):.1f} MB' if quota else 'sem cota'}")
+        print(f"   ♻️ Recuperável (modelos não fixados e não carregados): {report['reclaimable_bytes'] / (1024 * 1024):.1f} MB")
+        
+        if not report["evicted"]:
+            print("   ✅ Nenhum modelo precisa ser removido.")
+        else:
+            action = "Seriam removidos" if dry_run else "Removidos"
+            print(f"   🗑️ {action} {len(report['evicted'])} modelo(s), {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB:")
+            for item in report["evicted"]:
+                last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(item["last_used"]))
+                print(f"      - {item['id']} (último uso: {last_used})")
+        
+        if report["over_quota"]:
+            print("   ⚠️ Ainda acima da cota: os modelos restantes estão fixados ou carregados.")
+        
+        return not report["over_quota"]
+    
     def list_local_models(self):
         """Lista modelos locais"""
         models = self.model_manager.list_local_models()
@@ -160,9 +241,15 @@ class OpenAgent:
             status = "🟢 ATIVO" if model["id"] == active_model else "⚪ INATIVO"
             size_mb = model.get("size", 0) / (1024 * 1024)
             
-            print(f"{i:2d}. {status} 📦 {model['id']}")
+            print(f"{i:2d}. {status} 📦 {model['id']}{' 📌' if model.get('pinned') else ''}")
             print(f"     📁 {model['path']}")
-            print(f"     📊 {size_mb:.1f} MB")
+            print(f"     📊 {size_mb:.1f} MB" + (f" | 🔑 sha256-{model['blob'][:12]}" if model.get("blob") else ""))
+            if model.get("parameters"):
+                print(
+                    f"     🧮 {model['parameters'] / 1e9:.2f}B parâmetros | {model.get('quantization')}"
+                    f" | contexto {model.get('context_length') or '?'}"
+                    f" | RAM estimada {model['memory_required'] / 1024 ** 3:.1f}GB"
+                )
             print()
     
     def interactive_shell(self):
@@ -179,17 +266,7 @@ class OpenAgent:
         print("  /quit - Sair")
         print("=" * 50)
         
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "Você é o OpenAgent, um assistente de IA local com acesso a ferramentas. "
-                    "Você pode ajudar com tarefas como criar/editar arquivos, executar comandos, "
-                    "buscar informações e processar imagens. Use as ferramentas disponíveis "
-                    "sempre que apropriado."
-                )
-            }
-        ]
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
         
         while True:
             try:
@@ -255,6 +332,7 @@ class OpenAgent:
         elif cmd in ['/quit', '/exit', '/q']:
             print("👋 Encerrando OpenAgent...")
             self.stop_server()
+            self.tool_registry.close()
             sys.exit(0)
         
         else:
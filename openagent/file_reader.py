@@ -0,0 +1,259 @@
+"""
+Leitura de trechos de arquivos grandes
+
+``read_file`` lê arquivos pequenos inteiros; para os grandes (ou quando um
+intervalo é pedido) o arquivo é mapeado em memória e só o trecho pedido é
+decodificado. Para achar a linha N sem reler o começo do arquivo, cada
+arquivo tem um ``LineIndex``: o número de quebras de linha antes de cada
+bloco de ``LINE_BLOCK`` bytes, construído sob demanda e mantido em cache
+enquanto o arquivo não muda (mtime e tamanho).
+
+O texto de arquivos lidos inteiros fica em um ``FileCache`` compartilhado,
+validado pelo mesmo par (mtime, tamanho) e limitado em bytes.
+"""
+
+import os
+import mmap
+import array
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Union
+
+# Bytes devolvidos por padrão (o resto é indicado como truncado)
+READ_LIMIT = 64 * 1024
+
+# Granularidade do índice de linhas: achar uma linha lê no máximo um bloco
+LINE_BLOCK = 16 * 1024
+
+# Arquivos com índice de linhas em cache
+LINE_INDEX_CACHE = 16
+
+# Bytes de texto mantidos no cache de leituras
+FILE_CACHE_BUDGET = 64 * 1024 * 1024
+
+_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class LineIndex:
+    """Quebras de linha antes de cada bloco de um arquivo
+
+    ``newlines[b]`` é o número de ``\\n`` em ``data[:b * LINE_BLOCK]``. O
+    índice só avança até onde as consultas precisaram.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.newlines = array.array("Q", [0])
+        # Última linha sem \n no final (conta como linha)
+        self.open_last_line = False
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return (len(self.newlines) - 1) * LINE_BLOCK >= self.size
+
+    def _extend(self, data: mmap.mmap, newline: int):
+        """Indexa blocos até cobrir a ``newline``-ésima quebra (ou o fim)"""
+        while self.newlines[-1] < newline and not self.complete:
+            start = (len(self.newlines) - 1) * LINE_BLOCK
+            self.newlines.append(self.newlines[-1] + data[start:start + LINE_BLOCK].count(b"\n"))
+        if self.complete and self.size:
+            self.open_last_line = data[self.size - 1:self.size] != b"\n"
+
+    def line_offset(self, data: mmap.mmap, line: int) -> Optional[int]:
+        """Offset do início da linha ``line`` (contada a partir de 0)
+
+        É o tamanho do arquivo para a linha logo após a última e None para
+        as seguintes.
+        """
+        if line == 0:
+            return 0
+        with self._lock:
+            self._extend(data, line)
+            if self.newlines[-1] < line:
+                return None
+            block = bisect.bisect_left(self.newlines, line) - 1
+            missing = line - self.newlines[block]
+
+        position = block * LINE_BLOCK
+        for _ in range(missing):
+            position = data.find(b"\n", position) + 1
+        return position
+
+    def total_lines(self) -> Optional[int]:
+        """Número de linhas, se o arquivo já foi indexado até o fim"""
+        if not self.complete:
+            return None
+        return self.newlines[-1] + (1 if self.open_last_line else 0)
+
+
+class FileCache:
+    """Cache LRU de conteúdo derivado de arquivos
+
+    A chave é o caminho absoluto e uma variante (a codificação, para texto;
+    os parâmetros de conversão, para imagens). Uma entrada só vale enquanto
+    o mtime e o tamanho do arquivo forem os mesmos de quando foi gerada. As
+    ferramentas que escrevem arquivos chamam ``invalidate`` para não
+    depender da resolução do mtime.
+    """
+
+    def __init__(self, budget: int = FILE_CACHE_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, variant: str, stat: os.stat_result) -> Optional[Any]:
+        key = (os.path.abspath(path), variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, path: str, variant: str, stat: os.stat_result, value: Any,
+            cost: Optional[int] = None):
+        """Guarda ``value``; ``cost`` (bytes) é ``len(value)`` por padrão"""
+        cost = len(value) if cost is None else cost
+        if cost > self.budget:
+            return
+        key = (os.path.abspath(path), variant)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, value, cost)
+            self.size += cost
+            while self.size > self.budget:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key)
+        self.size -= entry[3]
+
+    def invalidate(self, path: str):
+        """Descarta ``path`` (e, se for um diretório, tudo abaixo dele)"""
+        path = os.path.abspath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path or k[0].startswith(prefix)]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Ocupação e taxa de acerto do cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _line_index(path: str, stat: os.stat_result) -> LineIndex:
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            _indexes.move_to_end(key)
+            return cached[2]
+        index = LineIndex(stat.st_size)
+        _indexes[key] = (stat.st_mtime_ns, stat.st_size, index)
+        while len(_indexes) > LINE_INDEX_CACHE:
+            _indexes.popitem(last=False)
+        return index
+
+
+def read_range(path: str, encoding: str = "utf-8", start_line: Optional[int] = None,
+               end_line: Optional[int] = None, byte_offset: Optional[int] = None,
+               byte_count: Optional[int] = None, max_bytes: int = READ_LIMIT,
+               cache: Optional[FileCache] = None) -> Union[str, Dict[str, Any]]:
+    """Lê um arquivo inteiro (se pequeno) ou um trecho dele
+
+    Sem intervalo e com até ``max_bytes`` bytes, devolve o texto como antes.
+    Caso contrário devolve um dicionário com o trecho (``content``), o
+    tamanho do arquivo e o intervalo de linhas/bytes efetivamente lido.
+    Linhas são contadas a partir de 1 e ``end_line`` é inclusivo; o trecho
+    nunca passa de ``max_bytes`` (termina na última linha completa).
+    Leituras inteiras passam por ``cache``, se houver.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    by_lines = start_line is not None or end_line is not None
+    by_bytes = byte_offset is not None or byte_count is not None
+
+    if not by_lines and not by_bytes and size <= max_bytes:
+        text = cache.get(path, encoding, stat) if cache is not None else None
+        if text is None:
+            with open(path, "r", encoding=encoding) as f:
+                text = f.read()
+            if cache is not None:
+                cache.put(path, encoding, stat, text)
+        return text
+
+    result: Dict[str, Any] = {"path": os.path.abspath(path), "size": size}
+    if size == 0:
+        result.update(content="", truncated=False, total_lines=0)
+        return result
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        index = _line_index(path, stat)
+
+        if by_bytes:
+            start = min(max(byte_offset or 0, 0), size)
+            count = min(byte_count if byte_count is not None else max_bytes, max_bytes)
+            end = min(start + max(count, 0), size)
+            chunk = data[start:end]
+            result.update(byte_offset=start, byte_count=len(chunk), truncated=end < size)
+        else:
+            first = max(start_line or 1, 1)
+            start = index.line_offset(data, first - 1)
+            if start is None or start >= size:
+                result.update(content="", truncated=False, start_line=first,
+                              error=f"O arquivo tem menos de {first} linhas")
+                total = index.total_lines()
+                if total is not None:
+                    result["total_lines"] = total
+                return result
+
+            end = index.line_offset(data, end_line) if end_line is not None else None
+            end = size if end is None else end
+            truncated = end - start > max_bytes
+            if truncated:
+                # Corta na última linha completa que cabe no limite
+                cut = data.rfind(b"\n", start, start + max_bytes)
+                end = cut + 1 if cut >= 0 else start + max_bytes
+            chunk = data[start:end]
+            lines = chunk.count(b"\n") + (0 if chunk.endswith(b"\n") or not chunk else 1)
+            result.update(start_line=first, end_line=first + lines - 1,
+                          truncated=truncated or (end_line is None and end < size))
+
+        result["content"] = chunk.decode(encoding, errors="replace")
+        total = index.total_lines()
+        if total is not None:
+            result["total_lines"] = total
+        if result["truncated"]:
+            result["hint"] = "Use start_line/end_line ou byte_offset/byte_count para ler outros trechos"
+    return result
@@ -0,0 +1,280 @@
+"""
+Leitor de metadados GGUF
+
+Lê apenas o cabeçalho, os metadados e o índice de tensores de um arquivo GGUF
+via mmap, sem carregar os pesos em memória.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Any, NamedTuple
+
+GGUF_MAGIC = b"GGUF"
+DEFAULT_ALIGNMENT = 32
+
+# Tipos de valores dos metadados
+(
+    GGUF_UINT8, GGUF_INT8, GGUF_UINT16, GGUF_INT16, GGUF_UINT32, GGUF_INT32,
+    GGUF_FLOAT32, GGUF_BOOL, GGUF_STRING, GGUF_ARRAY, GGUF_UINT64, GGUF_INT64,
+    GGUF_FLOAT64,
+) = range(13)
+
+SCALAR_FORMATS = {
+    GGUF_UINT8: "<B", GGUF_INT8: "<b", GGUF_UINT16: "<H", GGUF_INT16: "<h",
+    GGUF_UINT32: "<I", GGUF_INT32: "<i", GGUF_FLOAT32: "<f", GGUF_BOOL: "<?",
+    GGUF_UINT64: "<Q", GGUF_INT64: "<q", GGUF_FLOAT64: "<d",
+}
+
+# Tipos de tensores ggml: id -> (nome, elementos por bloco, bytes por bloco)
+GGML_TYPES = {
+    0: ("F32", 1, 4), 1: ("F16", 1, 2), 2: ("Q4_0", 32, 18), 3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22), 7: ("Q5_1", 32, 24), 8: ("Q8_0", 32, 34), 9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84), 11: ("Q3_K", 256, 110), 12: ("Q4_K", 256, 144),
+    13: ("Q5_K", 256, 176), 14: ("Q6_K", 256, 210), 15: ("Q8_K", 256, 292),
+    16: ("IQ2_XXS", 256, 66), 17: ("IQ2_XS", 256, 74), 18: ("IQ3_XXS", 256, 98),
+    19: ("IQ1_S", 256, 50), 20: ("IQ4_NL", 32, 18), 21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82), 23: ("IQ4_XS", 256, 136), 24: ("I8", 1, 1),
+    25: ("I16", 1, 2), 26: ("I32", 1, 4), 27: ("I64", 1, 8), 28: ("F64", 1, 8),
+    29: ("IQ1_M", 256, 56), 30: ("BF16", 1, 2), 34: ("TQ1_0", 256, 54),
+    35: ("TQ2_0", 256, 66),
+}
+
+# Valores de general.file_type (llama_ftype)
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S",
+    15: "Q4_K_M", 16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS",
+    20: "IQ2_XS", 21: "Q2_K_S", 22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S",
+    25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M", 28: "IQ2_S", 29: "IQ2_M",
+    30: "IQ4_XS", 31: "IQ1_M", 32: "BF16",
+}
+
+# Arrays maiores que isto são resumidos (ex: vocabulário do tokenizer)
+MAX_ARRAY_ITEMS = 64
+
+
+class GGUFError(ValueError):
+    """Arquivo GGUF inválido ou não suportado"""
+
+
+class GGUFTensor(NamedTuple):
+    name: str
+    shape: List[int]
+    ggml_type: int
+    offset: int
+    n_elements: int
+    n_bytes: int
+
+    @property
+    def type_name(self) -> str:
+        return GGML_TYPES.get(self.ggml_type, (f"TYPE_{self.ggml_type}",))[0]
+
+
+class GGUFReader:
+    """Analisa o cabeçalho e o índice de tensores de um buffer GGUF"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+        self.metadata: Dict[str, Any] = {}
+        self.tensors: List[GGUFTensor] = []
+
+        if self.buffer[:4] != GGUF_MAGIC:
+            raise GGUFError("Assinatura GGUF não encontrada")
+        self.pos = 4
+
+        self.version = self._read("<I")
+        if self.version not in (1, 2, 3):
+            raise GGUFError(f"Versão GGUF não suportada: {self.version}")
+
+        # A versão 1 usa inteiros de 32 bits para contagens e comprimentos
+        self._count_format = "<I" if self.version == 1 else "<Q"
+
+        tensor_count = self._read(self._count_format)
+        kv_count = self._read(self._count_format)
+
+        for _ in range(kv_count):
+            key = self._read_string()
+            value_type = self._read("<I")
+            self.metadata[key] = self._read_value(value_type)
+
+        raw_tensors = []
+        for _ in range(tensor_count):
+            name = self._read_string()
+            n_dims = self._read("<I")
+            shape = [self._read(self._count_format) for _ in range(n_dims)]
+            ggml_type = self._read("<I")
+            offset = self._read("<Q")
+            raw_tensors.append((name, shape, ggml_type, offset))
+
+        self.alignment = int(self.metadata.get("general.alignment", DEFAULT_ALIGNMENT))
+        self.data_offset = self._align(self.pos)
+
+        for name, shape, ggml_type, offset in raw_tensors:
+            n_elements = 1
+            for dim in shape:
+                n_elements *= dim
+            _, block_size, type_size = GGML_TYPES.get(ggml_type, ("", 1, 0))
+            n_bytes = n_elements // block_size * type_size
+            self.tensors.append(GGUFTensor(
+                name, shape, ggml_type, self.data_offset + offset, n_elements, n_bytes
+            ))
+
+    def _align(self, position: int) -> int:
+        return position + (self.alignment - position % self.alignment) % self.alignment
+
+    def _read(self, fmt: str) -> Any:
+        try:
+            (value,) = struct.unpack_from(fmt, self.buffer, self.pos)
+        except struct.error:
+            raise GGUFError("Cabeçalho GGUF truncado")
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def _read_string(self) -> str:
+        length = self._read(self._count_format)
+        end = self.pos + length
+        if end > len(self.buffer):
+            raise GGUFError("Cabeçalho GGUF truncado")
+        value = bytes(self.buffer[self.pos:end]).decode("utf-8", errors="replace")
+        self.pos = end
+        return value
+
+    def _skip_string(self):
+        length = self._read(self._count_format)
+        self.pos += length
+
+    def _read_value(self, value_type: int) -> Any:
+        if value_type in SCALAR_FORMATS:
+            return self._read(SCALAR_FORMATS[value_type])
+        if value_type == GGUF_STRING:
+            return self._read_string()
+        if value_type == GGUF_ARRAY:
+            item_type = self._read("<I")
+            length = self._read(self._count_format)
+            if length <= MAX_ARRAY_ITEMS:
+                return [self._read_value(item_type) for _ in range(length)]
+
+            # Arrays grandes são pulados sem decodificar cada item
+            if item_type in SCALAR_FORMATS:
+                self.pos += length * struct.calcsize(SCALAR_FORMATS[item_type])
+            elif item_type == GGUF_STRING:
+                for _ in range(length):
+                    self._skip_string()
+            else:
+                for _ in range(length):
+                    self._read_value(item_type)
+            return {"type": "array", "length": length}
+        raise GGUFError(f"Tipo de metadado desconhecido: {value_type}")
+
+    @property
+    def architecture(self) -> str:
+        return self.metadata.get("general.architecture", "llama")
+
+    def arch_value(self, key: str, default: Any = None) -> Any:
+        """Lê um metadado específico da arquitetura (ex: context_length)"""
+        return self.metadata.get(f"{self.architecture}.{key}", default)
+
+    def quantization(self) -> str:
+        """Retorna o tipo de quantização do arquivo"""
+        file_type = self.metadata.get("general.file_type")
+        if file_type in FILE_TYPES:
+            return FILE_TYPES[file_type]
+
+        # Sem general.file_type, usa o tipo que ocupa mais bytes
+        bytes_by_type: Dict[str, int] = {}
+        for tensor in self.tensors:
+            bytes_by_type[tensor.type_name] = bytes_by_type.get(tensor.type_name, 0) + tensor.n_bytes
+        if not bytes_by_type:
+            return "unknown"
+        return max(bytes_by_type, key=bytes_by_type.get)
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumo serializável em JSON dos metadados relevantes"""
+        tensor_bytes = sum(tensor.n_bytes for tensor in self.tensors)
+        n_parameters = sum(tensor.n_elements for tensor in self.tensors)
+        head_count = self.arch_value("attention.head_count")
+        if isinstance(head_count, list):
+            head_count = max(head_count)
+        head_count_kv = self.arch_value("attention.head_count_kv", head_count)
+        if isinstance(head_count_kv, list):
+            head_count_kv = max(head_count_kv)
+
+        return {
+            "version": self.version,
+            "architecture": self.architecture,
+            "name": self.metadata.get("general.name"),
+            "parameters": n_parameters,
+            "quantization": self.quantization(),
+            "context_length": self.arch_value("context_length"),
+            "embedding_length": self.arch_value("embedding_length"),
+            "block_count": self.arch_value("block_count"),
+            "head_count": head_count,
+            "head_count_kv": head_count_kv,
+            "key_length": self.arch_value("attention.key_length"),
+            "value_length": self.arch_value("attention.value_length"),
+            "chat_template": self.metadata.get("tokenizer.chat_template"),
+            "tensor_count": len(self.tensors),
+            "tensor_bytes": tensor_bytes,
+            "bits_per_weight": round(tensor_bytes * 8 / n_parameters, 2) if n_parameters else None,
+            "data_offset": self.data_offset,
+        }
+
+
+def open_gguf(path: str) -> Optional[GGUFReader]:
+    """Abre um arquivo GGUF via mmap; retorna None se não for GGUF
+
+    O mmap permanece aberto enquanto o leitor for referenciado, para que o
+    índice de tensores possa ser usado sem reler o arquivo.
+    """
+    path = Path(path)
+    if not path.is_file() or path.stat().st_size < 4:
+        return None
+
+    with open(path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return GGUFReader(mapped)
+    except Exception:
+        mapped.close()
+        raise
+
+
+def read_gguf_info(path: str) -> Optional[Dict[str, Any]]:
+    """Lê o resumo dos metadados de um arquivo GGUF (None se não for GGUF)"""
+    reader = open_gguf(path)
+    if reader is None:
+        return None
+
+    try:
+        return reader.summary()
+    finally:
+        reader.buffer.close()
+
+
+def estimate_memory(info: Dict[str, Any], n_ctx: Optional[int] = None) -> int:
+    """Estima a RAM necessária para inferência: pesos + cache KV + buffers
+
+    O cache KV é calculado em F16 para ``n_ctx`` tokens (por padrão o contexto
+    de treino do modelo, limitado a 4096).
+    """
+    weights = info.get("tensor_bytes", 0)
+    n_ctx = n_ctx or min(info.get("context_length") or 4096, 4096)
+
+    n_layers = info.get("block_count") or 0
+    n_embd = info.get("embedding_length") or 0
+    n_head = info.get("head_count") or 1
+    n_head_kv = info.get("head_count_kv") or n_head
+    key_length = info.get("key_length") or (n_embd // n_head if n_head else 0)
+    value_length = info.get("value_length") or key_length
+
+    kv_cache = n_layers * n_ctx * n_head_kv * (key_length + value_length) * 2
+
+    # Buffers de ativação e overhead do runtime (estimativa conservadora)
+    compute = n_ctx * n_embd * 4 * 4 + 64 * 1024 * 1024
+
+    return int(weights + kv_cache + compute)
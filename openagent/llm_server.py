@@ -1,21 +1,75 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from werkzeug.serving import make_server
 import threading
 import json
 import time
-from typing import Dict, Any
+import os
+import stat
+import shutil
+import tempfile
+from typing import Dict, List, Any, Optional, Iterator, Callable
 from .model_manager import ModelManager
+from .backends import available_backends
+from .scheduler import (
+    DEFAULT_PRIORITY, PRIORITY_WEIGHTS, RateLimiter, SingleFlight, generation_key
+)
+
+WARMUP_PROMPT = "Olá"
+
+def render_prompt(messages: List[Dict[str, Any]], tools: Optional[List[Dict]] = None) -> str:
+    """Converte mensagens (e definições de tools) no prompt enviado ao modelo
+
+    As mensagens de sistema iniciais e as tools vêm primeiro e em formato
+    estável, para que o início do prompt possa ser reaproveitado entre
+    sessões como prefixo registrado.
+    """
+    conversation = []
+    tools_rendered = not tools
+    
+    for msg in messages:
+        role = msg.get('role', 'user')
+        if role != 'system' and not tools_rendered:
+            conversation.append(f"tools: {json.dumps(tools, ensure_ascii=False, sort_keys=True)}")
+            tools_rendered = True
+        content = msg.get('content', '')
+        conversation.append(f"{role}: {content}")
+    
+    if not tools_rendered:
+        conversation.append(f"tools: {json.dumps(tools, ensure_ascii=False, sort_keys=True)}")
+    
+    return "\n".join(conversation)
 
 class LLMServer:
-    def __init__(self, host: str = "127.0.0.1", port: int = 1234):
+    def __init__(self, host: str = "127.0.0.1", port: int = 1234,
+                 model_manager: Optional[ModelManager] = None,
+                 socket_path: Optional[str] = None, tcp: bool = True):
         self.host = host
         self.port = port
+        # Clientes no mesmo host podem usar um Unix domain socket, junto com
+        # a porta TCP ou no lugar dela (tcp=False)
+        self.socket_path = socket_path
+        self.tcp = tcp
         self.app = Flask(__name__)
         CORS(self.app)
-        self.model_manager = ModelManager()
+        self.model_manager = model_manager or ModelManager()
         self.server_thread = None
+        self.socket_server = None
         self.running = False
         
+        # Carregamento inicial em segundo plano (veja warm_start e is_ready)
+        self.warm_status: Dict[str, Any] = {"state": "idle"}
+        
+        # Requisições idênticas simultâneas compartilham uma geração
+        self.coalescer = SingleFlight()
+        
+        # Clientes por API key: {key: {"name", "priority", "tokens_per_minute"}}
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        # Endereços de roteadores cujo cabeçalho X-OpenAgent-Client é confiável
+        self.trusted_routers: List[str] = []
+        self.default_tokens_per_minute: Optional[float] = None
+        self.rate_limiter = RateLimiter()
+        
         self._setup_routes()
     
     def _setup_routes(self):
@@ -32,6 +86,14 @@ class LLMServer:
                     "created": int(model["downloaded_at"]),
                     "owned_by": "local"
                 })
+            for adapter in self.model_manager.list_adapters():
+                models.append({
+                    "id": adapter["id"],
+                    "object": "model",
+                    "created": int(adapter["registered_at"]),
+                    "owned_by": "local",
+                    "parent": adapter["base"]
+                })
             
             return jsonify({
                 "object": "list",
@@ -52,18 +114,26 @@ class LLMServer:
                 stream = data.get('stream', False)
                 
                 # Processa mensagens para formato simples
-                conversation = []
-                for msg in messages:
-                    role = msg.get('role', 'user')
-                    content = msg.get('content', '')
-                    conversation.append(f"{role}: {content}")
+                prompt = render_prompt(messages, data.get('tools'))
                 
-                prompt = "\n".join(conversation)
+                client, error = self._admit(data, prompt)
+                if error is not None:
+                    return error
                 
                 # Gera resposta
-                response_text = self.model_manager.generate_text(
-                    prompt, model, temperature=temperature, max_tokens=max_tokens
-                )
+                chunks = self._generate(prompt, model, client, temperature=temperature,
+                                        max_tokens=max_tokens, stop=client["stop"])
+                if stream:
+                    return self._event_stream(chunks, lambda chunk, finish: {
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": chunk} if chunk else {},
+                            "finish_reason": finish
+                        }]
+                    }, "chatcmpl")
+                response_text = "".join(chunks)
                 
                 # Formata resposta compatível OpenAI
                 response = {
@@ -99,7 +169,23 @@ class LLMServer:
                 prompt = data.get('prompt', '')
                 model = data.get('model', self.model_manager.get_active_model())
                 
-                response_text = self.model_manager.generate_text(prompt, model)
+                client, error = self._admit(data, prompt)
+                if error is not None:
+                    return error
+                
+                chunks = self._generate(prompt, model, client, stop=client["stop"])
+                if data.get('stream', False):
+                    return self._event_stream(chunks, lambda chunk, finish: {
+                        "object": "text_completion",
+                        "model": model,
+                        "choices": [{
+                            "text": chunk,
+                            "index": 0,
+                            "logprobs": None,
+                            "finish_reason": finish
+                        }]
+                    }, "cmpl")
+                response_text = "".join(chunks)
                 
                 response = {
                     "id": f"cmpl-{int(time.time())}",
@@ -143,13 +229,29 @@ class LLMServer:
             def progress_callback(message):
                 print(f"Download progress: {message}")
             
-            success = self.model_manager.download_model(model_id, progress_callback)
+            success = self.model_manager.download_model(
+                model_id, progress_callback, sha256=data.get('sha256')
+            )
             
             if success:
                 return jsonify({"message": "Modelo baixado com sucesso"})
             else:
                 return jsonify({"error": "Falha ao baixar modelo"}), 500
         
+        @self.app.route('/api/models/delete', methods=['POST'])
+        def delete_model():
+            """Remove um modelo local"""
+            data = request.get_json()
+            model_id = data.get('model_id')
+            
+            if not model_id:
+                return jsonify({"error": "model_id é obrigatório"}), 400
+            
+            if self.model_manager.delete_model(model_id):
+                return jsonify({"message": "Modelo removido"})
+            else:
+                return jsonify({"error": "Falha ao remover modelo"}), 404
+        
         @self.app.route('/api/models/load', methods=['POST'])
         def load_model():
             """Carrega um modelo"""
@@ -166,6 +268,44 @@ class LLMServer:
             else:
                 return jsonify({"error": "Falha ao carregar modelo"}), 500
         
+        @self.app.route('/api/models/swap', methods=['POST'])
+        def swap_model():
+            """Troca o modelo ativo sem indisponibilidade (hot-swap)"""
+            data = request.get_json() or {}
+            model_id = data.get('model_id')
+            
+            if not model_id:
+                return jsonify({"error": "model_id é obrigatório"}), 400
+            
+            status = self.model_manager.hot_swap(
+                model_id,
+                drain_timeout=data.get('drain_timeout', 60.0),
+                background=not data.get('wait', False)
+            )
+            
+            if status.get("error"):
+                return jsonify(status), 409 if status["state"] != "failed" else 500
+            return jsonify(status), 202 if status["state"] != "done" else 200
+        
+        @self.app.route('/api/models/swap', methods=['GET'])
+        def swap_status():
+            """Estado do último hot-swap"""
+            return jsonify(self.model_manager.swap_status)
+        
+        @self.app.route('/api/models/suspend', methods=['POST'])
+        def suspend_model():
+            """Suspende um modelo ocioso (retomado automaticamente no próximo uso)"""
+            data = request.get_json() or {}
+            model_id = data.get('model_id')
+            
+            if not model_id:
+                return jsonify({"error": "model_id é obrigatório"}), 400
+            
+            if self.model_manager.suspend_model(model_id):
+                return jsonify({"message": "Modelo suspenso"})
+            else:
+                return jsonify({"error": "Modelo não carregado ou em uso"}), 409
+        
         @self.app.route('/api/models/unload', methods=['POST'])
         def unload_model():
             """Descarrega um modelo"""
@@ -177,39 +317,361 @@ class LLMServer:
             
             return jsonify({"message": "Modelo descarregado"})
         
+        @self.app.route('/api/models/loaded', methods=['GET'])
+        def loaded_models():
+            """Lista modelos carregados com tempo de carga e memória residente"""
+            return jsonify({"models": self.model_manager.loaded_model_stats()})
+        
+        @self.app.route('/api/models/settings', methods=['POST'])
+        def configure_model():
+            """Atualiza backend, threads e afinidade de CPU de um modelo"""
+            data = request.get_json() or {}
+            model_id = data.pop('model_id', None)
+            
+            if not model_id:
+                return jsonify({"error": "model_id é obrigatório"}), 400
+            
+            if self.model_manager.configure_model(model_id, **data):
+                return jsonify({"settings": self.model_manager.model_settings(model_id)})
+            else:
+                return jsonify({"error": "Configuração inválida"}), 400
+        
+        @self.app.route('/api/backends', methods=['GET'])
+        def list_backends():
+            """Lista backends de inferência e se estão instalados"""
+            return jsonify({"backends": available_backends()})
+        
+        @self.app.route('/api/adapters', methods=['GET'])
+        def list_adapters():
+            """Lista adaptadores LoRA registrados"""
+            return jsonify({"adapters": self.model_manager.list_adapters()})
+        
+        @self.app.route('/api/adapters', methods=['POST'])
+        def register_adapter():
+            """Registra (e opcionalmente carrega) um adaptador LoRA"""
+            data = request.get_json() or {}
+            adapter_id = data.get('adapter_id')
+            base_model = data.get('base_model')
+            path = data.get('path')
+            
+            if not adapter_id or not base_model or not path:
+                return jsonify({"error": "adapter_id, base_model e path são obrigatórios"}), 400
+            
+            if not self.model_manager.register_adapter(adapter_id, base_model, path,
+                                                       float(data.get('scale', 1.0))):
+                return jsonify({"error": f"Falha ao registrar adaptador {adapter_id}"}), 400
+            
+            if data.get('load') and not self.model_manager.load_adapter(adapter_id):
+                return jsonify({"error": f"Falha ao carregar adaptador {adapter_id}"}), 500
+            return jsonify({"message": f"Adaptador {adapter_id} registrado"})
+        
+        @self.app.route('/api/adapters/delete', methods=['POST'])
+        def delete_adapter():
+            """Descarrega e remove um adaptador LoRA"""
+            data = request.get_json() or {}
+            adapter_id = data.get('adapter_id')
+            
+            if not adapter_id:
+                return jsonify({"error": "adapter_id é obrigatório"}), 400
+            
+            if self.model_manager.remove_adapter(adapter_id):
+                return jsonify({"message": f"Adaptador {adapter_id} removido"})
+            return jsonify({"error": f"Adaptador {adapter_id} não encontrado"}), 404
+        
+        @self.app.route('/api/prefixes', methods=['GET'])
+        def list_prefixes():
+            """Lista prefixos de prompt estáticos registrados"""
+            prefixes = self.model_manager.config.get("prefixes", {})
+            return jsonify({"prefixes": [
+                {"name": name, "length": len(text)} for name, text in prefixes.items()
+            ]})
+        
+        @self.app.route('/api/prefixes', methods=['POST'])
+        def register_prefix():
+            """Registra um prefixo estático (texto ou mensagens de sistema + tools)"""
+            data = request.get_json() or {}
+            text = data.get('text')
+            if text is None and data.get('messages'):
+                text = render_prompt(data['messages'], data.get('tools')) + "\n"
+            
+            if not text:
+                return jsonify({"error": "text ou messages é obrigatório"}), 400
+            
+            name = self.model_manager.register_prefix(text, data.get('name'))
+            return jsonify({"name": name, "length": len(text)})
+        
+        @self.app.route('/api/models/gc', methods=['POST'])
+        def garbage_collect():
+            """Remove modelos menos usados até ficar abaixo da cota de disco"""
+            data = request.get_json(silent=True) or {}
+            report = self.model_manager.garbage_collect(
+                dry_run=data.get('dry_run', False),
+                quota_bytes=data.get('quota_bytes')
+            )
+            return jsonify(report)
+        
         @self.app.route('/api/models/active', methods=['GET'])
         def get_active_model():
             """Retorna o modelo ativo"""
             active = self.model_manager.get_active_model()
             return jsonify({"active_model": active})
         
+        @self.app.route('/ready', methods=['GET'])
+        def readiness_check():
+            """Prontidão: 200 só com o modelo ativo carregado e aquecido"""
+            ready = self.is_ready()
+            if ready:
+                status = "ready"
+            elif self.warm_status["state"] in ("loading", "warming"):
+                status = "warming"
+            elif self.warm_status["state"] == "failed":
+                status = "failed"
+            else:
+                status = "no_model"
+            body = {
+                "status": status,
+                "active_model": self.model_manager.get_active_model(),
+                "warm_start": self.warm_status
+            }
+            return jsonify(body), 200 if ready else 503
+        
         @self.app.route('/health', methods=['GET'])
         def health_check():
             """Verificação de saúde do servidor"""
             return jsonify({
                 "status": "healthy",
                 "timestamp": int(time.time()),
-                "models_loaded": len(self.model_manager.loaded_models)
+                "models_loaded": len(self.model_manager.loaded_models),
+                "active_model": self.model_manager.get_active_model(),
+                "queue": self.model_manager.queue_depth(),
+                "generations": self.coalescer.stats()
             })
     
+    def configure_clients(self, clients: Optional[Dict[str, Dict[str, Any]]] = None,
+                          default_tokens_per_minute: Optional[float] = None,
+                          trusted_routers: Optional[List[str]] = None):
+        """Define os clientes conhecidos por API key e o limite padrão de tokens
+
+        Cada cliente pode ter ``name``, ``priority`` (interactive, default ou
+        batch) e ``tokens_per_minute``; a ``priority`` da chave é um teto, e o
+        corpo da requisição só pode pedir a mesma classe ou uma inferior.
+        Requisições sem API key conhecida são identificadas pelo endereço de
+        origem e usam o limite padrão. Quando a origem é um dos
+        ``trusted_routers`` (``local`` para o Unix domain socket), vale o
+        cliente informado pelo roteador no cabeçalho ``X-OpenAgent-Client``.
+        """
+        self.clients = clients or {}
+        self.default_tokens_per_minute = default_tokens_per_minute
+        self.trusted_routers = list(trusted_routers or [])
+    
+    def _client_context(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Identifica o cliente, a prioridade e o limite de uma requisição"""
+        auth = request.headers.get('Authorization', '')
+        api_key = auth[7:].strip() if auth.startswith('Bearer ') else None
+        settings = self.clients.get(api_key, {}) if api_key else {}
+        
+        origin = request.remote_addr or "local"
+        if settings:
+            client = settings.get("name") or f"key-{api_key[:8]}"
+        elif origin in self.trusted_routers and request.headers.get('X-OpenAgent-Client'):
+            client = request.headers['X-OpenAgent-Client']
+        else:
+            client = origin
+        
+        priority = data.get('priority') or settings.get("priority") or DEFAULT_PRIORITY
+        ceiling = settings.get("priority")
+        if (ceiling in PRIORITY_WEIGHTS and priority in PRIORITY_WEIGHTS
+                and PRIORITY_WEIGHTS[priority] > PRIORITY_WEIGHTS[ceiling]):
+            priority = ceiling
+        
+        return {
+            "client": client,
+            "priority": priority,
+            "tokens_per_minute": settings.get("tokens_per_minute", self.default_tokens_per_minute)
+        }
+    
+    def _admit(self, data: Dict[str, Any], prompt: str):
+        """Valida a requisição, a prioridade e o limite de tokens do cliente
+
+        Retorna ``(contexto do cliente, None)`` ou ``(None, resposta de erro)``.
+        O contexto inclui as sequências de ``stop`` normalizadas em lista.
+        """
+        stop = data.get('stop') or []
+        if isinstance(stop, str):
+            stop = [stop]
+        if not isinstance(stop, list) or not all(isinstance(s, str) for s in stop):
+            return None, (jsonify({"error": "stop deve ser uma string ou lista de strings"}), 400)
+        
+        client = self._client_context(data)
+        client["stop"] = [s for s in stop if s] or None
+        if client["priority"] not in PRIORITY_WEIGHTS:
+            return None, (jsonify({
+                "error": f"Prioridade inválida: {client['priority']} "
+                         f"(use {', '.join(PRIORITY_WEIGHTS)})"
+            }), 400)
+        
+        retry_after = self.rate_limiter.retry_after(client["client"], client["tokens_per_minute"])
+        if retry_after:
+            return None, (jsonify({
+                "error": f"Limite de tokens por minuto excedido para {client['client']}"
+            }), 429, {"Retry-After": str(int(retry_after) + 1)})
+        
+        client["prompt_tokens"] = len(prompt.split())
+        return client, None
+    
+    def _generate(self, prompt: str, model: Optional[str], client: Dict[str, Any],
+                  **kwargs) -> Iterator[str]:
+        """Stream de uma geração, agrupando requisições idênticas simultâneas
+
+        Só gerações determinísticas são agrupadas (ver ``generation_key``).
+        Os tokens de prompt e de resposta são cobrados do limite do cliente
+        quando o stream termina.
+        """
+        def source() -> Iterator[str]:
+            return self.model_manager.generate_stream(
+                prompt, model, priority=client["priority"], client=client["client"], **kwargs
+            )
+        
+        key = generation_key(model, prompt, kwargs)
+        chunks = source() if key is None else self.coalescer.stream(key, source)
+        
+        def metered():
+            generated = 0
+            try:
+                for chunk in chunks:
+                    generated += 1
+                    yield chunk
+            finally:
+                chunks.close()
+                self.rate_limiter.charge(client["client"], client["tokens_per_minute"],
+                                         client["prompt_tokens"] + generated)
+        
+        return metered()
+    
+    def _event_stream(self, chunks: Iterator[str],
+                      make_event: Callable[[str, Optional[str]], Dict[str, Any]],
+                      id_prefix: str) -> Response:
+        """Resposta server-sent events no formato de streaming da OpenAI"""
+        created = int(time.time())
+        
+        def events():
+            try:
+                for chunk in chunks:
+                    event = dict(make_event(chunk, None), id=f"{id_prefix}-{created}", created=created)
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                event = dict(make_event("", "stop"), id=f"{id_prefix}-{created}", created=created)
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+            yield "data: [DONE]\n\n"
+        
+        return Response(events(), mimetype='text/event-stream')
+    
+    def warm_start(self, model_id: str, warmup: bool = True,
+                   warmup_prompt: str = WARMUP_PROMPT):
+        """Carrega um modelo em segundo plano enquanto o servidor já aceita conexões
+
+        ``/ready`` responde 503 até o carregamento (e a geração de aquecimento
+        opcional, que popula os caches) terminar, e continua em 503 se ele
+        falhar.
+        """
+        self.warm_status = {"state": "loading", "model": model_id, "started_at": time.time()}
+        
+        def run_warm_start():
+            try:
+                if not self.model_manager.load_model(model_id):
+                    raise RuntimeError(f"Falha ao carregar {model_id}")
+                
+                if warmup:
+                    self.warm_status["state"] = "warming"
+                    self.model_manager.generate_text(warmup_prompt, model_id, max_tokens=8,
+                                                    priority="interactive")
+                
+                self.warm_status.update(state="done", finished_at=time.time())
+            except Exception as e:
+                # Sem modelo residente a instância não deve receber tráfego:
+                # /ready continua em 503 e mostra o erro
+                print(f"Erro no carregamento inicial: {e}")
+                self.warm_status.update(state="failed", error=str(e), finished_at=time.time())
+        
+        threading.Thread(target=run_warm_start, daemon=True).start()
+    
+    def is_ready(self) -> bool:
+        """Se a instância deve receber tráfego
+
+        Calculado a cada consulta para acompanhar cargas, hot-swaps e
+        descarregamentos feitos pela API depois do carregamento inicial.
+        """
+        if self.warm_status["state"] in ("loading", "warming"):
+            return False
+        return self.model_manager.is_active_model_ready()
+    
     def start(self):
-        """Inicia o servidor em uma thread separada"""
+        """Inicia o servidor (TCP e/ou Unix domain socket) em threads separadas"""
         if self.running:
             print("Servidor já está rodando")
             return
         
-        def run_server():
-            self.app.run(host=self.host, port=self.port, debug=False, use_reloader=False)
+        if not self.tcp and not self.socket_path:
+            raise ValueError("Informe socket_path para desativar a porta TCP")
+        
+        if self.socket_path:
+            self._start_socket_server()
+        
+        if self.tcp:
+            def run_server():
+                self.app.run(host=self.host, port=self.port, debug=False, use_reloader=False)
+            
+            self.server_thread = threading.Thread(target=run_server, daemon=True)
+            self.server_thread.start()
         
-        self.server_thread = threading.Thread(target=run_server, daemon=True)
-        self.server_thread.start()
         self.running = True
+        self.model_manager.start_idle_monitor()
+        
+        if self.tcp:
+            print(f"Servidor LLM iniciado em http://{self.host}:{self.port}")
+        if self.socket_path:
+            print(f"Servidor LLM ouvindo em unix://{self.socket_path}")
+    
+    def _start_socket_server(self):
+        """Escuta no Unix domain socket (um socket antigo é substituído)"""
+        socket_path = os.path.abspath(os.path.expanduser(self.socket_path))
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.lexists(socket_path) and not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise ValueError(f"{socket_path} já existe e não é um socket")
         
-        print(f"Servidor LLM iniciado em http://{self.host}:{self.port}")
+        # Só o usuário do servidor acessa o socket. O bind é feito dentro de
+        # um diretório novo com modo 0700, onde o chmod não deixa janela
+        # aberta, e o socket só então é movido para o caminho final; a umask
+        # do processo (compartilhada com as outras threads) não é alterada
+        staging = tempfile.mkdtemp(prefix=".openagent-sock-", dir=os.path.dirname(socket_path))
+        try:
+            staged_path = os.path.join(staging, "api.sock")
+            self.socket_server = make_server(f"unix://{staged_path}", 0, self.app, threaded=True)
+            os.chmod(staged_path, 0o600)
+            os.replace(staged_path, socket_path)
+        except BaseException:
+            if self.socket_server is not None:
+                self.socket_server.server_close()
+                self.socket_server = None
+            raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.socket_path = socket_path
+        threading.Thread(target=self.socket_server.serve_forever, daemon=True).start()
     
     def stop(self):
         """Para o servidor"""
         self.running = False
+        if self.socket_server:
+            self.socket_server.shutdown()
+            self.socket_server.server_close()
+            self.socket_server = None
+            if os.path.exists(self.socket_path) and stat.S_ISSOCK(os.lstat(self.socket_path).st_mode):
+                os.unlink(self.socket_path)
         if self.server_thread:
             self.server_thread.join(timeout=5)
         print("Servidor LLM parado")
@@ -4,9 +4,23 @@ import requests
 import subprocess
 import threading
 import re
+import hashlib
+import shutil
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Iterator
 import time
+from .model_store import BlobStore
+from .gguf import read_gguf_info, estimate_memory
+from .backends import DEFAULT_SETTINGS, create_backend, available_backends
+
+# Bits por peso aproximados de cada quantização (inclui escalas dos blocos)
+QUANT_BITS = {
+    "q2_k": 2.6, "q3_k": 3.4, "q4_0": 4.5, "q4_1": 5.0, "q4_k": 4.8, "q5_0": 5.5,
+    "q5_1": 6.0, "q5_k": 5.5, "q6_k": 6.6, "q8_0": 8.5, "f16": 16.0, "bf16": 16.0,
+}
+
+# Segundos entre gravações do last_used de um modelo já carregado
+LAST_USED_SAVE_INTERVAL = 60.0
 
 class ModelManager:
     def __init__(self, models_dir: str = "./models"):
@@ -15,17 +29,62 @@ class ModelManager:
         self.config_file = self.models_dir / "config.json"
         self.loaded_models = {}
         self.config = self._load_config()
+        self.blob_store = BlobStore(self.models_dir, self.config.setdefault("blobs", {}))
+        self._adopt_legacy_models()
+        
+        # Estado compartilhado entre threads de requisição e de hot-swap
+        self._lock = threading.RLock()
+        self._transition_lock = threading.Lock()
+        self._adapter_lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._idle_monitor: Optional[threading.Thread] = None
+        self._in_flight: Dict[str, int] = {}
+        self.aliases: Dict[str, str] = {}
+        self.swap_status: Dict[str, Any] = {"state": "idle"}
+        # Quando o last_used de cada modelo carregado foi gravado por último
+        self._use_saved_at: Dict[str, float] = {}
         
     def _load_config(self) -> Dict:
         if self.config_file.exists():
             with open(self.config_file, 'r') as f:
                 return json.load(f)
-        return {"models": {}, "active_model": None}
+        return {
+            "models": {},
+            "blobs": {},
+            "storage": {"quota_bytes": None, "auto_gc": True},
+            "adapters": {},
+            "active_model": None
+        }
     
     def _save_config(self):
         with open(self.config_file, 'w') as f:
             json.dump(self.config, f, indent=2)
     
+    def _adopt_legacy_models(self):
+        """Leva para o armazenamento de blobs modelos baixados antes dele
+
+        Sem isso eles ficariam fora de ``store_usage``, da cota e da coleta
+        de lixo. Roda uma única vez por modelo: depois da importação a
+        entrada já tem ``blob``.
+        """
+        adopted = False
+        for model_id, info in self.config.get("models", {}).items():
+            model_file = Path(info.get("path", ""))
+            if info.get("blob") or not model_file.is_file() or model_file.is_symlink():
+                continue
+            try:
+                digest = self.blob_store.adopt(model_file)
+            except OSError as e:
+                print(f"Erro ao importar {model_id} para o armazenamento: {e}")
+                continue
+            self.blob_store.add_ref(digest, model_id)
+            info["blob"] = digest
+            info.setdefault("last_used", info.get("downloaded_at", time.time()))
+            info["size"] = self.blob_store.blob_path(digest).stat().st_size
+            adopted = True
+        if adopted:
+            self._save_config()
+    
     def search_models(self, query: str = "", source: str = "all") -> List[Dict]:
         """Busca modelos disponíveis no HuggingFace e Ollama"""
         models = []
@@ -272,110 +331,896 @@ class ModelManager:
         ]
     
     def _estimate_model_size(self, model_id: str) -> str:
-        """Estima o tamanho do modelo baseado no nome"""
-        if "7b" in model_id.lower():
-            return "~4GB"
-        elif "13b" in model_id.lower():
-            return "~8GB"
-        elif "70b" in model_id.lower():
-            return "~40GB"
-        return "~2GB"
-    
-    def download_model(self, model_id: str, progress_callback=None) -> bool:
-        """Baixa um modelo do HuggingFace"""
+        """Estima o tamanho de um modelo remoto baseado no nome
+
+        Usa o número de parâmetros (ex: "7B", "1.5b", ou "8x7B" em modelos
+        MoE, que guardam todos os especialistas) e a quantização do nome,
+        assumindo Q4_K_M quando não há indicação. Modelos locais usam o
+        cabeçalho GGUF real (veja ``model_metadata``).
+        """
+        name = model_id.lower()
+        match = re.search(r"(?<![\d.])(?:(\d+)x)?(\d+(?:\.\d+)?)b(?![a-z])", name)
+        if not match:
+            return "~2GB"
+        experts = int(match.group(1)) if match.group(1) else 1
+        
+        bits = QUANT_BITS["q4_k"]
+        for quant, quant_bits in QUANT_BITS.items():
+            if quant in name:
+                bits = quant_bits
+                break
+        
+        size_gb = experts * float(match.group(2)) * bits / 8
+        return f"~{size_gb:.1f}GB" if size_gb < 10 else f"~{size_gb:.0f}GB"
+    
+    def download_model(self, model_id: str, progress_callback=None,
+                       sha256: Optional[str] = None) -> bool:
+        """Baixa um modelo do HuggingFace
+
+        Os pesos são guardados no armazenamento endereçado por conteúdo; se
+        ``sha256`` for informado e o blob já existir localmente, o download é
+        pulado e o modelo apenas passa a referenciar o blob existente.
+        """
         try:
             print(f"Baixando modelo: {model_id}")
             
             model_path = self.models_dir / model_id.replace("/", "_")
             model_path.mkdir(exist_ok=True)
+            model_file = model_path / "model.gguf"
             
-            if progress_callback:
-                progress_callback(f"Iniciando download de {model_id}")
-            
-            # Simulação de download (na implementação real, usaria huggingface_hub)
-            for i in range(10):
-                time.sleep(0.5)
+            if sha256 and self.blob_store.has(sha256.lower()):
+                digest = sha256.lower()
+                if progress_callback:
+                    progress_callback(f"Pesos já presentes localmente (sha256-{digest[:12]}), download ignorado")
+            else:
                 if progress_callback:
-                    progress_callback(f"Baixando... {i*10}%")
+                    progress_callback(f"Iniciando download de {model_id}")
+                
+                staging_file = self.blob_store.staging_path(model_id)
+                
+                # Simulação de download (na implementação real, usaria huggingface_hub)
+                for i in range(10):
+                    time.sleep(0.5)
+                    if progress_callback:
+                        progress_callback(f"Baixando... {i*10}%")
+                
+                # Criar arquivo de modelo simulado
+                with open(staging_file, 'w') as f:
+                    f.write(f"Modelo simulado: {model_id}")
+                
+                digest = self.blob_store.ingest(staging_file, expected_digest=sha256)
             
-            # Criar arquivo de modelo simulado
-            model_file = model_path / "model.gguf"
-            with open(model_file, 'w') as f:
-                f.write(f"Modelo simulado: {model_id}")
+            previous = self.config["models"].get(model_id, {}).get("blob")
+            if previous and previous != digest:
+                self.blob_store.release(previous, model_id)
             
+            self.blob_store.link(digest, model_file)
+            self.blob_store.add_ref(digest, model_id)
+            self._model_metadata_for_blob(digest, model_file)
+            
+            now = time.time()
             self.config["models"][model_id] = {
                 "path": str(model_file),
-                "downloaded_at": time.time(),
-                "size": model_file.stat().st_size
+                "blob": digest,
+                "downloaded_at": now,
+                "last_used": now,
+                "pinned": self.config["models"].get(model_id, {}).get("pinned", False),
+                "size": self.blob_store.blob_path(digest).stat().st_size
             }
             self._save_config()
             
             if progress_callback:
                 progress_callback("Download concluído!")
             
+            storage = self.config.get("storage", {})
+            if storage.get("auto_gc", True) and storage.get("quota_bytes"):
+                report = self.garbage_collect(keep=[model_id])
+                if report["evicted"] and progress_callback:
+                    progress_callback(
+                        f"Cota de disco excedida: {len(report['evicted'])} modelo(s) removido(s), "
+                        f"{report['reclaimed_bytes']} bytes liberados"
+                    )
+            
             return True
             
         except Exception as e:
             print(f"Erro ao baixar modelo: {e}")
             return False
     
+    def delete_model(self, model_id: str) -> bool:
+        """Remove um modelo local, apagando o blob quando não houver mais referências"""
+        info = self.config.get("models", {}).get(model_id)
+        if info is None:
+            print(f"Modelo {model_id} não encontrado localmente")
+            return False
+        
+        try:
+            self.unload_model(model_id)
+            
+            model_file = Path(info["path"])
+            self.blob_store.remove_link(model_file)
+            try:
+                model_file.parent.rmdir()
+            except OSError:
+                pass
+            
+            if info.get("blob") and self.blob_store.release(info["blob"], model_id):
+                for cache_dir in (self.models_dir / "prefix_cache").glob(f"{info['blob'][:16]}-*"):
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+            
+            del self.config["models"][model_id]
+            adapters = self.config.get("adapters", {})
+            for adapter_id in [a for a, entry in adapters.items() if entry["base"] == model_id]:
+                del adapters[adapter_id]
+            self._save_config()
+            return True
+        except Exception as e:
+            print(f"Erro ao remover modelo: {e}")
+            return False
+    
+    def store_usage(self) -> int:
+        """Retorna os bytes ocupados pelos pesos únicos no armazenamento"""
+        return sum(entry.get("size", 0) for entry in self.config.get("blobs", {}).values())
+    
+    def set_quota(self, quota_bytes: Optional[int], auto_gc: Optional[bool] = None):
+        """Define a cota de disco do diretório de modelos (None remove a cota)"""
+        storage = self.config.setdefault("storage", {"quota_bytes": None, "auto_gc": True})
+        storage["quota_bytes"] = quota_bytes
+        if auto_gc is not None:
+            storage["auto_gc"] = auto_gc
+        self._save_config()
+    
+    def pin_model(self, model_id: str, pinned: bool = True) -> bool:
+        """Fixa um modelo para que nunca seja removido pela coleta de lixo"""
+        info = self.config.get("models", {}).get(model_id)
+        if info is None:
+            print(f"Modelo {model_id} não encontrado localmente")
+            return False
+        
+        info["pinned"] = pinned
+        self._save_config()
+        return True
+    
+    def garbage_collect(self, dry_run: bool = False, quota_bytes: Optional[int] = None,
+                        keep: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Remove modelos menos usados recentemente até ficar abaixo da cota
+
+        Modelos fixados ou carregados em memória nunca são removidos. Como os
+        pesos são compartilhados, remover um modelo só libera espaço quando o
+        blob deixa de ser referenciado: modelos que dividem o blob com outro
+        que não pode sair são mantidos, e os que dividem entre si saem
+        juntos. Com ``dry_run`` nada é apagado e o
+        relatório indica apenas o que seria liberado. ``keep`` protege modelos
+        adicionais (por exemplo, o que acabou de ser baixado).
+        """
+        quota = quota_bytes if quota_bytes is not None else self.config.get("storage", {}).get("quota_bytes")
+        usage = self.store_usage()
+        blobs = self.config.get("blobs", {})
+        
+        models = self.config.get("models", {})
+        evictable = {
+            model_id for model_id, info in models.items()
+            if not info.get("pinned") and model_id not in self.loaded_models
+            and model_id not in (keep or [])
+        }
+        
+        def last_used(model_id: str) -> float:
+            info = models.get(model_id, {})
+            return info.get("last_used", info.get("downloaded_at", 0))
+        
+        # Um blob só é liberado quando todos os modelos que o referenciam saem:
+        # a unidade de remoção é o grupo de modelos de um blob, e só entram
+        # grupos inteiramente removíveis (os demais não liberariam nada).
+        # O grupo é tão recente quanto seu modelo usado mais recentemente.
+        groups = []
+        for entry in blobs.values():
+            refs = [model_id for model_id in entry.get("refs", []) if model_id in models]
+            if refs and all(model_id in evictable for model_id in refs):
+                refs.sort(key=last_used)
+                groups.append((max(last_used(model_id) for model_id in refs), refs, entry.get("size", 0)))
+        groups.sort(key=lambda group: group[0])
+        
+        def plan(limit: Optional[int]) -> Tuple[List[Dict], int]:
+            """Simula remoções em ordem LRU até atingir ``limit`` (None = todas)"""
+            evicted, projected = [], usage
+            for _, refs, size in groups:
+                if limit is not None and projected <= limit:
+                    break
+                for model_id in refs:
+                    evicted.append({
+                        "id": model_id,
+                        "last_used": last_used(model_id),
+                        # O espaço volta quando o último modelo do blob sai
+                        "freed_bytes": size if model_id == refs[-1] else 0
+                    })
+                projected -= size
+            return evicted, projected
+        
+        reclaimable = usage - plan(None)[1]
+        evicted, projected = plan(quota) if quota is not None else ([], usage)
+        
+        if not dry_run:
+            for item in evicted:
+                self.delete_model(item["id"])
+        
+        return {
+            "dry_run": dry_run,
+            "quota_bytes": quota,
+            "usage_bytes": usage,
+            "usage_after_bytes": projected,
+            "reclaimable_bytes": reclaimable,
+            "reclaimed_bytes": usage - projected,
+            "evicted": evicted,
+            "over_quota": quota is not None and projected > quota
+        }
+    
+    def _model_metadata_for_blob(self, digest: Optional[str], path: Path) -> Optional[Dict]:
+        """Lê (e guarda no índice do blob) o resumo do cabeçalho GGUF"""
+        entry = self.config.get("blobs", {}).get(digest) if digest else None
+        if entry is not None and "gguf" in entry:
+            return entry["gguf"]
+        
+        try:
+            metadata = read_gguf_info(str(path))
+        except Exception as e:
+            print(f"Erro ao ler cabeçalho GGUF de {path}: {e}")
+            metadata = None
+        
+        if entry is not None:
+            entry["gguf"] = metadata
+        return metadata
+    
+    def model_metadata(self, model_id: str) -> Optional[Dict]:
+        """Metadados GGUF de um modelo local (None se não for um arquivo GGUF)"""
+        info = self.config.get("models", {}).get(model_id)
+        if info is None:
+            return None
+        return self._model_metadata_for_blob(info.get("blob"), Path(info["path"]))
+    
+    def memory_required(self, model_id: str, n_ctx: Optional[int] = None) -> Optional[int]:
+        """Estima a RAM necessária para carregar o modelo"""
+        metadata = self.model_metadata(model_id)
+        if not metadata:
+            return None
+        return estimate_memory(metadata, n_ctx)
+    
     def list_local_models(self) -> List[Dict]:
         """Lista modelos locais disponíveis"""
         models = []
         for model_id, info in self.config.get("models", {}).items():
+            metadata = self.model_metadata(model_id) or {}
             models.append({
                 "id": model_id,
                 "path": info["path"],
                 "size": info.get("size", 0),
-                "downloaded_at": info.get("downloaded_at", 0)
+                "blob": info.get("blob"),
+                "downloaded_at": info.get("downloaded_at", 0),
+                "last_used": info.get("last_used", info.get("downloaded_at", 0)),
+                "pinned": info.get("pinned", False),
+                "architecture": metadata.get("architecture"),
+                "parameters": metadata.get("parameters"),
+                "quantization": metadata.get("quantization"),
+                "context_length": metadata.get("context_length"),
+                "chat_template": metadata.get("chat_template"),
+                "memory_required": estimate_memory(metadata) if metadata else None
             })
         return models
     
-    def load_model(self, model_id: str) -> bool:
-        """Carrega um modelo para uso"""
-        if model_id in self.loaded_models:
-            return True
+    def model_settings(self, model_id: str) -> Dict[str, Any]:
+        """Configurações de runtime (backend, threads, afinidade...) de um modelo"""
+        info = self.config.get("models", {}).get(model_id, {})
+        settings = dict(DEFAULT_SETTINGS)
+        if "mlock" in info:
+            settings["mlock"] = info["mlock"]
+        settings.update(info.get("runtime", {}))
+        return settings
+    
+    def configure_model(self, model_id: str, **settings) -> bool:
+        """Atualiza as configurações de runtime de um modelo
+
+        Aceita ``backend``, ``threads``, ``batch_size``, ``n_ctx``,
+        ``cpu_affinity`` (ex: "0-7,16-23"), ``numa_node``, ``mlock`` e
+        ``max_batch`` (requisições atendidas juntas por lote). Valores None
+        voltam ao padrão. Vale a partir do próximo carregamento.
+        """
+        info = self.config.get("models", {}).get(model_id)
+        if info is None:
+            print(f"Modelo {model_id} não encontrado localmente")
+            return False
         
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            print(f"Configurações desconhecidas: {', '.join(sorted(unknown))}")
+            return False
+        
+        if settings.get("backend") and settings["backend"] not in available_backends():
+            print(f"Backend desconhecido: {settings['backend']}")
+            return False
+        
+        runtime = info.setdefault("runtime", {})
+        for key, value in settings.items():
+            if value is None:
+                runtime.pop(key, None)
+            else:
+                runtime[key] = value
+        self._save_config()
+        return True
+    
+    def load_model(self, model_id: str, force: bool = False,
+                   mlock: Optional[bool] = None, activate: bool = True) -> bool:
+        """Carrega um modelo para uso
+
+        Antes de carregar, estima a memória necessária a partir do cabeçalho
+        GGUF e recusa o carregamento se não houver RAM disponível suficiente
+        (a menos que ``force`` seja usado).
+
+        O backend de inferência e seus recursos de CPU vêm de
+        ``model_settings``. ``mlock`` sobrescreve a opção do modelo e fixa as
+        páginas na RAM para modelos sensíveis a latência. Com
+        ``activate=False`` o modelo é carregado sem se tornar o modelo ativo.
+        """
         if model_id not in self.config.get("models", {}):
             print(f"Modelo {model_id} não encontrado localmente")
             return False
         
+        settings = self.model_settings(model_id)
+        if mlock is not None:
+            settings["mlock"] = mlock
+        
+        if model_id not in self.loaded_models and not force:
+            required = self.memory_required(model_id, settings.get("n_ctx"))
+            available = self._available_memory()
+            if required and available and required > available:
+                print(
+                    f"Memória insuficiente para {model_id}: necessários "
+                    f"{required / 1024 ** 3:.1f}GB, disponíveis {available / 1024 ** 3:.1f}GB"
+                )
+                return False
+        
+        now = time.time()
+        self.config["models"][model_id]["last_used"] = now
+        
+        if model_id in self.loaded_models:
+            # Caminho de toda geração: a ordem LRU em memória é sempre exata,
+            # mas o uso só vai para o disco de tempos em tempos
+            if now - self._use_saved_at.get(model_id, 0) >= LAST_USED_SAVE_INTERVAL:
+                self._use_saved_at[model_id] = now
+                self._save_config()
+            return self.resume_model(model_id)
+        
         try:
-            # Simulação de carregamento do modelo
-            print(f"Carregando modelo: {model_id}")
-            self.loaded_models[model_id] = {
-                "loaded_at": time.time(),
-                "status": "ready"
-            }
-            self.config["active_model"] = model_id
-            self._save_config()
+            print(f"Carregando modelo: {model_id} (backend {settings['backend']})")
+            backend = create_backend(model_id, self.config["models"][model_id]["path"], settings)
+            try:
+                backend.load()
+            except Exception:
+                # O erro relevante é o do carregamento, não o da limpeza
+                try:
+                    backend.unload()
+                except Exception as cleanup_error:
+                    print(f"Aviso: erro ao liberar {model_id} após falha no carregamento: {cleanup_error}")
+                raise
+            print(f"Modelo carregado em {backend.load_time:.2f}s ({backend.threads} threads)")
+            prefix_states = self._prepare_prefixes(model_id, backend)
+            
+            with self._lock:
+                self.loaded_models[model_id] = {
+                    "loaded_at": time.time(),
+                    "last_request": time.time(),
+                    "status": "ready",
+                    "backend": backend,
+                    "prefix_states": prefix_states,
+                    "load_time": backend.load_time
+                }
+                self.aliases.pop(model_id, None)
+                if activate:
+                    self.config["active_model"] = model_id
+                self._save_config()
             return True
         except Exception as e:
             print(f"Erro ao carregar modelo: {e}")
             return False
     
+    def _available_memory(self) -> Optional[int]:
+        """RAM disponível no sistema (None se não for possível medir)"""
+        try:
+            import psutil
+            return psutil.virtual_memory().available
+        except Exception:
+            return None
+    
+    def loaded_model_stats(self) -> List[Dict]:
+        """Tempo de carregamento e memória residente dos modelos carregados"""
+        try:
+            import psutil
+            process_rss = psutil.Process().memory_info().rss
+        except Exception:
+            process_rss = None
+        
+        stats = []
+        for model_id, state in self.loaded_models.items():
+            backend = state.get("backend")
+            entry = {
+                "id": model_id,
+                "status": state.get("status"),
+                "loaded_at": state.get("loaded_at"),
+                "load_time": state.get("load_time"),
+                "last_request": state.get("last_request"),
+                "snapshot": state.get("snapshot"),
+                "cached_prefixes": len(state.get("prefix_states", {})),
+                "process_rss": process_rss
+            }
+            if backend is not None:
+                entry.update(backend.stats())
+            stats.append(entry)
+        return stats
+    
+    def queue_depth(self) -> Dict[str, int]:
+        """Requisições em geração e aguardando na fila dos backends"""
+        with self._lock:
+            backends = [s["backend"] for s in self.loaded_models.values() if s.get("backend")]
+            in_flight = sum(self._in_flight.values())
+        queued = sum(backend.scheduler.pending() for backend in backends)
+        return {"in_flight": in_flight, "queued": queued}
+    
     def unload_model(self, model_id: str):
         """Descarrega um modelo da memória"""
-        if model_id in self.loaded_models:
-            del self.loaded_models[model_id]
+        with self._lock:
+            if model_id not in self.loaded_models:
+                return
+            state = self.loaded_models.pop(model_id)
+            backend = state.get("backend")
             if self.config.get("active_model") == model_id:
                 self.config["active_model"] = None
             self._save_config()
+        
+        if backend is not None:
+            backend.unload()
+        if state.get("snapshot"):
+            Path(state["snapshot"]).unlink(missing_ok=True)
+    
+    def _snapshot_path(self, model_id: str) -> Path:
+        """Arquivo com o estado de runtime de um modelo suspenso"""
+        return self.models_dir / "snapshots" / (model_id.replace("/", "_") + ".state")
+    
+    def suspend_model(self, model_id: str) -> bool:
+        """Suspende um modelo: salva o estado de runtime em disco e libera a RAM
+
+        O estado (ex: cache KV do prompt de sistema) vai para
+        ``snapshots/``; os pesos continuam no page cache e são remapeados no
+        próximo uso por ``resume_model``.
+        """
+        with self._transition_lock:
+            with self._lock:
+                state = self.loaded_models.get(model_id)
+                if state is None or state["status"] != "ready" or self._in_flight.get(model_id, 0):
+                    return False
+                backend = state["backend"]
+                state.update(status="suspended", backend=None, prefix_states={})
+            
+            try:
+                snapshot = backend.save_state()
+                snapshot_path = None
+                if snapshot is not None:
+                    snapshot_path = self._snapshot_path(model_id)
+                    snapshot_path.parent.mkdir(exist_ok=True)
+                    partial = snapshot_path.with_suffix(".partial")
+                    partial.write_bytes(snapshot)
+                    os.replace(partial, snapshot_path)
+                backend.unload()
+            except Exception as e:
+                print(f"Erro ao suspender modelo {model_id}: {e}")
+                with self._lock:
+                    state.update(status="ready", backend=backend)
+                return False
+            
+            with self._lock:
+                state.update(
+                    snapshot=str(snapshot_path) if snapshot_path else None,
+                    suspended_at=time.time()
+                )
+            print(f"Modelo {model_id} suspenso")
+            return True
+    
+    def resume_model(self, model_id: str) -> bool:
+        """Retoma um modelo suspenso a partir dos pesos mapeados e do snapshot"""
+        with self._transition_lock:
+            with self._lock:
+                state = self.loaded_models.get(model_id)
+                if state is None:
+                    return False
+                if state["status"] != "suspended":
+                    # Modelo pronto, ou drenando após um hot-swap: nada a retomar
+                    return state["status"] == "ready"
+            
+            try:
+                backend = create_backend(model_id, self.config["models"][model_id]["path"],
+                                         self.model_settings(model_id))
+                backend.load()
+                prefix_states = self._prepare_prefixes(model_id, backend)
+                if state.get("snapshot") and Path(state["snapshot"]).exists():
+                    backend.load_state(Path(state["snapshot"]).read_bytes())
+            except Exception as e:
+                print(f"Erro ao retomar modelo {model_id}: {e}")
+                return False
+            
+            with self._lock:
+                # unload_model não passa pelo _transition_lock e pode ter
+                # removido o modelo enquanto ele era retomado
+                resumed = self.loaded_models.get(model_id) is state
+                if resumed:
+                    state.update(
+                        status="ready",
+                        backend=backend,
+                        prefix_states=prefix_states,
+                        resumed_at=time.time(),
+                        load_time=backend.load_time
+                    )
+            if not resumed:
+                backend.unload()
+                return False
+            print(f"Modelo {model_id} retomado em {backend.load_time:.2f}s")
+            return True
+    
+    def register_adapter(self, adapter_id: str, base_model: str, path: str,
+                         scale: float = 1.0) -> bool:
+        """Registra um adaptador LoRA para um modelo base baixado
+
+        Requisições com ``model=adapter_id`` passam a ser atendidas pelo
+        modelo base com o adaptador ativo; vários adaptadores compartilham a
+        mesma cópia dos pesos base em memória.
+        """
+        if base_model not in self.config.get("models", {}):
+            print(f"Modelo base {base_model} não encontrado localmente")
+            return False
+        if adapter_id in self.config["models"]:
+            print(f"Já existe um modelo chamado {adapter_id}")
+            return False
+        if not Path(path).is_file():
+            print(f"Arquivo de adaptador não encontrado: {path}")
+            return False
+        
+        self.unload_adapter(adapter_id)
+        self.config.setdefault("adapters", {})[adapter_id] = {
+            "base": base_model,
+            "path": str(Path(path).resolve()),
+            "scale": scale,
+            "registered_at": time.time()
+        }
+        self._save_config()
+        return True
+    
+    def remove_adapter(self, adapter_id: str) -> bool:
+        """Descarrega e remove o registro de um adaptador LoRA"""
+        if adapter_id not in self.config.get("adapters", {}):
+            return False
+        self.unload_adapter(adapter_id)
+        del self.config["adapters"][adapter_id]
+        self._save_config()
+        return True
+    
+    def list_adapters(self) -> List[Dict]:
+        """Lista os adaptadores registrados e se estão carregados"""
+        adapters = []
+        for adapter_id, entry in self.config.get("adapters", {}).items():
+            state = self.loaded_models.get(entry["base"]) or {}
+            backend = state.get("backend")
+            adapters.append({
+                "id": adapter_id,
+                **entry,
+                "loaded": backend is not None and adapter_id in backend.adapters
+            })
+        return adapters
+    
+    def _resolve_adapter(self, target: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Converte o id de um adaptador em (modelo base, adaptador)"""
+        entry = self.config.get("adapters", {}).get(target)
+        if entry is None:
+            return target, None
+        return self.resolve_model(entry["base"]), target
+    
+    def load_adapter(self, adapter_id: str) -> bool:
+        """Carrega um adaptador LoRA sobre o modelo base (carregando-o se preciso)"""
+        entry = self.config.get("adapters", {}).get(adapter_id)
+        if entry is None:
+            print(f"Adaptador {adapter_id} não registrado")
+            return False
+        
+        # Requisições simultâneas para adaptadores do mesmo base não devem
+        # carregar o modelo base mais de uma vez
+        with self._adapter_lock:
+            base_model, _ = self._resolve_adapter(adapter_id)
+            if base_model not in self.loaded_models and not self.load_model(base_model, activate=False):
+                return False
+            if not self.resume_model(base_model):
+                return False
+            
+            with self._transition_lock:
+                with self._lock:
+                    state = self.loaded_models.get(base_model)
+                    backend = state["backend"] if state else None
+                if backend is None:
+                    return False
+                if adapter_id in backend.adapters:
+                    return True
+                
+                try:
+                    backend.load_adapter(adapter_id, entry["path"], entry.get("scale", 1.0))
+                except Exception as e:
+                    print(f"Erro ao carregar adaptador {adapter_id}: {e}")
+                    return False
+        
+        print(f"Adaptador {adapter_id} carregado sobre {base_model}")
+        return True
+    
+    def unload_adapter(self, adapter_id: str):
+        """Descarrega um adaptador LoRA, mantendo o modelo base carregado"""
+        entry = self.config.get("adapters", {}).get(adapter_id)
+        if entry is None:
+            return
+        
+        with self._transition_lock:
+            with self._lock:
+                state = self.loaded_models.get(self.resolve_model(entry["base"])) or {}
+                backend = state.get("backend")
+            if backend is not None:
+                backend.unload_adapter(adapter_id)
+    
+    def register_prefix(self, text: str, name: Optional[str] = None) -> str:
+        """Registra um prefixo de prompt estático (ex: prompt de sistema + tools)
+
+        O estado do modelo após avaliar o prefixo é calculado uma vez por
+        modelo, salvo em ``prefix_cache/`` e carregado junto com o modelo;
+        requisições cujo prompt começa com o prefixo pulam sua avaliação.
+        """
+        name = name or hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        prefixes = self.config.setdefault("prefixes", {})
+        if prefixes.get(name) != text:
+            prefixes[name] = text
+            self._save_config()
+        
+        with self._lock:
+            ready = [
+                (model_id, state) for model_id, state in self.loaded_models.items()
+                if state["status"] == "ready"
+            ]
+        for model_id, state in ready:
+            state["prefix_states"] = self._prepare_prefixes(model_id, state["backend"])
+        return name
+    
+    def unregister_prefix(self, name: str) -> bool:
+        """Remove um prefixo registrado"""
+        if self.config.get("prefixes", {}).pop(name, None) is None:
+            return False
+        self._save_config()
+        return True
+    
+    def _prefix_cache_dir(self, model_id: str, backend) -> Path:
+        """Diretório dos estados de prefixo de um modelo/backend"""
+        info = self.config["models"][model_id]
+        key = (info.get("blob") or hashlib.sha256(model_id.encode("utf-8")).hexdigest())[:16]
+        n_ctx = backend.settings.get("n_ctx")
+        return self.models_dir / "prefix_cache" / f"{key}-{backend.name}-{n_ctx}"
+    
+    def _prepare_prefixes(self, model_id: str, backend) -> Dict[str, bytes]:
+        """Carrega do disco (ou calcula e persiste) o estado de cada prefixo registrado"""
+        prefixes = self.config.get("prefixes", {})
+        if not prefixes:
+            return {}
+        
+        cache_dir = self._prefix_cache_dir(model_id, backend)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        wanted = {
+            hashlib.sha256(text.encode("utf-8")).hexdigest(): text
+            for text in prefixes.values()
+        }
+        
+        states = {}
+        for digest, text in wanted.items():
+            state_file = cache_dir / f"{digest}.state"
+            if state_file.exists():
+                states[text] = state_file.read_bytes()
+                continue
+            
+            try:
+                data = backend.prefill(text)
+            except Exception as e:
+                print(f"Erro ao pré-calcular prefixo para {model_id}: {e}")
+                continue
+            if data is None:
+                return {}
+            
+            partial = state_file.with_suffix(".partial")
+            partial.write_bytes(data)
+            os.replace(partial, state_file)
+            states[text] = data
+        
+        # Remove estados de prefixos que não estão mais registrados
+        for state_file in cache_dir.glob("*.state"):
+            if state_file.stem not in wanted:
+                state_file.unlink()
+        
+        return states
+    
+    def set_idle_timeout(self, seconds: Optional[float]):
+        """Define após quantos segundos sem uso um modelo é suspenso (None desativa)"""
+        self.config["idle_timeout"] = seconds
+        self._save_config()
+    
+    def suspend_idle_models(self) -> List[str]:
+        """Suspende os modelos sem requisições há mais que ``idle_timeout``"""
+        timeout = self.config.get("idle_timeout")
+        if not timeout:
+            return []
+        
+        now = time.time()
+        with self._lock:
+            idle = [
+                model_id for model_id, state in self.loaded_models.items()
+                if state["status"] == "ready"
+                and now - state.get("last_request", state["loaded_at"]) > timeout
+            ]
+        return [model_id for model_id in idle if self.suspend_model(model_id)]
+    
+    def start_idle_monitor(self, interval: float = 30.0):
+        """Inicia a thread que suspende modelos ociosos periodicamente"""
+        if self._idle_monitor is not None and self._idle_monitor.is_alive():
+            return
+        
+        def monitor():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.suspend_idle_models()
+                except Exception as e:
+                    print(f"Erro ao suspender modelos ociosos: {e}")
+        
+        self._idle_monitor = threading.Thread(target=monitor, daemon=True)
+        self._idle_monitor.start()
     
     def get_active_model(self) -> Optional[str]:
         """Retorna o modelo atualmente ativo"""
         return self.config.get("active_model")
     
-    def generate_text(self, prompt: str, model_id: Optional[str] = None, **kwargs) -> str:
-        """Gera texto usando o modelo carregado"""
-        target_model = model_id or self.get_active_model()
+    def is_active_model_ready(self) -> bool:
+        """Se o modelo ativo está residente e pode atender requisições
+
+        Um modelo suspenso conta como pronto: ele é retomado na primeira
+        requisição.
+        """
+        with self._lock:
+            state = self.loaded_models.get(self.get_active_model())
+            return state is not None and state["status"] in ("ready", "suspended")
+    
+    def resolve_model(self, model_id: Optional[str] = None) -> Optional[str]:
+        """Resolve o modelo de uma requisição (ativo por padrão, seguindo hot-swaps)"""
+        target = model_id or self.get_active_model()
+        with self._lock:
+            state = self.loaded_models.get(target)
+            if (state is None or state["status"] != "ready") and target in self.aliases:
+                target = self.aliases[target]
+        return target
+    
+    def hot_swap(self, model_id: str, drain_timeout: float = 60.0,
+                 background: bool = True) -> Dict[str, Any]:
+        """Troca o modelo ativo sem indisponibilidade
+
+        Carrega ``model_id`` sem ativá-lo, gera um token para aquecê-lo, troca
+        ``active_model`` atomicamente e então espera as requisições em
+        andamento no modelo anterior terminarem (até ``drain_timeout``
+        segundos) antes de descarregá-lo. Requisições que ainda citam o
+        modelo anterior pelo nome passam a ser atendidas pelo novo.
+        """
+        with self._lock:
+            if self.swap_status.get("state") in ("loading", "warming", "draining"):
+                return dict(self.swap_status, error="Já existe uma troca em andamento")
+            
+            self.swap_status = {
+                "state": "loading",
+                "from": self.get_active_model(),
+                "to": model_id,
+                "started_at": time.time()
+            }
+        
+        if background:
+            threading.Thread(
+                target=self._run_hot_swap, args=(model_id, drain_timeout), daemon=True
+            ).start()
+        else:
+            self._run_hot_swap(model_id, drain_timeout)
+        return dict(self.swap_status)
+    
+    def _run_hot_swap(self, model_id: str, drain_timeout: float):
+        """Executa as etapas do hot-swap, atualizando ``swap_status``"""
+        old_model = self.swap_status["from"]
+        try:
+            if not self.load_model(model_id, activate=False):
+                raise RuntimeError(f"Falha ao carregar {model_id}")
+            
+            self.swap_status["state"] = "warming"
+            self.generate_text("warm-up", model_id, max_tokens=1, priority="interactive")
+            
+            with self._lock:
+                self.config["active_model"] = model_id
+                if old_model and old_model != model_id:
+                    self.aliases[old_model] = model_id
+                    for alias, target in self.aliases.items():
+                        if target == old_model:
+                            self.aliases[alias] = model_id
+                self._save_config()
+                self.swap_status["state"] = "draining"
+                
+                if old_model and old_model != model_id:
+                    # Novas requisições ao modelo anterior seguem o alias em
+                    # resolve_model; só as que já estão em andamento o usam
+                    if old_model in self.loaded_models:
+                        self.loaded_models[old_model]["status"] = "draining"
+                    deadline = time.time() + drain_timeout
+                    while self._in_flight.get(old_model, 0) > 0 and time.time() < deadline:
+                        self._drained.wait(timeout=deadline - time.time())
+                    self.swap_status["abandoned_requests"] = self._in_flight.get(old_model, 0)
+            
+            if old_model and old_model != model_id:
+                self.unload_model(old_model)
+            
+            self.swap_status.update(state="done", finished_at=time.time())
+        except Exception as e:
+            print(f"Erro no hot-swap para {model_id}: {e}")
+            self.swap_status.update(state="failed", error=str(e), finished_at=time.time())
+    
+    def generate_stream(self, prompt: str, model_id: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """Gera texto incrementalmente usando o modelo carregado
+
+        Modelos suspensos por inatividade são retomados automaticamente. Se
+        ``model_id`` for um adaptador LoRA registrado, a requisição é atendida
+        pelo modelo base com o adaptador, que é carregado sob demanda.
+        """
+        backend = None
+        for _ in range(2):
+            with self._lock:
+                target_model, adapter = self._resolve_adapter(self.resolve_model(model_id))
+                state = self.loaded_models.get(target_model)
+                if (state is not None and state["status"] == "ready"
+                        and (adapter is None or adapter in state["backend"].adapters)):
+                    backend = state["backend"]
+                    # Estados de prefixo são do modelo base, sem adaptador
+                    prefix_state = None if adapter else self._match_prefix(state, prompt)
+                    state["last_request"] = time.time()
+                    self._in_flight[target_model] = self._in_flight.get(target_model, 0) + 1
+            
+            if backend is not None:
+                break
+            if adapter is not None:
+                if not self.load_adapter(adapter):
+                    break
+            elif state is None or not self.resume_model(target_model):
+                break
         
         if not target_model:
-            return "Nenhum modelo carregado"
+            yield "Nenhum modelo carregado"
+            return
         
-        if target_model not in self.loaded_models:
-            return f"Modelo {target_model} não está carregado"
+        if backend is None:
+            yield f"Modelo {model_id or target_model} não está carregado"
+            return
         
-        # Simulação de geração de texto
-        time.sleep(0.5)
-        return f"Resposta gerada pelo modelo {target_model} para: {prompt[:50]}..."
\ No newline at end of file
+        try:
+            yield from backend.generate_stream(prompt, prefix_state=prefix_state,
+                                               adapter=adapter, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight[target_model] -= 1
+                state["last_request"] = time.time()
+                self._drained.notify_all()
+    
+    def _match_prefix(self, state: Dict, prompt: str) -> Optional[bytes]:
+        """Estado do maior prefixo registrado com que o prompt começa"""
+        best = None
+        for text, data in state.get("prefix_states", {}).items():
+            if prompt.startswith(text) and (best is None or len(text) > len(best[0])):
+                best = (text, data)
+        return best[1] if best else None
+    
+    def generate_text(self, prompt: str, model_id: Optional[str] = None, **kwargs) -> str:
+        """Gera texto usando o modelo carregado"""
+        return "".join(self.generate_stream(prompt, model_id, **kwargs))
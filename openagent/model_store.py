@@ -0,0 +1,163 @@
+import os
+import shutil
+import hashlib
+import stat
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class BlobStore:
+    """Armazenamento de pesos endereçado por conteúdo (sha256)
+
+    Cada arquivo de modelo é guardado uma única vez em ``blobs/sha256-<hash>``
+    e exposto aos ids de modelo por hardlink (ou symlink/cópia como fallback).
+    O índice de referências é um dicionário ``{digest: {"size", "refs"}}``
+    mantido pelo chamador, que é responsável por persisti-lo.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root: Path, index: Dict[str, Dict]):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.index = index
+
+    @classmethod
+    def hash_file(cls, path: Path) -> str:
+        """Calcula o sha256 de um arquivo em blocos"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def blob_path(self, digest: str) -> Path:
+        """Caminho do blob para um digest"""
+        return self.blobs_dir / f"sha256-{digest}"
+
+    def has(self, digest: str) -> bool:
+        """Verifica se o blob já existe no armazenamento"""
+        return self.blob_path(digest).exists()
+
+    def staging_path(self, name: str) -> Path:
+        """Caminho temporário para um download em andamento"""
+        return self.tmp_dir / (name.replace("/", "_") + ".partial")
+
+    def ingest(self, src: Path, expected_digest: Optional[str] = None) -> str:
+        """Move um arquivo para o armazenamento e retorna seu digest
+
+        Se um blob com o mesmo conteúdo já existir, o arquivo de origem é
+        descartado e o blob existente é reaproveitado.
+        """
+        src = Path(src)
+        digest = self.hash_file(src)
+
+        if expected_digest and digest != expected_digest.lower():
+            src.unlink()
+            raise ValueError(
+                f"Checksum inválido: esperado {expected_digest}, obtido {digest}"
+            )
+
+        target = self.blob_path(digest)
+        if target.exists():
+            self.unlink(src)
+        else:
+            os.replace(src, target)
+            os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        self.index.setdefault(digest, {"size": target.stat().st_size, "refs": []})
+        return digest
+
+    def link(self, digest: str, dest: Path):
+        """Expõe um blob em ``dest`` via hardlink, symlink ou cópia"""
+        source = self.blob_path(digest)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+        self.remove_link(dest)
+
+        try:
+            os.link(source, dest)
+        except OSError:
+            try:
+                os.symlink(source, dest)
+            except OSError:
+                shutil.copy2(source, dest)
+
+    @staticmethod
+    def unlink(path: Path):
+        """Apaga um arquivo, liberando antes a proteção contra escrita
+
+        No Windows arquivos somente leitura não podem ser apagados.
+        """
+        path = Path(path)
+        if not path.is_symlink():
+            os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        path.unlink()
+
+    def remove_link(self, dest: Path):
+        """Remove a cópia de um modelo sem deixar o blob gravável
+
+        Um hardlink compartilha as permissões com o blob: depois de apagá-lo
+        o blob volta a ser somente leitura.
+        """
+        dest = Path(dest)
+        if not (dest.is_symlink() or dest.exists()):
+            return
+        shared = None if dest.is_symlink() else dest.stat()
+        self.unlink(dest)
+        if shared is None:
+            return
+        for blob in self.blobs_dir.glob("sha256-*"):
+            if os.path.samestat(blob.stat(), shared):
+                os.chmod(blob, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                break
+
+    def adopt(self, path: Path) -> str:
+        """Importa para o armazenamento um modelo baixado antes dos blobs
+
+        O arquivo vira um blob e o caminho original passa a ser um link para
+        ele. Retorna o digest.
+        """
+        path = Path(path)
+        staging = self.staging_path(f"adopt-{path.parent.name}-{path.name}")
+        os.replace(path, staging)
+        digest = self.ingest(staging)
+        self.link(digest, path)
+        return digest
+
+    def add_ref(self, digest: str, model_id: str):
+        """Registra que um modelo referencia o blob"""
+        entry = self.index.setdefault(
+            digest, {"size": self.blob_path(digest).stat().st_size, "refs": []}
+        )
+        if model_id not in entry["refs"]:
+            entry["refs"].append(model_id)
+
+    def release(self, digest: str, model_id: str) -> bool:
+        """Remove a referência de um modelo; apaga o blob quando não houver mais
+
+        Retorna True se o blob foi removido do disco.
+        """
+        entry = self.index.get(digest)
+        if entry is None:
+            return False
+
+        if model_id in entry["refs"]:
+            entry["refs"].remove(model_id)
+
+        if entry["refs"]:
+            return False
+
+        del self.index[digest]
+        blob = self.blob_path(digest)
+        if blob.exists():
+            self.unlink(blob)
+        return True
+
+    def refs(self, digest: str) -> List[str]:
+        """Lista os modelos que referenciam um blob"""
+        return list(self.index.get(digest, {}).get("refs", []))
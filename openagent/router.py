@@ -0,0 +1,324 @@
+"""
+Roteador entre vários servidores OpenAgent
+
+Expõe a mesma API compatível com OpenAI de um ``LLMServer`` e encaminha cada
+requisição para um dos servidores configurados, preferindo, nesta ordem, os
+que já têm o modelo carregado, os menos ocupados e o que já atendeu o mesmo
+prefixo de conversa (e por isso tem o cache do prompt aquecido).
+"""
+
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Any
+
+import requests
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+
+from .uds import create_session, server_base_url
+
+HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 2.0
+REQUEST_TIMEOUT = 600
+
+# Requisições a mais toleradas no servidor preferido pela afinidade de
+# prefixo antes de desviar para um menos ocupado
+AFFINITY_SLACK = 4
+
+# Respostas que indicam servidor indisponível (tenta o próximo)
+FAILOVER_STATUS = (502, 503, 504)
+
+# Residência do modelo, da melhor para a pior
+READY, SUSPENDED, DOWNLOADED, MISSING = range(4)
+
+
+class Upstream:
+    """Um servidor OpenAgent atrás do roteador e o último estado observado"""
+
+    def __init__(self, url: str, session: requests.Session):
+        # ``url`` pode ser http://host:porta ou unix:///caminho/do/socket
+        self.url = url.rstrip("/")
+        self.base_url = server_base_url(url)
+        self.session = session
+        self.healthy = False
+        self.ready = False
+        self.models: List[str] = []
+        self.loaded: Dict[str, str] = {}
+        self.active_model: Optional[str] = None
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.routed = 0
+        self.failures = 0
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def residency(self, model: Optional[str]) -> int:
+        """Quão pronto o servidor está para atender ``model``"""
+        model = model or self.active_model
+        if model is None:
+            return DOWNLOADED
+        status = self.loaded.get(model)
+        if status == "ready":
+            return READY
+        if status is not None:
+            return SUSPENDED
+        return DOWNLOADED if model in self.models else MISSING
+
+    def load(self) -> int:
+        """Carga estimada: fila reportada pelo servidor + envios em andamento"""
+        return self.queue_depth + self.in_flight
+
+    def refresh(self):
+        """Consulta ``/health``, ``/ready``, ``/v1/models`` e os modelos carregados"""
+        try:
+            health = self.session.get(f"{self.base_url}/health", timeout=HEALTH_TIMEOUT).json()
+            ready = self.session.get(f"{self.base_url}/ready", timeout=HEALTH_TIMEOUT)
+            ready.close()
+            models = self.session.get(f"{self.base_url}/v1/models", timeout=HEALTH_TIMEOUT).json()
+            loaded = self.session.get(f"{self.base_url}/api/models/loaded", timeout=HEALTH_TIMEOUT).json()
+
+            self.active_model = health.get("active_model")
+            queue = health.get("queue", {})
+            self.queue_depth = queue.get("in_flight", 0) + queue.get("queued", 0)
+            self.models = [model["id"] for model in models.get("data", [])]
+            self.loaded = {model["id"]: model.get("status", "ready") for model in loaded.get("models", [])}
+            self.healthy = health.get("status") == "healthy"
+            # Vivo mas ainda carregando (ou sem modelo) não recebe tráfego
+            self.ready = self.healthy and ready.status_code == 200
+            self.last_error = None
+        except Exception as e:
+            self.mark_down(e)
+        finally:
+            self.last_check = time.time()
+
+    def mark_down(self, error: Exception):
+        """Tira o servidor da rotação até a próxima verificação bem-sucedida"""
+        self.healthy = False
+        self.ready = False
+        self.failures += 1
+        self.last_error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ready": self.ready,
+            "active_model": self.active_model,
+            "models": self.models,
+            "loaded": self.loaded,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "routed": self.routed,
+            "failures": self.failures,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """Servidor que distribui requisições entre vários ``LLMServer``"""
+
+    def __init__(self, upstreams: List[str], host: str = "127.0.0.1", port: int = 1234,
+                 health_interval: float = HEALTH_INTERVAL):
+        self.host = host
+        self.port = port
+        self.session = create_session()
+        self.upstreams = [Upstream(url, self.session) for url in upstreams]
+        self.health_interval = health_interval
+        self.app = Flask(__name__)
+        CORS(self.app)
+        self.server_thread = None
+        self.running = False
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+        self._setup_routes()
+
+    def _setup_routes(self):
+        """Configura as rotas da API"""
+
+        @self.app.route('/v1/models', methods=['GET'])
+        def list_models():
+            """União dos modelos disponíveis nos servidores saudáveis"""
+            nodes: Dict[str, List[str]] = {}
+            for upstream in self.upstreams:
+                if upstream.healthy:
+                    for model in upstream.models:
+                        nodes.setdefault(model, []).append(upstream.url)
+
+            return jsonify({
+                "object": "list",
+                "data": [
+                    {"id": model, "object": "model", "owned_by": "local", "nodes": urls}
+                    for model, urls in sorted(nodes.items())
+                ]
+            })
+
+        @self.app.route('/v1/chat/completions', methods=['POST'])
+        def chat_completions():
+            """Encaminha um chat completion (afinidade pelo início da conversa)"""
+            data = request.get_json() or {}
+            affinity = json.dumps(
+                [data.get('model'), data.get('messages', [])[:2], data.get('tools')],
+                sort_keys=True, ensure_ascii=False
+            )
+            return self._forward('/v1/chat/completions', data, affinity)
+
+        @self.app.route('/v1/completions', methods=['POST'])
+        def completions():
+            """Encaminha um completion (afinidade pelo início do prompt)"""
+            data = request.get_json() or {}
+            affinity = f"{data.get('model')}\n{str(data.get('prompt', ''))[:512]}"
+            return self._forward('/v1/completions', data, affinity)
+
+        @self.app.route('/api/router/nodes', methods=['GET'])
+        def list_nodes():
+            """Estado de cada servidor conhecido pelo roteador"""
+            return jsonify({"nodes": [upstream.to_dict() for upstream in self.upstreams]})
+
+        @self.app.route('/health', methods=['GET'])
+        def health_check():
+            """Saudável enquanto houver ao menos um servidor disponível"""
+            healthy = [upstream for upstream in self.upstreams if upstream.healthy]
+            return jsonify({
+                "status": "healthy" if healthy else "unavailable",
+                "timestamp": int(time.time()),
+                "nodes": len(self.upstreams),
+                "healthy_nodes": len(healthy),
+                "failovers": self.failovers,
+                "queue": {"in_flight": sum(upstream.load() for upstream in healthy)}
+            }), 200 if healthy else 503
+
+        @self.app.route('/ready', methods=['GET'])
+        def readiness_check():
+            """Pronto enquanto houver ao menos um servidor pronto"""
+            ready = sum(1 for upstream in self.upstreams if upstream.ready)
+            return jsonify({
+                "status": "ready" if ready else "unavailable",
+                "ready_nodes": ready
+            }), 200 if ready else 503
+
+    def candidates(self, model: Optional[str], affinity: str) -> List[Upstream]:
+        """Servidores prontos na ordem em que devem ser tentados
+
+        Ordena por residência do modelo e carga. Entre os servidores com a
+        melhor residência, o escolhido por hashing de rendezvous sobre o
+        prefixo da conversa vai na frente, desde que não esteja mais de
+        ``AFFINITY_SLACK`` requisições acima do menos ocupado.
+        """
+        ready = [upstream for upstream in self.upstreams if upstream.ready]
+        eligible = [upstream for upstream in ready if upstream.residency(model) != MISSING]
+        if not eligible:
+            # Deixa o servidor responder (ex: aliases de hot-swap, modelo inexistente)
+            eligible = ready
+        if not eligible:
+            return []
+
+        ordered = sorted(eligible, key=lambda u: (u.residency(model), u.load()))
+        best_residency = ordered[0].residency(model)
+        best = [upstream for upstream in ordered if upstream.residency(model) == best_residency]
+
+        preferred = max(
+            best,
+            key=lambda u: hashlib.sha256(f"{u.url}\n{affinity}".encode("utf-8")).digest()
+        )
+        if preferred.load() <= best[0].load() + AFFINITY_SLACK:
+            ordered.remove(preferred)
+            ordered.insert(0, preferred)
+        return ordered
+
+    def _forward(self, path: str, data: Dict[str, Any], affinity: str):
+        """Envia a requisição ao melhor servidor, com failover para os seguintes"""
+        headers = {"Content-Type": "application/json"}
+        if request.headers.get('Authorization'):
+            headers["Authorization"] = request.headers['Authorization']
+        # Sem isso todos os clientes sem API key seriam um só (o roteador) na
+        # fila justa e no limite de tokens do servidor
+        headers["X-OpenAgent-Client"] = request.remote_addr or "local"
+
+        errors = []
+        for upstream in self.candidates(data.get('model'), affinity):
+            with self._lock:
+                upstream.in_flight += 1
+            try:
+                response = self.session.post(
+                    f"{upstream.base_url}{path}", json=data, headers=headers,
+                    stream=bool(data.get('stream')), timeout=REQUEST_TIMEOUT
+                )
+                if response.status_code in FAILOVER_STATUS:
+                    # Devolve a conexão ao pool antes de tentar o próximo
+                    response.close()
+                    raise requests.HTTPError(f"HTTP {response.status_code}")
+            except requests.RequestException as e:
+                with self._lock:
+                    upstream.in_flight -= 1
+                    self.failovers += 1
+                upstream.mark_down(e)
+                errors.append(f"{upstream.url}: {e}")
+                continue
+
+            upstream.routed += 1
+            return self._relay(upstream, response)
+
+        return jsonify({"error": "Nenhum servidor disponível", "attempts": errors}), 503
+
+    def _relay(self, upstream: Upstream, response: requests.Response) -> Response:
+        """Repassa a resposta (em streaming, se for o caso) ao cliente"""
+        content_type = response.headers.get('Content-Type', 'application/json')
+
+        def body():
+            try:
+                for chunk in response.iter_content(chunk_size=None):
+                    yield chunk
+            finally:
+                response.close()
+                with self._lock:
+                    upstream.in_flight -= 1
+
+        headers = {"X-OpenAgent-Node": upstream.url}
+        if response.headers.get('Retry-After'):
+            headers["Retry-After"] = response.headers['Retry-After']
+        return Response(body(), status=response.status_code,
+                        content_type=content_type, headers=headers)
+
+    def refresh(self):
+        """Atualiza o estado de todos os servidores em paralelo"""
+        threads = [threading.Thread(target=upstream.refresh, daemon=True) for upstream in self.upstreams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=HEALTH_TIMEOUT * 3 + 1)
+
+    def _health_loop(self):
+        while self.running:
+            self.refresh()
+            time.sleep(self.health_interval)
+
+    def start(self):
+        """Inicia o roteador e as verificações de saúde em threads separadas"""
+        if self.running:
+            print("Roteador já está rodando")
+            return
+
+        self.running = True
+        self.refresh()
+        threading.Thread(target=self._health_loop, daemon=True).start()
+
+        def run_server():
+            self.app.run(host=self.host, port=self.port, debug=False, use_reloader=False)
+
+        self.server_thread = threading.Thread(target=run_server, daemon=True)
+        self.server_thread.start()
+
+        healthy = sum(1 for upstream in self.upstreams if upstream.healthy)
+        print(f"Roteador iniciado em http://{self.host}:{self.port} "
+              f"({healthy}/{len(self.upstreams)} servidores saudáveis)")
+
+    def stop(self):
+        """Para o roteador"""
+        self.running = False
+        if self.server_thread:
+            self.server_thread.join(timeout=5)
+        print("Roteador parado")
@@ -0,0 +1,170 @@
+"""
+Runtime de pesos mapeados em memória
+
+Os arquivos de modelo são abertos via mmap: nada é lido na abertura e cada
+tensor só é trazido para a RAM quando acessado. Como as páginas vêm do page
+cache do sistema, processos que abrem o mesmo blob compartilham a memória.
+"""
+
+import os
+import sys
+import mmap
+import time
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Dict, Optional, Any, Iterable
+
+from .gguf import GGUF_MAGIC, GGUFReader, GGUFTensor
+
+
+class MappedModel:
+    """Pesos de um modelo mapeados em memória e carregados sob demanda"""
+
+    def __init__(self, path: str, mlock: bool = False, prefetch: bool = False):
+        started = time.perf_counter()
+
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        if self.size == 0:
+            raise ValueError(f"Arquivo de modelo vazio: {path}")
+
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.reader: Optional[GGUFReader] = None
+        self.tensors: Dict[str, GGUFTensor] = {}
+        self._locked_address: Optional[int] = None
+        if self._mmap[:4] == GGUF_MAGIC:
+            self.reader = GGUFReader(self._mmap)
+            self.tensors = {tensor.name: tensor for tensor in self.reader.tensors}
+
+        self.locked = self._lock_pages() if mlock else False
+        if prefetch:
+            self.prefetch()
+
+        self.load_time = time.perf_counter() - started
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.reader.metadata if self.reader else {}
+
+    def tensor(self, name: str) -> memoryview:
+        """Retorna uma view (sem cópia) dos bytes de um tensor"""
+        info = self.tensors[name]
+        return memoryview(self._mmap)[info.offset:info.offset + info.n_bytes]
+
+    def prefetch(self, names: Optional[Iterable[str]] = None):
+        """Pede ao kernel para antecipar a leitura dos tensores indicados
+
+        Sem ``names``, antecipa o arquivo inteiro. A leitura acontece em
+        segundo plano pelo kernel; a chamada retorna imediatamente.
+        """
+        if not hasattr(self._mmap, "madvise") or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+
+        if names is None:
+            ranges = [(0, self.size)]
+        else:
+            ranges = [(self.tensors[n].offset, self.tensors[n].n_bytes) for n in names]
+
+        for offset, length in ranges:
+            start = offset - offset % mmap.PAGESIZE
+            self._mmap.madvise(mmap.MADV_WILLNEED, start, length + offset - start)
+
+    def _lock_pages(self) -> bool:
+        """Fixa as páginas do modelo na RAM (evita swap em modelos críticos)
+
+        O ``mmap`` do Python só expõe o endereço de mapeamentos graváveis, e
+        um mapeamento privado gravável seria copiado inteiro pelo mlock. Por
+        isso o arquivo é mapeado uma segunda vez pela libc, somente leitura e
+        compartilhado, e é esse mapeamento que é travado: as páginas são as
+        mesmas do page cache usadas por ``self._mmap``.
+        """
+        libc_name = ctypes.util.find_library("c")
+        if sys.platform == "win32" or not libc_name:
+            return False
+
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            libc.mmap.restype = ctypes.c_void_p
+            libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                                  ctypes.c_int, ctypes.c_int, ctypes.c_long]
+            libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+
+            with open(self.path, "rb") as f:
+                address = libc.mmap(None, self.size, mmap.PROT_READ, mmap.MAP_SHARED, f.fileno(), 0)
+            if address in (None, ctypes.c_void_p(-1).value):
+                errno = ctypes.get_errno()
+                print(f"Aviso: mmap para mlock falhou para {self.path} ({os.strerror(errno)})")
+                return False
+
+            if libc.mlock(address, self.size) != 0:
+                errno = ctypes.get_errno()
+                libc.munmap(address, self.size)
+                print(f"Aviso: mlock falhou para {self.path} ({os.strerror(errno)})")
+                return False
+
+            self._libc = libc
+            self._locked_address = address
+            return True
+        except Exception as e:
+            print(f"Aviso: mlock indisponível: {e}")
+            return False
+
+    def resident_bytes(self) -> Optional[int]:
+        """Bytes do mapeamento atualmente residentes na RAM (somente Linux)"""
+        smaps = Path("/proc/self/smaps")
+        if not smaps.exists():
+            return None
+
+        target = str(self.path.resolve())
+        resident = 0
+        in_mapping = False
+        try:
+            with open(smaps, "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if not fields:
+                        continue
+                    if "-" in fields[0] and len(fields) >= 5:
+                        # O mapeamento do mlock tem as mesmas páginas: não
+                        # conta duas vezes
+                        start = int(fields[0].split("-")[0], 16)
+                        in_mapping = (" ".join(fields[5:]) in (target, str(self.path))
+                                      and start != self._locked_address)
+                    elif in_mapping and fields[0] == "Rss:":
+                        resident += int(fields[1]) * 1024
+        except OSError:
+            return None
+        return resident
+
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do mapeamento"""
+        return {
+            "path": str(self.path),
+            "mapped_bytes": self.size,
+            "resident_bytes": self.resident_bytes(),
+            "tensor_count": len(self.tensors),
+            "locked": self.locked,
+            "load_time": round(self.load_time, 4),
+        }
+
+    def close(self):
+        """Desfaz o mapeamento (as páginas continuam no page cache)"""
+        if self._locked_address is not None:
+            # munmap também libera o mlock
+            self._libc.munmap(self._locked_address, self.size)
+            self._locked_address = None
+            self.locked = False
+        if self._mmap is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Ainda existem views de tensores em uso; o mapeamento é liberado
+            # quando elas forem coletadas
+            pass
+        self._mmap = None
+        self.reader = None
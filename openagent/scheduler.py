@@ -0,0 +1,404 @@
+"""
+Agendamento de requisições de geração
+
+Cada backend tem um ``BatchScheduler``: as requisições concorrentes (inclusive
+para adaptadores LoRA diferentes sobre o mesmo modelo base) entram em uma fila
+e são entregues ao backend em lotes, em ordem de fila justa ponderada entre
+clientes e classes de prioridade. Antes disso, ``SingleFlight`` junta
+requisições idênticas e simultâneas em uma única geração.
+"""
+
+import json
+import time
+import queue
+import hashlib
+import threading
+from typing import Dict, List, Optional, Any, Iterator, Callable
+
+from .stop_sequences import StopSequenceMatcher
+
+# Peso de cada classe de prioridade na fila justa: um cliente interativo
+# recebe 8x a vazão de um cliente em lote quando ambos estão na fila
+PRIORITY_WEIGHTS = {"interactive": 8.0, "default": 4.0, "batch": 1.0}
+DEFAULT_PRIORITY = "default"
+
+# Custo provisório (tokens) de uma requisição, corrigido ao final da geração
+ESTIMATED_COST = 256
+
+
+class GenerationRequest:
+    """Uma requisição de geração e o canal por onde seus tokens são entregues"""
+
+    _done = object()
+
+    def __init__(self, prompt: str, kwargs: Optional[Dict[str, Any]] = None,
+                 adapter: Optional[str] = None, prefix_state: Optional[bytes] = None,
+                 priority: str = DEFAULT_PRIORITY, client: Optional[str] = None,
+                 stop: Optional[List[str]] = None):
+        self.prompt = prompt
+        self.kwargs = kwargs or {}
+        self.adapter = adapter
+        self.prefix_state = prefix_state
+        self.priority = priority if priority in PRIORITY_WEIGHTS else DEFAULT_PRIORITY
+        self.client = client or "anonymous"
+        self.tokens = 0
+        self.submitted_at = time.time()
+        self.cancelled = threading.Event()
+        self.stop_matcher = StopSequenceMatcher(stop) if stop else None
+        # Limitada: um consumidor lento segura a geração em vez de acumular
+        # a resposta inteira em memória
+        self._chunks: "queue.Queue" = queue.Queue(maxsize=64)
+
+    def _put(self, item) -> bool:
+        """Entrega um item ao consumidor, desistindo se ele cancelar"""
+        while not self.cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def emit(self, chunk: str) -> bool:
+        """Entrega um pedaço de texto
+
+        Retorna False quando a geração deve parar: o consumidor desistiu ou
+        uma sequência de parada foi encontrada.
+        """
+        if self.cancelled.is_set():
+            return False
+        self.tokens += 1
+
+        if self.stop_matcher is not None:
+            chunk, stopped = self.stop_matcher.feed(chunk)
+            if chunk and not self._put(chunk):
+                return False
+            return not stopped
+
+        return self._put(chunk)
+
+    def finish(self, error: Optional[Exception] = None):
+        """Sinaliza o fim da geração (com erro, se houver)"""
+        if self.stop_matcher is not None and error is None:
+            held = self.stop_matcher.flush()
+            if held:
+                self._put(held)
+        if error is not None:
+            self._put(error)
+        self._put(self._done)
+
+    def stream(self) -> Iterator[str]:
+        """Consome os pedaços gerados; parar de iterar cancela a requisição"""
+        try:
+            while True:
+                item = self._chunks.get()
+                if item is self._done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.cancelled.set()
+
+
+class BatchScheduler:
+    """Fila de requisições de um backend, entregue em lotes
+
+    ``next_batch`` espera até ``batch_window`` segundos por requisições que
+    cheguem juntas, para que sejam processadas no mesmo passo do backend.
+
+    A ordem de atendimento é uma fila justa ponderada (self-clocked fair
+    queuing): cada par (cliente, prioridade) é um fluxo cujo serviço recebido
+    é contado em tokens divididos pelo peso da classe, e o próximo atendido
+    é o que terminaria primeiro nesse relógio virtual. Um cliente com muitas requisições em
+    lote não atrasa os demais, e a classe interativa recebe mais vazão.
+    """
+
+    def __init__(self, max_batch: int = 8, batch_window: float = 0.005):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._pending: List[GenerationRequest] = []
+        self._condition = threading.Condition()
+        self._service: Dict[str, float] = {}
+        self._charged: Dict[int, float] = {}
+        self._virtual_time = 0.0
+
+    @staticmethod
+    def _flow(request: GenerationRequest) -> str:
+        return f"{request.priority}:{request.client}"
+
+    def submit(self, request: GenerationRequest):
+        """Enfileira uma requisição"""
+        with self._condition:
+            # Fluxos que voltam à fila não acumulam crédito do tempo ocioso
+            flow = self._flow(request)
+            self._service[flow] = max(self._service.get(flow, 0.0), self._virtual_time)
+            self._pending.append(request)
+            self._condition.notify_all()
+
+    def pending(self) -> int:
+        """Número de requisições aguardando"""
+        with self._condition:
+            return len(self._pending)
+
+    def _charge(self, request: GenerationRequest) -> float:
+        """Serviço provisório de uma requisição: tokens estimados / peso"""
+        cost = min(int(request.kwargs.get("max_tokens") or ESTIMATED_COST), ESTIMATED_COST)
+        return cost / PRIORITY_WEIGHTS[request.priority]
+
+    def _take(self, count: int) -> List[GenerationRequest]:
+        """Remove até ``count`` requisições da fila, na ordem da fila justa
+
+        É atendida primeiro a requisição com o menor tempo virtual de
+        término (serviço já recebido pelo fluxo + custo / peso).
+        """
+        batch = []
+        while self._pending and len(batch) < count:
+            request = min(
+                self._pending,
+                key=lambda r: (self._service[self._flow(r)] + self._charge(r), r.submitted_at)
+            )
+            self._pending.remove(request)
+
+            flow = self._flow(request)
+            self._virtual_time = self._service[flow]
+            charge = self._charge(request)
+            self._service[flow] += charge
+            self._charged[id(request)] = charge
+            batch.append(request)
+        return batch
+
+    def complete(self, request: GenerationRequest):
+        """Corrige o serviço do fluxo com os tokens realmente gerados"""
+        with self._condition:
+            charge = self._charged.pop(id(request), None)
+            flow = self._flow(request)
+            if charge is not None and flow in self._service:
+                self._service[flow] += request.tokens / PRIORITY_WEIGHTS[request.priority] - charge
+            if not any(self._flow(r) == flow for r in self._pending):
+                # Fluxo ocioso: volta a entrar pelo tempo virtual corrente
+                self._service.pop(flow, None)
+
+    def next_batch(self, limit: Optional[int] = None, wait: bool = True) -> List[GenerationRequest]:
+        """Retira o próximo lote (vazio se não houver requisições)
+
+        ``limit`` restringe o tamanho do lote (ex: vagas livres em um lote em
+        andamento); com ``wait=False`` não espera a janela de agrupamento.
+        """
+        limit = self.max_batch if limit is None else limit
+        with self._condition:
+            self._pending = [r for r in self._pending if not r.cancelled.is_set()]
+            if not self._pending or limit <= 0:
+                return []
+
+            deadline = time.time() + (self.batch_window if wait else 0)
+            while len(self._pending) < limit:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(timeout=remaining)
+
+            return self._take(limit)
+
+
+class RateLimiter:
+    """Limite de tokens por minuto por cliente (balde de tokens)
+
+    O consumo é cobrado depois da geração, então o saldo pode ficar
+    negativo; novas requisições só são aceitas quando ele volta a ser
+    positivo.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, client: str, tokens_per_minute: float) -> Dict[str, float]:
+        now = time.time()
+        bucket = self._buckets.setdefault(client, {"tokens": tokens_per_minute, "updated": now})
+        rate = tokens_per_minute / 60.0
+        bucket["tokens"] = min(tokens_per_minute, bucket["tokens"] + (now - bucket["updated"]) * rate)
+        bucket["updated"] = now
+        return bucket
+
+    def retry_after(self, client: str, tokens_per_minute: Optional[float]) -> float:
+        """Segundos até o cliente poder fazer outra requisição (0 = liberado)"""
+        if not tokens_per_minute:
+            return 0.0
+        with self._lock:
+            bucket = self._refill(client, tokens_per_minute)
+            if bucket["tokens"] > 0:
+                return 0.0
+            return (1 - bucket["tokens"]) / (tokens_per_minute / 60.0)
+
+    def charge(self, client: str, tokens_per_minute: Optional[float], tokens: int):
+        """Desconta os tokens consumidos por uma requisição"""
+        if not tokens_per_minute:
+            return
+        with self._lock:
+            self._refill(client, tokens_per_minute)["tokens"] -= tokens
+
+
+def generation_key(model: Optional[str], prompt: str, params: Dict[str, Any]) -> Optional[str]:
+    """Chave determinística de uma geração (modelo, prompt e parâmetros)
+
+    Só gerações reproduzíveis têm chave: ``temperature`` 0 ou uma ``seed``
+    explícita (que faz parte da chave). Com amostragem livre (inclusive a
+    temperatura padrão dos backends) retorna None e cada requisição gera o
+    seu próprio texto.
+    """
+    temperature = params.get("temperature")
+    if params.get("seed") is None and (temperature is None or temperature > 0):
+        return None
+    payload = json.dumps([model, prompt, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SharedGeneration:
+    """Uma geração em andamento cujo stream é compartilhado por vários leitores
+
+    Os pedaços ficam guardados para que leitores que chegam depois recebam o
+    texto desde o início. Se todos os leitores desistirem, a geração é
+    cancelada.
+    """
+
+    def __init__(self, source: Callable[[], Iterator[str]]):
+        self._source = source
+        self.chunks: List[str] = []
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self._condition = threading.Condition()
+
+    def start(self, on_done: Callable[[], None]):
+        """Inicia a geração em segundo plano"""
+        threading.Thread(target=self._run, args=(on_done,), daemon=True).start()
+
+    def _run(self, on_done: Callable[[], None]):
+        chunks = None
+        try:
+            chunks = self._source()
+            for chunk in chunks:
+                with self._condition:
+                    if self.subscribers == 0:
+                        self.cancelled = True
+                        break
+                    self.chunks.append(chunk)
+                    self._condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+            on_done()
+
+    def subscribe(self) -> Optional[Iterator[str]]:
+        """Novo leitor do stream (None se a geração já foi cancelada)"""
+        with self._condition:
+            if self.cancelled:
+                return None
+            self.subscribers += 1
+        return _Subscription(self)
+
+    def _release(self):
+        with self._condition:
+            self.subscribers -= 1
+
+    def _follow(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self._condition:
+                while position == len(self.chunks) and not self.done:
+                    self._condition.wait()
+                pending = self.chunks[position:]
+                finished = self.done
+                error = self.error
+            position += len(pending)
+            yield from pending
+            if finished and position == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class _Subscription:
+    """Leitor de uma ``SharedGeneration``
+
+    O leitor é registrado em ``subscribe`` e liberado ao fim do stream, em
+    ``close`` ou quando é coletado, mesmo que nunca tenha sido iterado (o
+    ``finally`` de um gerador que não começou não roda).
+    """
+
+    def __init__(self, shared: SharedGeneration):
+        self._shared = shared
+        self._chunks = shared._follow()
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._chunks.close()
+        self._shared._release()
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Junta gerações idênticas simultâneas em uma só
+
+    Requisições com a mesma chave enquanto uma geração está em andamento
+    passam a ler o stream dela em vez de iniciar outra.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, SharedGeneration] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def stream(self, key: str, source: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Stream da geração ``key``, iniciando-a com ``source`` se necessário"""
+        with self._lock:
+            shared = self._in_flight.get(key)
+            follower = shared.subscribe() if shared is not None else None
+            if follower is not None:
+                self.coalesced += 1
+                return follower
+
+            shared = SharedGeneration(source)
+            follower = shared.subscribe()
+            self._in_flight[key] = shared
+            self.started += 1
+
+        shared.start(on_done=lambda: self._finish(key, shared))
+        return follower
+
+    def _finish(self, key: str, shared: SharedGeneration):
+        with self._lock:
+            if self._in_flight.get(key) is shared:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de gerações iniciadas e requisições agrupadas"""
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "started": self.started,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,532 @@
+"""
+Busca de texto em arquivos
+
+Percorre a árvore com ``os.scandir`` respeitando ``.gitignore`` (e
+diretórios de dependências/caches comuns), ignora arquivos binários e
+grandes demais e procura o padrão nos bytes de cada arquivo mapeado em
+memória, sem decodificar nem dividir em linhas os arquivos que não casam.
+Em árvores grandes os arquivos são repartidos entre processos; os
+resultados saem em streaming, na ordem da árvore, até ``max_results``.
+"""
+
+import os
+import re
+import mmap
+import fnmatch
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Any, Iterator, Iterable, Tuple, Union
+
+# Diretórios nunca percorridos quando ``.gitignore`` é respeitado
+DEFAULT_EXCLUDES = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv",
+    ".tox", ".mypy_cache", ".pytest_cache",
+}
+
+# Arquivos maiores que isso são ignorados
+MAX_FILE_SIZE = 8 * 1024 * 1024
+
+# Um NUL nos primeiros bytes marca o arquivo como binário
+BINARY_SNIFF = 8192
+
+MAX_RESULTS = 1000
+
+# Abaixo disso a busca roda no próprio processo (iniciar workers custa mais)
+PARALLEL_THRESHOLD = 256
+FILES_PER_TASK = 64
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _translate(pattern: str) -> str:
+    """Converte um glob de ``.gitignore`` em expressão regular"""
+    result = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            result.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            result.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            result.append("[^/]*")
+        elif char == "?":
+            result.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith("[!", i) else i + 1)
+            if end < 0:
+                result.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                result.append(f"[{body}]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(char))
+        i += 1
+    return "".join(result)
+
+
+class IgnoreRules:
+    """Regras de um ``.gitignore``, relativas ao diretório onde ele está"""
+
+    def __init__(self, base: str, lines: List[str]):
+        self.base = base
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # Com barra no meio (ou no início) o padrão é ancorado no diretório
+            anchored = "/" in line
+            line = line.lstrip("/")
+            regex = _translate(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(f"^{regex}$"), negate, dir_only))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["IgnoreRules"]:
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="ignore") as f:
+                rules = cls(directory, f.readlines())
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """True/False se alguma regra decide sobre ``path`` (a última vence)"""
+        relative = os.path.relpath(path, self.base).replace(os.sep, "/")
+        decision = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative):
+                decision = not negate
+        return decision
+
+
+def _ignored(rules: List[IgnoreRules], path: str, is_dir: bool) -> bool:
+    # Regras de diretórios mais profundos têm precedência
+    for ignore in reversed(rules):
+        decision = ignore.match(path, is_dir)
+        if decision is not None:
+            return decision
+    return False
+
+
+def _rules_along(base: str, path: str, use_gitignore: bool = True,
+                 hidden: bool = False) -> Optional[List[IgnoreRules]]:
+    """Regras de ``.gitignore`` que valem em ``path`` numa caminhada a partir de ``base``
+
+    None se a caminhada a partir de ``base`` não chegaria em ``path`` (ele
+    ou um diretório acima dele é ignorado, oculto ou excluído por padrão).
+    """
+    relative = os.path.relpath(path, base)
+    if relative == ".":
+        return []
+    parts = relative.split(os.sep)
+    if parts[0] == os.pardir:
+        return []
+
+    rules: List[IgnoreRules] = []
+    directory = base
+    for position, name in enumerate(parts):
+        if use_gitignore:
+            local = IgnoreRules.load(directory)
+            if local is not None:
+                rules.append(local)
+        child = os.path.join(directory, name)
+        is_dir = position < len(parts) - 1 or os.path.isdir(child)
+        if not hidden and name.startswith("."):
+            return None
+        if use_gitignore:
+            if is_dir and name in DEFAULT_EXCLUDES:
+                return None
+            if rules and _ignored(rules, child, is_dir):
+                return None
+        directory = child
+    return rules
+
+
+def walk_entries(root: str, use_gitignore: bool = True, hidden: bool = False,
+                 max_depth: Optional[int] = None,
+                 base: Optional[str] = None) -> Iterator[Tuple[os.DirEntry, bool]]:
+    """Entradas sob ``root`` (``(entrada, é_diretório)``), em ordem de nome
+
+    Diretórios ignorados são podados sem serem abertos. ``max_depth`` = 1
+    lista só o próprio ``root``. Os arquivos de um diretório saem antes do
+    conteúdo dos seus subdiretórios. Com ``base`` (um diretório acima de
+    ``root``), valem também as regras dos ``.gitignore`` entre os dois: o
+    resultado é o trecho de uma caminhada a partir de ``base``.
+    """
+    initial: Optional[List[IgnoreRules]] = []
+    if base is not None:
+        initial = _rules_along(base, root, use_gitignore, hidden)
+        if initial is None:
+            return
+    stack: List[Tuple[str, List[IgnoreRules], int]] = [(root, initial, 1)]
+    while stack:
+        directory, rules, depth = stack.pop()
+        if use_gitignore:
+            local = IgnoreRules.load(directory)
+            if local is not None:
+                rules = rules + [local]
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            if not hidden and entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if use_gitignore:
+                if is_dir and entry.name in DEFAULT_EXCLUDES:
+                    continue
+                if rules and _ignored(rules, entry.path, is_dir):
+                    continue
+
+            yield entry, is_dir
+            if is_dir and (max_depth is None or depth < max_depth):
+                subdirectories.append((entry.path, rules, depth + 1))
+
+        # Pilha: empilha ao contrário para visitar em ordem de nome
+        stack.extend(reversed(subdirectories))
+
+
+def walk_files(root: str, file_pattern: str = "*", use_gitignore: bool = True,
+               hidden: bool = False, max_filesize: int = MAX_FILE_SIZE,
+               base: Optional[str] = None) -> Iterator[str]:
+    """Caminhos dos arquivos a buscar sob ``root``, em ordem de nome
+
+    ``base`` tem o mesmo sentido que em ``walk_entries``.
+    """
+    if os.path.isfile(root):
+        if base is None:
+            yield root
+            return
+        try:
+            size = os.path.getsize(root)
+        except OSError:
+            return
+        if (_rules_along(base, root, use_gitignore, hidden) is not None
+                and size <= max_filesize and fnmatch.fnmatch(os.path.basename(root), file_pattern)):
+            yield root
+        return
+
+    for entry, is_dir in walk_entries(root, use_gitignore, hidden, base=base):
+        if is_dir or not fnmatch.fnmatch(entry.name, file_pattern):
+            continue
+        try:
+            if entry.stat().st_size > max_filesize:
+                continue
+        except OSError:
+            continue
+        yield entry.path
+
+
+def find_files(patterns: Union[str, List[str]], root: str = ".", recursive: bool = True,
+               use_gitignore: bool = True, directories: bool = True) -> Iterator[str]:
+    """Caminhos sob ``root`` que casam com algum dos padrões, sob demanda
+
+    Padrões sem ``/`` casam com o nome; com ``/``, com o fim do caminho
+    relativo a ``root`` (``tests/*.py`` casa ``a/tests/x.py``). Entradas
+    ocultas só entram quando algum padrão começa com ``.``.
+    """
+    patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+    by_name = [pattern for pattern in patterns if "/" not in pattern]
+    by_path = [pattern.lstrip("/") for pattern in patterns if "/" in pattern]
+    hidden = any(pattern.startswith(".") for pattern in patterns)
+
+    for entry, is_dir in walk_entries(root, use_gitignore, hidden, None if recursive else 1):
+        if is_dir and not directories:
+            continue
+        if any(fnmatch.fnmatch(entry.name, pattern) for pattern in by_name):
+            yield entry.path
+        elif by_path:
+            relative = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            if any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(relative, "*/" + pattern)
+                   for pattern in by_path):
+                yield entry.path
+
+
+def _literal_bytes(text: str, case_sensitive: bool) -> bytes:
+    """Regex em bytes de um literal; sem diferenciar maiúsculas, cada letra
+    vira uma alternativa entre as duas formas em UTF-8 (funciona além do ASCII)"""
+    if case_sensitive:
+        return re.escape(text.encode("utf-8"))
+    parts = []
+    for char in text:
+        forms = {char.lower(), char.upper(), char}
+        if len(forms) == 1:
+            parts.append(re.escape(char.encode("utf-8")))
+        else:
+            parts.append(b"(?:" + b"|".join(re.escape(f.encode("utf-8")) for f in sorted(forms)) + b")")
+    return b"".join(parts)
+
+
+@functools.lru_cache(maxsize=32)
+def _compile(pattern: str, regex: bool,
+             case_sensitive: bool) -> Tuple[Optional[bytes], bool, "re.Pattern", Optional["re.Pattern"]]:
+    """Prepara o padrão: ``(literal, fold, regex, regex_texto)``
+
+    Literais usam ``find`` nos bytes do arquivo; sem diferenciar maiúsculas
+    e com termo ASCII, ``fold`` indica buscar o literal minúsculo em uma
+    cópia minúscula do arquivo (``bytes.lower`` preserva as posições). Os
+    demais casos usam a regex. ``re.IGNORECASE`` em bytes só junta as
+    caixas do ASCII, então regexes sem diferenciar maiúsculas também têm uma
+    versão em ``str`` (``regex_texto``), usada nos arquivos com bytes não
+    ASCII depois de decodificados.
+    """
+    if regex:
+        if case_sensitive:
+            return None, False, re.compile(pattern.encode("utf-8"), re.MULTILINE), None
+        return (None, False, re.compile(pattern.encode("utf-8"), re.IGNORECASE | re.MULTILINE),
+                re.compile(pattern, re.IGNORECASE | re.MULTILINE))
+    compiled = re.compile(_literal_bytes(pattern, case_sensitive))
+    if case_sensitive:
+        return pattern.encode("utf-8"), False, compiled, None
+    if pattern.isascii():
+        return pattern.lower().encode("utf-8"), True, compiled, None
+    return None, False, compiled, None
+
+
+_NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+
+def _search_file(path: str, literal: Optional[bytes], fold: bool, compiled: "re.Pattern",
+                 limit: int, text: Optional["re.Pattern"] = None) -> List[Dict[str, Any]]:
+    matches = []
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return matches
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if b"\0" in data[:BINARY_SNIFF]:
+                    return matches
+                if text is not None and _NON_ASCII.search(data):
+                    return _search_text(data[:].decode("utf-8", errors="ignore"), text, limit)
+
+                haystack = data[:].lower() if fold else data
+                if literal is not None:
+                    def find(position: int) -> int:
+                        return haystack.find(literal, position)
+                else:
+                    def find(position: int) -> int:
+                        found = compiled.search(data, position)
+                        return -1 if found is None else found.start()
+
+                line_number = 1
+                counted = 0
+                position = 0
+                while len(matches) < limit:
+                    index = find(position)
+                    if index < 0:
+                        break
+                    start = data.rfind(b"\n", 0, index) + 1
+                    end = data.find(b"\n", index)
+                    end = len(data) if end < 0 else end
+
+                    line_number += data[counted:start].count(b"\n")
+                    counted = start
+                    line = data[start:end]
+                    matches.append({
+                        "line": line_number,
+                        "content": line.decode("utf-8", errors="ignore").strip(),
+                        "column": len(line[:index - start].decode("utf-8", errors="ignore"))
+                    })
+                    # Uma ocorrência por linha
+                    position = end + 1
+                    if position > len(data):
+                        break
+    except (OSError, ValueError):
+        pass
+    return matches
+
+
+def _search_text(content: str, compiled: "re.Pattern", limit: int) -> List[Dict[str, Any]]:
+    """Mesma varredura de ``_search_file`` sobre o texto já decodificado"""
+    matches = []
+    line_number = 1
+    counted = 0
+    position = 0
+    while len(matches) < limit:
+        found = compiled.search(content, position)
+        if found is None:
+            break
+        index = found.start()
+        start = content.rfind("\n", 0, index) + 1
+        end = content.find("\n", index)
+        end = len(content) if end < 0 else end
+
+        line_number += content.count("\n", counted, start)
+        counted = start
+        matches.append({
+            "line": line_number,
+            "content": content[start:end].strip(),
+            "column": index - start
+        })
+        position = end + 1
+        if position > len(content):
+            break
+    return matches
+
+
+def _search_batch(paths: List[str], pattern: str, regex: bool, case_sensitive: bool,
+                  limit: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Busca em um lote de arquivos (roda nos workers)"""
+    literal, fold, compiled, text = _compile(pattern, regex, case_sensitive)
+    found = []
+    for path in paths:
+        if limit <= 0:
+            break
+        matches = _search_file(path, literal, fold, compiled, limit, text)
+        if matches:
+            found.append((path, matches))
+            limit -= len(matches)
+    return found
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Workers de busca, criados na primeira busca grande
+
+    Os workers não são criados com fork: o processo que busca tem outras
+    threads (servidor, tool calls) que podem estar segurando locks de
+    logging, sqlite ou do índice, e o filho herdaria esses locks travados.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=SEARCH_WORKERS,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _chain(first: List[List[str]], rest: Iterator[List[str]]) -> Iterator[List[str]]:
+    yield from first
+    yield from rest
+
+
+def iter_search(search_term: str, path: str = ".", file_pattern: str = "*",
+                regex: bool = False, case_sensitive: bool = False,
+                max_results: int = MAX_RESULTS, use_gitignore: bool = True,
+                hidden: bool = False, max_filesize: int = MAX_FILE_SIZE,
+                files: Optional[Iterable[str]] = None,
+                stats: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Gera ``(arquivo, ocorrência)`` à medida que são encontradas
+
+    Para depois de ``max_results`` ocorrências. ``files`` substitui a
+    varredura de ``path`` (ex: candidatos de um índice). ``stats``, se
+    passado, recebe ``files_searched`` e ``truncated``.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(files_searched=0, truncated=False)
+    # Valida o padrão antes de distribuir para os workers
+    _compile(search_term, regex, case_sensitive)
+
+    if files is None:
+        files = walk_files(path, file_pattern, use_gitignore, hidden, max_filesize)
+    remaining = max_results
+
+    def batches() -> Iterator[List[str]]:
+        batch = []
+        for file_path in files:
+            batch.append(file_path)
+            if len(batch) == FILES_PER_TASK:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    batch_iterator = batches()
+    first = []
+    for batch in batch_iterator:
+        first.append(batch)
+        if len(first) * FILES_PER_TASK >= PARALLEL_THRESHOLD:
+            break
+
+    all_batches = _chain(first, batch_iterator)
+    if SEARCH_WORKERS == 1 or len(first) * FILES_PER_TASK < PARALLEL_THRESHOLD:
+        for batch in all_batches:
+            stats["files_searched"] += len(batch)
+            for file_path, matches in _search_batch(batch, search_term, regex, case_sensitive, remaining):
+                for match in matches:
+                    yield file_path, match
+                remaining -= len(matches)
+            if remaining <= 0:
+                stats["truncated"] = True
+                return
+        return
+
+    # Janela de tarefas em andamento consumida em ordem: o resultado sai na
+    # ordem da árvore e a memória fica limitada
+    pool = _get_pool()
+    window = []
+    try:
+        while True:
+            while len(window) < SEARCH_WORKERS * 2:
+                batch = next(all_batches, None)
+                if batch is None:
+                    break
+                window.append((len(batch), pool.submit(
+                    _search_batch, batch, search_term, regex, case_sensitive, max_results
+                )))
+            if not window:
+                return
+            size, future = window.pop(0)
+            stats["files_searched"] += size
+            for file_path, matches in future.result():
+                for match in matches[:remaining]:
+                    yield file_path, match
+                remaining -= len(matches)
+                if remaining <= 0:
+                    stats["truncated"] = True
+                    return
+    finally:
+        for _, future in window:
+            future.cancel()
+
+
+def search_content(search_term: str, path: str = ".", file_pattern: str = "*",
+                   **options) -> Dict[str, Any]:
+    """Todas as ocorrências agrupadas por arquivo (formato de ``search_in_files``)"""
+    stats: Dict[str, Any] = {}
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    for file_path, match in iter_search(search_term, path, file_pattern, stats=stats, **options):
+        results.setdefault(file_path, []).append(match)
+    return {
+        "results": results,
+        "total_files_searched": stats["files_searched"],
+        "truncated": stats["truncated"]
+    }
@@ -0,0 +1,436 @@
+"""
+Índice de trigramas para busca em workspaces grandes
+
+Guarda, em um SQLite por diretório indexado, o conjunto de trigramas (3
+bytes consecutivos, com ASCII em minúsculas) de cada arquivo e, para cada
+trigrama, a lista de arquivos que o contêm. Uma busca extrai os trigramas
+que qualquer ocorrência precisa conter, cruza as listas e só verifica os
+arquivos candidatos com ``openagent.search``.
+
+O índice é atualizado de forma incremental: arquivos novos ou com mtime ou
+tamanho diferentes são reindexados e os removidos saem das listas. Além da
+verificação periódica da árvore toda, as ferramentas que escrevem arquivos
+marcam os caminhos alterados (``mark_dirty``) e eles são reindexados antes
+da próxima busca que os alcança. A primeira sincronização de um índice no
+processo roda em segundo plano; até ela terminar as buscas varrem a árvore
+normalmente.
+
+Cada trigrama é uma linha de ``postings`` com os ids dos arquivos em um
+único blob. A interseção na busca lê uma linha por trigrama, mas qualquer
+alteração regrava o blob inteiro de cada trigrama do arquivo: reindexar um
+arquivo custa a soma dos tamanhos das listas dos seus trigramas (4 bytes
+por arquivo que contém cada um), o que é dominado pelos trigramas comuns
+(ex: ``" th"``, ``"ion"``) em árvores grandes. Por isso as alterações de uma
+sincronização são agrupadas e cada lista é regravada uma vez por lote de
+``FLUSH_FILES`` arquivos, não uma vez por arquivo.
+"""
+
+import os
+import re
+import time
+import array
+import fnmatch
+import sqlite3
+import hashlib
+import threading
+import weakref
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterable, Set, Tuple
+
+from .search import (
+    walk_files, search_content, _get_pool,
+    MAX_RESULTS, BINARY_SNIFF, SEARCH_WORKERS, PARALLEL_THRESHOLD, FILES_PER_TASK
+)
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse, sre_constants
+
+# Segundos entre verificações de arquivos alterados antes de uma busca
+REFRESH_INTERVAL = 10.0
+
+# Arquivos reindexados por transação: limita a memória das listas
+# acumuladas e quantas vezes cada lista é regravada
+FLUSH_FILES = 2048
+
+_TRIGRAM = re.compile(b"...", re.DOTALL)
+
+# Índices abertos no processo, avisados por ``mark_dirty``
+_open_indexes: "weakref.WeakSet[TrigramIndex]" = weakref.WeakSet()
+
+
+def mark_dirty(*paths: str):
+    """Avisa os índices abertos que ``paths`` (arquivos ou diretórios) mudaram"""
+    for index in list(_open_indexes):
+        index.mark_dirty(*paths)
+
+
+def _within(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def _trigrams(data: bytes) -> Set[bytes]:
+    """Trigramas de um texto já em minúsculas"""
+    found = set(_TRIGRAM.findall(data))
+    found.update(_TRIGRAM.findall(data, 1))
+    found.update(_TRIGRAM.findall(data, 2))
+    return found
+
+
+def _file_trigrams(path: str) -> Optional[List[bytes]]:
+    """Trigramas de um arquivo (roda nos workers); binários não têm nenhum
+    mas ficam registrados para não serem relidos. None se não der para ler"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if b"\0" in data[:BINARY_SNIFF]:
+        return []
+    return list(_trigrams(data.lower()))
+
+
+def _pack(ids: Iterable[int]) -> bytes:
+    return array.array("I", sorted(ids)).tobytes()
+
+
+def _unpack(blob: Optional[bytes]) -> Set[int]:
+    if not blob:
+        return set()
+    ids = array.array("I")
+    ids.frombytes(blob)
+    return set(ids)
+
+
+def _literal_trigrams(literal: bytes, case_sensitive: bool) -> Set[bytes]:
+    """Trigramas obrigatórios de um literal
+
+    Sem diferenciar maiúsculas, trigramas com bytes não ASCII são
+    descartados: o índice só normaliza a caixa do ASCII.
+    """
+    trigrams = _trigrams(literal.lower())
+    if not case_sensitive:
+        trigrams = {t for t in trigrams if t.isascii()}
+    return trigrams
+
+
+def _regex_literals(pattern: str) -> Tuple[List[str], bool]:
+    """Trechos literais que toda ocorrência da regex contém
+
+    Só considera a sequência de nível mais alto: qualquer outro elemento
+    (classe, repetição, alternativa, grupo) interrompe o trecho atual.
+    Retorna também se a regex liga ``(?i)`` por conta própria.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return [], False
+
+    literals, current = [], []
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            literals.append("".join(current))
+            current = []
+    if current:
+        literals.append("".join(current))
+    return literals, bool(parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE)
+
+
+class TrigramIndex:
+    """Índice de trigramas persistente de um diretório"""
+
+    def __init__(self, root: str, index_dir: str, refresh_interval: float = REFRESH_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.refresh_interval = refresh_interval
+        Path(index_dir).mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(index_dir, f"trigrams-{name}.sqlite3")
+        self.last_update: Optional[float] = None
+        self.build_error: Optional[str] = None
+        self._lock = threading.Lock()
+        # Primeira sincronização, feita em segundo plano (veja ``search``)
+        self._build: Optional[threading.Thread] = None
+        # Caminhos alterados desde a última sincronização
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER, trigrams BLOB)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (trigram BLOB PRIMARY KEY, files BLOB)"
+        )
+        self._db.commit()
+        _open_indexes.add(self)
+
+    def close(self):
+        _open_indexes.discard(self)
+        with self._lock:
+            self._db.close()
+
+    def mark_dirty(self, *paths: str):
+        """Marca caminhos para serem verificados antes da próxima busca"""
+        with self._dirty_lock:
+            for path in paths:
+                path = os.path.abspath(os.path.expanduser(path))
+                if _within(path, self.root):
+                    self._dirty.add(path)
+                elif _within(self.root, path):
+                    self._dirty.add(self.root)
+
+    def update(self) -> Dict[str, int]:
+        """Sincroniza o índice com o disco (só relê arquivos alterados)"""
+        with self._dirty_lock:
+            self._dirty.clear()
+        report = self._sync([self.root])
+        self.last_update = time.time()
+        return report
+
+    def start_build(self) -> bool:
+        """Inicia a primeira sincronização em segundo plano (se ainda não começou)
+
+        Retorna True enquanto ela estiver em andamento. Se falhar, o erro fica
+        em ``build_error`` e a próxima busca tenta de novo.
+        """
+        with self._dirty_lock:
+            if self._build is not None and self._build.is_alive():
+                return True
+            if self.last_update is not None:
+                return False
+
+            def build():
+                try:
+                    self.update()
+                    self.build_error = None
+                except Exception as e:
+                    self.build_error = str(e)
+
+            self._build = threading.Thread(target=build, name="trigram-index", daemon=True)
+            self._build.start()
+            return True
+
+    def refresh(self, scope: Optional[str] = None) -> Dict[str, int]:
+        """Sincroniza os caminhos marcados que alcançam ``scope``
+
+        Um caminho marcado dentro de ``scope`` é verificado e sai da lista;
+        um acima dele (ex: o workspace inteiro, depois de um comando) só tem
+        ``scope`` verificado e continua marcado para as outras buscas.
+        """
+        scope = os.path.abspath(scope or self.root)
+        tops = []
+        with self._dirty_lock:
+            for path in list(self._dirty):
+                if _within(path, scope):
+                    tops.append(path)
+                    self._dirty.discard(path)
+                elif _within(scope, path):
+                    tops.append(scope)
+        # Caminhos dentro de outros já são cobertos por eles
+        tops = [path for path in set(tops) if not any(
+            other != path and _within(path, other) for other in tops
+        )]
+        if not tops:
+            return {"files": 0, "indexed": 0, "removed": 0}
+        return self._sync(sorted(tops))
+
+    def _sync(self, tops: List[str]) -> Dict[str, int]:
+        """Reindexa o que mudou sob ``tops`` (arquivos ou diretórios do root)
+
+        A caminhada de cada um segue as mesmas regras de ``.gitignore`` da
+        caminhada a partir do root.
+        """
+        with self._lock:
+            known = {
+                path: (file_id, mtime_ns, size)
+                for file_id, path, mtime_ns, size
+                in self._db.execute("SELECT id, path, mtime_ns, size FROM files")
+            }
+
+            changed = []
+            seen = set()
+            for top in tops:
+                for path in walk_files(top, base=self.root):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    seen.add(path)
+                    entry = known.get(path)
+                    if entry is None or entry[1:] != (stat.st_mtime_ns, stat.st_size):
+                        changed.append((path, stat))
+
+            removed = [
+                path for path in known
+                if path not in seen and any(_within(path, top) for top in tops)
+            ]
+            if changed or removed:
+                self._apply(known, changed, removed)
+            return {"files": len(seen), "indexed": len(changed), "removed": len(removed)}
+
+    def _apply(self, known: Dict[str, tuple], changed: List[tuple], removed: List[str]):
+        """Reindexa os arquivos em lotes de ``FLUSH_FILES``
+
+        Cada lote é uma transação que regrava uma única vez cada lista
+        afetada (veja o custo no docstring do módulo).
+        """
+        for start in range(0, max(len(changed), 1), FLUSH_FILES):
+            self._apply_batch(known, changed[start:start + FLUSH_FILES], removed if start == 0 else [])
+
+    def _apply_batch(self, known: Dict[str, tuple], changed: List[tuple], removed: List[str]):
+        additions: Dict[bytes, List[int]] = defaultdict(list)
+        deletions: Dict[bytes, List[int]] = defaultdict(list)
+
+        def forget(file_id: int):
+            row = self._db.execute("SELECT trigrams FROM files WHERE id = ?", (file_id,)).fetchone()
+            # Os trigramas do arquivo ficam concatenados (3 bytes cada)
+            for trigram in _TRIGRAM.findall(row[0] if row and row[0] else b""):
+                deletions[trigram].append(file_id)
+
+        for path in removed:
+            file_id = known[path][0]
+            forget(file_id)
+            self._db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+        paths = [path for path, _ in changed]
+        if SEARCH_WORKERS > 1 and len(paths) >= PARALLEL_THRESHOLD:
+            extracted = _get_pool().map(_file_trigrams, paths, chunksize=FILES_PER_TASK)
+        else:
+            extracted = map(_file_trigrams, paths)
+
+        for (path, stat), trigrams in zip(changed, extracted):
+            if trigrams is None:
+                continue
+
+            if path in known:
+                file_id = known[path][0]
+                forget(file_id)
+                self._db.execute(
+                    "UPDATE files SET mtime_ns = ?, size = ?, trigrams = ? WHERE id = ?",
+                    (stat.st_mtime_ns, stat.st_size, b"".join(trigrams), file_id)
+                )
+            else:
+                file_id = self._db.execute(
+                    "INSERT INTO files (path, mtime_ns, size, trigrams) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, b"".join(trigrams))
+                ).lastrowid
+                known[path] = (file_id, stat.st_mtime_ns, stat.st_size)
+            for trigram in trigrams:
+                additions[trigram].append(file_id)
+
+        for trigram in additions.keys() | deletions.keys():
+            row = self._db.execute("SELECT files FROM postings WHERE trigram = ?", (trigram,)).fetchone()
+            ids = _unpack(row[0] if row else None)
+            ids.difference_update(deletions.get(trigram, ()))
+            ids.update(additions.get(trigram, ()))
+            if ids:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO postings (trigram, files) VALUES (?, ?)", (trigram, _pack(ids))
+                )
+            else:
+                self._db.execute("DELETE FROM postings WHERE trigram = ?", (trigram,))
+        self._db.commit()
+
+    def required_trigrams(self, search_term: str, regex: bool, case_sensitive: bool) -> Set[bytes]:
+        """Trigramas que todo arquivo com uma ocorrência precisa ter"""
+        if not regex:
+            return _literal_trigrams(search_term.encode("utf-8"), case_sensitive)
+        literals, ignore_case = _regex_literals(search_term)
+        case_sensitive = case_sensitive and not ignore_case
+        trigrams: Set[bytes] = set()
+        for literal in literals:
+            trigrams |= _literal_trigrams(literal.encode("utf-8"), case_sensitive)
+        return trigrams
+
+    def candidates(self, search_term: str, regex: bool = False,
+                   case_sensitive: bool = False) -> Optional[List[str]]:
+        """Arquivos que podem conter o termo (None = o índice não ajuda)"""
+        trigrams = self.required_trigrams(search_term, regex, case_sensitive)
+        if not trigrams:
+            return None
+
+        with self._lock:
+            ids: Optional[Set[int]] = None
+            # Listas menores primeiro: a interseção encolhe rápido
+            rows = []
+            for trigram in trigrams:
+                row = self._db.execute("SELECT files FROM postings WHERE trigram = ?", (trigram,)).fetchone()
+                if row is None:
+                    return []
+                rows.append(row[0])
+            for blob in sorted(rows, key=len):
+                ids = _unpack(blob) if ids is None else ids & _unpack(blob)
+                if not ids:
+                    return []
+
+            paths = []
+            id_list = sorted(ids)
+            for start in range(0, len(id_list), 500):
+                chunk = id_list[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                paths.extend(
+                    path for (path,) in
+                    self._db.execute(f"SELECT path FROM files WHERE id IN ({marks})", chunk)
+                )
+        return sorted(paths)
+
+    def search(self, search_term: str, path: Optional[str] = None, file_pattern: str = "*",
+               regex: bool = False, case_sensitive: bool = False,
+               max_results: int = MAX_RESULTS) -> Dict[str, Any]:
+        """Busca usando o índice; mesmo formato de ``search_content``"""
+        scope = os.path.abspath(path or self.root)
+        if self.last_update is None:
+            # Construir o índice de uma árvore grande leva bem mais que uma
+            # busca sem ele: a primeira sincronização fica em segundo plano
+            self.start_build()
+            files = None
+        else:
+            if time.time() - self.last_update > self.refresh_interval:
+                self.update()
+            else:
+                self.refresh(scope)
+            files = self.candidates(search_term, regex, case_sensitive)
+
+        if files is None:
+            result = search_content(search_term, scope, file_pattern, regex=regex,
+                                    case_sensitive=case_sensitive, max_results=max_results)
+            result["indexed"] = False
+            return result
+
+        prefix = scope.rstrip(os.sep) + os.sep
+        files = [
+            file_path for file_path in files
+            if (file_path == scope or file_path.startswith(prefix))
+            and fnmatch.fnmatch(os.path.basename(file_path), file_pattern)
+        ]
+        result = search_content(search_term, scope, file_pattern, regex=regex,
+                                case_sensitive=case_sensitive, max_results=max_results,
+                                files=files)
+        result["indexed"] = True
+        result["candidates"] = len(files)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        building = self._build is not None and self._build.is_alive()
+        files = trigrams = None
+        # Durante a construção o lock fica com ela; as contagens ficam de fora
+        if not building:
+            with self._lock:
+                files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                trigrams = self._db.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        return {
+            "root": self.root,
+            "db_path": self.db_path,
+            "files": files,
+            "trigrams": trigrams,
+            "last_update": self.last_update,
+            "building": building,
+            "build_error": self.build_error,
+        }
@@ -0,0 +1,466 @@
+"""
+Sessão de shell persistente para ``execute_command``
+
+Em vez de abrir um shell novo a cada comando, o agente mantém um ``bash``
+vivo e envia os comandos pela entrada padrão. Assim ``cd``, variáveis
+exportadas e ambientes virtuais ativados continuam valendo nos comandos
+seguintes, e cada comando não paga a inicialização do shell.
+
+O fim da saída de cada comando é marcado por uma sentinela aleatória
+impressa em stdout e stderr logo depois dele. Se a sentinela não chegar
+dentro do timeout (comando travado ou esperando entrada), o shell é morto
+e recriado no próximo comando.
+
+A saída é lida aos poucos: cada pedaço pode ser repassado a quem chamou
+(``on_output``) e só o começo e o fim dela ficam em memória
+(``OutputCapture``), com a opção de gravar a saída em um arquivo no
+diretório privado do processo (também limitado, e apagado quando a sessão
+é encerrada).
+"""
+
+import os
+import sys
+import time
+import uuid
+import atexit
+import codecs
+import shutil
+import shlex
+import signal
+import tempfile
+import selectors
+import threading
+import subprocess
+from collections import deque
+from typing import Dict, Optional, Any, Callable, Iterable, List
+
+# Bytes de saída de um comando mantidos para o modelo (metade do começo,
+# metade do fim)
+OUTPUT_LIMIT = 64 * 1024
+
+# Bytes gravados por arquivo de saída (metade do começo, metade do fim)
+SPILL_LIMIT = 8 * 1024 * 1024
+
+# Arquivos de saída mantidos no processo; os mais antigos são apagados
+SPILL_KEEP = 16
+
+# Recebe (stream, texto) a cada pedaço de saída: stream é "stdout" ou "stderr"
+OutputCallback = Callable[[str, str], None]
+
+_spill_lock = threading.Lock()
+_spill_dir: Optional[str] = None
+_spill_files: "deque[str]" = deque()
+
+
+def spill_dir() -> str:
+    """Diretório privado (0700) do processo para os arquivos de saída
+
+    Criado na primeira vez que uma saída é gravada e apagado na saída do
+    processo.
+    """
+    global _spill_dir
+    with _spill_lock:
+        if _spill_dir is None:
+            _spill_dir = tempfile.mkdtemp(prefix="openagent-output-")
+            atexit.register(shutil.rmtree, _spill_dir, True)
+        return _spill_dir
+
+
+def _track_spill_file(path: str):
+    with _spill_lock:
+        _spill_files.append(path)
+        while len(_spill_files) > SPILL_KEEP:
+            _unlink(_spill_files.popleft())
+
+
+def remove_spill_files(paths: Iterable[str]):
+    """Apaga arquivos de saída que não serão mais lidos"""
+    with _spill_lock:
+        for path in paths:
+            if path in _spill_files:
+                _spill_files.remove(path)
+            _unlink(path)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class OutputCapture:
+    """Saída de um stream com memória limitada
+
+    Guarda os primeiros e os últimos ``limit / 2`` bytes; o meio é contado
+    e descartado. Com ``spill``, a saída vai para um arquivo em
+    ``spill_dir()`` assim que passa do limite; o arquivo também é limitado
+    (``spill_limit``: o começo vai direto para o disco e só o fim fica em
+    memória até o fechamento).
+    """
+
+    def __init__(self, name: str, limit: int = OUTPUT_LIMIT, spill: bool = False,
+                 on_output: Optional[OutputCallback] = None, spill_limit: int = SPILL_LIMIT):
+        self.name = name
+        self.limit = max(limit, 2)
+        self.spill = spill
+        self.spill_limit = max(spill_limit, self.limit)
+        self.on_output = on_output
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.path: Optional[str] = None
+        self._file = None
+        self._spilled = 0
+        self._spill_tail = bytearray()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + len(self.tail)
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.total += len(data)
+
+        if self.on_output is not None:
+            text = self._decoder.decode(data)
+            if text:
+                self.on_output(self.name, text)
+
+        if self._file is not None:
+            self._spill(data)
+        elif self.spill and self.total > self.limit:
+            fd, self.path = tempfile.mkstemp(prefix=f"{self.name}-", suffix=".log", dir=spill_dir())
+            self._file = os.fdopen(fd, "wb")
+            _track_spill_file(self.path)
+            # Até aqui nada foi descartado: head + tail é a saída inteira
+            self._spill(bytes(self.head + self.tail) + data)
+
+        half = self.limit // 2
+        if len(self.head) < half:
+            take = half - len(self.head)
+            self.head += data[:take]
+            data = data[take:]
+        self.tail += data
+        if len(self.tail) > self.limit - half:
+            del self.tail[:len(self.tail) - (self.limit - half)]
+
+    def _spill(self, data: bytes):
+        half = self.spill_limit // 2
+        if self._spilled < half:
+            take = half - self._spilled
+            self._file.write(data[:take])
+            self._spilled += len(data[:take])
+            data = data[take:]
+        if data:
+            self._spill_tail += data
+            if len(self._spill_tail) > self.spill_limit - half:
+                del self._spill_tail[:len(self._spill_tail) - (self.spill_limit - half)]
+
+    @property
+    def spill_complete(self) -> bool:
+        """O arquivo tem a saída inteira (não passou de ``spill_limit``)"""
+        return self.total <= self.spill_limit
+
+    def close(self):
+        if self._file is not None:
+            omitted = self.total - self._spilled - len(self._spill_tail)
+            if omitted > 0:
+                self._file.write(f"\n... [{omitted} bytes omitidos] ...\n".encode("utf-8"))
+            self._file.write(self._spill_tail)
+            self._spill_tail = bytearray()
+            self._file.close()
+            self._file = None
+
+    def text(self) -> str:
+        """Saída capturada; se truncada, começo e fim com um aviso no meio"""
+        head = self.head.decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + self.tail.decode("utf-8", errors="replace")
+        omitted = self.total - len(self.head) - len(self.tail)
+        notice = f"\n... [{omitted} bytes omitidos"
+        if self.path:
+            kept = "completa" if self.spill_complete else "com começo e fim"
+            notice += f"; saída {kept} em {self.path}"
+        notice += "] ...\n"
+        return head + notice + self.tail.decode("utf-8", errors="replace")
+
+    def summary(self, result: Dict[str, Any]):
+        """Preenche ``result[name]`` e, se truncada, os metadados da captura"""
+        self.close()
+        result[self.name] = self.text()
+        if self.truncated:
+            result[f"{self.name}_bytes"] = self.total
+            result[f"{self.name}_truncated"] = True
+            if self.path:
+                result[f"{self.name}_file"] = self.path
+
+
+class ShellSession:
+    """Um ``bash`` de longa duração que executa comandos em sequência"""
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.shell = shell or shutil.which("bash")
+        # Último diretório reportado pelo shell; um shell reiniciado começa nele
+        self.cwd = os.path.abspath(cwd) if cwd else os.getcwd()
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.commands = 0
+        self.restarts = 0
+        # Arquivos de saída gravados pelos comandos desta sessão
+        self.spill_files: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """Sessões persistentes dependem de pipes selecionáveis (POSIX) e do bash"""
+        return sys.platform != "win32" and bool(self.shell)
+
+    def _alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _start(self):
+        if self.process is not None:
+            self.restarts += 1
+        if not os.path.isdir(self.cwd):
+            # O diretório foi removido desde o último comando
+            self.cwd = os.getcwd()
+        self.process = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            bufsize=0,
+            # Grupo próprio: um timeout mata também os filhos do comando
+            start_new_session=True
+        )
+
+    def close(self):
+        """Encerra o shell (o próximo comando abre outro) e apaga os arquivos de saída"""
+        with self._lock:
+            self._kill()
+            remove_spill_files(self.spill_files)
+            self.spill_files = []
+
+    def _kill(self):
+        if self.process is None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process.wait()
+
+    def run(self, command: str, timeout: float = 30, limit: int = OUTPUT_LIMIT,
+            spill: bool = False, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """Executa ``command`` no shell e espera até a sentinela ou o timeout
+
+        A saída é repassada a ``on_output`` enquanto é produzida e capturada
+        com até ``limit`` bytes por stream (ver ``OutputCapture``).
+        """
+        with self._lock:
+            if not self._alive():
+                self._start()
+            self.commands += 1
+
+            marker = f"__openagent_{uuid.uuid4().hex}__"
+            # O comando vai entre aspas para o eval, que roda no próprio shell
+            # (preserva cd/export): aspas ou heredocs desbalanceados e chaves
+            # soltas viram erro de sintaxe dentro do eval, sem engolir a
+            # sentinela. A entrada vem de /dev/null para o comando não
+            # consumir os próximos comandos
+            script = (
+                f"eval {shlex.quote(command)} </dev/null\n"
+                f"__openagent_rc=$?\n"
+                f"printf '%s %d %s\\n' '{marker}' \"$__openagent_rc\" \"$PWD\"\n"
+                f"printf '%s\\n' '{marker}' >&2\n"
+            )
+            try:
+                self.process.stdin.write(script.encode("utf-8"))
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._kill()
+                return {"success": False, "error": f"Shell encerrado: {e}", "command": command}
+
+            captures = {
+                name: OutputCapture(name, limit=limit, spill=spill, on_output=on_output)
+                for name in ("stdout", "stderr")
+            }
+            finished = self._collect(marker.encode("utf-8"), timeout, captures)
+
+            if finished is None:
+                self._kill()
+                result = {
+                    "success": False,
+                    "error": f"Comando excedeu o tempo limite de {timeout} segundos "
+                             f"(sessão de shell reiniciada)",
+                    "command": command
+                }
+            else:
+                if finished is False:
+                    # O comando encerrou o shell (ex: ``exit``)
+                    returncode = self.process.wait()
+                    self._kill()
+                    cwd = None
+                else:
+                    returncode, cwd = finished
+                    self.cwd = cwd or self.cwd
+                result = {
+                    "success": returncode == 0,
+                    "returncode": returncode,
+                    "command": command,
+                    "cwd": cwd
+                }
+
+            for capture in captures.values():
+                capture.summary(result)
+                if capture.path:
+                    self.spill_files.append(capture.path)
+            return result
+
+    def resolve(self, path: str) -> str:
+        """Caminho absoluto de ``path`` relativo ao diretório atual do shell"""
+        return os.path.normpath(os.path.join(self.cwd, os.path.expanduser(path)))
+
+    def change_directory(self, path: str) -> str:
+        """Muda o diretório do shell (e dos próximos comandos) sem depender de ``cd``
+
+        Retorna o novo diretório; se o shell já estiver rodando, o ``cd`` é
+        executado nele para preservar o restante do seu estado.
+        """
+        target = self.resolve(path)
+        if not os.path.isdir(target):
+            raise NotADirectoryError(f"Diretório não encontrado: {target}")
+        if self._alive():
+            result = self.run(f"cd -- {shlex.quote(target)}")
+            if not result.get("success"):
+                raise OSError(result.get("error") or result.get("stderr") or f"cd falhou: {target}")
+        self.cwd = target
+        return target
+
+    def _collect(self, marker: bytes, timeout: float, captures: Dict[str, OutputCapture]):
+        """Lê stdout e stderr até a sentinela aparecer nos dois
+
+        Só os últimos bytes de cada stream (onde a sentinela pode estar
+        começando) ficam retidos; o resto vai direto para a captura.
+        Retorna ``(returncode, cwd)``, ``False`` se o shell terminou ou
+        ``None`` em caso de timeout.
+        """
+        pending = {"stdout": bytearray(), "stderr": bytearray()}
+        status = None
+        deadline = time.monotonic() + timeout
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, "stdout")
+            selector.register(self.process.stderr, selectors.EVENT_READ, "stderr")
+
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    for name, data in pending.items():
+                        captures[name].write(bytes(data))
+                    return None
+
+                for key, _ in selector.select(timeout=remaining):
+                    name = key.data
+                    chunk = os.read(key.fileobj.fileno(), 65536)
+                    if not chunk:
+                        for name, data in pending.items():
+                            captures[name].write(bytes(data))
+                        return False
+
+                    buffer = pending[name]
+                    buffer += chunk
+                    index = buffer.find(marker)
+                    if index >= 0 and b"\n" in buffer[index:]:
+                        captures[name].write(bytes(buffer[:index]))
+                        if name == "stdout":
+                            status = bytes(buffer[index + len(marker):]).split(b"\n", 1)[0]
+                        pending[name] = bytearray()
+                        selector.unregister(key.fileobj)
+                    elif index < 0:
+                        keep = len(marker) - 1
+                        if len(buffer) > keep:
+                            captures[name].write(bytes(buffer[:-keep]))
+                            del buffer[:-keep]
+
+        returncode, _, cwd = status.decode("utf-8", errors="replace").strip().partition(" ")
+        return int(returncode), cwd
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado do shell e contadores de comandos e reinícios"""
+        return {
+            "shell": self.shell,
+            "alive": self._alive(),
+            "pid": self.process.pid if self._alive() else None,
+            "cwd": self.cwd,
+            "commands": self.commands,
+            "restarts": self.restarts,
+        }
+
+
+def run_process(command, shell: bool = True, timeout: float = 30, limit: int = OUTPUT_LIMIT,
+                spill: bool = False, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+    """Executa um comando em um processo próprio, com a mesma captura limitada
+
+    Usado sem sessão persistente (ou onde ela não existe, como no Windows).
+    Cada stream é lido por uma thread; ``on_output`` é chamado com um lock,
+    um pedaço por vez.
+    """
+    process = subprocess.Popen(
+        command,
+        shell=shell,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL
+    )
+    lock = threading.Lock()
+
+    def forward(stream: str, text: str):
+        with lock:
+            on_output(stream, text)
+
+    captures = {
+        name: OutputCapture(name, limit=limit, spill=spill,
+                            on_output=forward if on_output is not None else None)
+        for name in ("stdout", "stderr")
+    }
+
+    def pump(name: str, pipe):
+        for chunk in iter(lambda: pipe.read1(65536), b""):
+            captures[name].write(chunk)
+
+    readers = [
+        threading.Thread(target=pump, args=(name, getattr(process, name)), daemon=True)
+        for name in captures
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        returncode = process.wait(timeout=timeout)
+        result = {"success": returncode == 0, "returncode": returncode, "command": command}
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        result = {
+            "success": False,
+            "error": f"Comando excedeu o tempo limite de {timeout} segundos",
+            "command": command
+        }
+
+    for reader in readers:
+        reader.join(timeout=1)
+    for capture in captures.values():
+        capture.summary(result)
+    return result
@@ -0,0 +1,95 @@
+"""
+Sequências de parada (``stop``) durante a geração em streaming
+
+As sequências são compiladas em um autômato de Aho-Corasick: cada caractere
+gerado avança o autômato uma vez, sem reexaminar o texto já produzido. Só é
+retido o menor trecho final que ainda pode ser o começo de uma sequência;
+todo o resto pode ser enviado ao cliente imediatamente.
+"""
+
+from collections import deque
+from typing import Dict, List, Tuple, Iterable
+
+
+class StopSequenceMatcher:
+    """Detecta incrementalmente a primeira ocorrência de qualquer sequência"""
+
+    def __init__(self, sequences: Iterable[str]):
+        self.sequences = [s for s in sequences if s]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Comprimento do caminho até o estado (= tamanho do trecho retido)
+        self._depth: List[int] = [0]
+        # Maior sequência que termina neste estado (0 = nenhuma)
+        self._match: List[int] = [0]
+        self._build()
+
+        self._state = 0
+        self._held = ""
+        self.stopped = False
+
+    def _build(self):
+        for sequence in self.sequences:
+            state = 0
+            for char in sequence:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._depth.append(self._depth[state] + 1)
+                    self._match.append(0)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._match[state] = max(self._match[state], len(sequence))
+
+        # Links de falha em largura: cada estado herda as ocorrências do
+        # maior sufixo próprio que também é prefixo de alguma sequência
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._match[child] = max(self._match[child], self._match[self._fail[child]])
+                queue.append(child)
+
+    def _step(self, char: str) -> int:
+        state = self._state
+        while state and char not in self._goto[state]:
+            state = self._fail[state]
+        self._state = self._goto[state].get(char, 0)
+        return self._state
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """Processa um pedaço gerado
+
+        Retorna o texto que já pode ser enviado e se uma sequência de parada
+        foi encontrada (nesse caso o texto vai até o início da ocorrência e
+        a geração deve parar).
+        """
+        if self.stopped:
+            return "", True
+
+        released = []
+        for char in text:
+            state = self._step(char)
+            self._held += char
+
+            if self._match[state]:
+                self.stopped = True
+                released.append(self._held[:len(self._held) - self._match[state]])
+                self._held = ""
+                return "".join(released), True
+
+            keep = self._depth[state]
+            if len(self._held) > keep:
+                released.append(self._held[:len(self._held) - keep])
+                self._held = self._held[len(self._held) - keep:]
+
+        return "".join(released), False
+
+    def flush(self) -> str:
+        """Libera o trecho retido ao final da geração"""
+        held, self._held = self._held, ""
+        return "" if self.stopped else held
@@ -1,23 +1,66 @@
 import os
+import re
 import json
-import subprocess
 import shutil
-import glob
+import fnmatch
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Tuple
 import base64
 from PIL import Image
 import io
 
+from .file_reader import FileCache, read_range, READ_LIMIT
+from .search import search_content, find_files, MAX_RESULTS
+from .search_index import TrigramIndex, mark_dirty
+from .shell import ShellSession, OutputCallback, OUTPUT_LIMIT, run_process
+
+# Máximo de tool calls de um mesmo turno executadas ao mesmo tempo
+TOOL_WORKERS = 8
+
+# Entradas devolvidas por página em list_directory
+LIST_LIMIT = 1000
+
+# Bytes (base64) de imagens codificadas mantidos em cache
+IMAGE_CACHE_BUDGET = 32 * 1024 * 1024
+
+# Acima desta redução, resample="auto" usa bilinear em vez de Lanczos
+FAST_RESAMPLE_FACTOR = 4
+
+EXIF_ORIENTATION = 0x0112
+
+def _invalidate_cached(*paths: str):
+    """Descarta o que os caches de arquivos e de imagens guardam de ``paths``
+    e marca os caminhos para reindexação nos índices de busca abertos"""
+    for path in paths:
+        FileSystemTools.cache.invalidate(path)
+        MediaTools.cache.invalidate(path)
+    mark_dirty(*paths)
+
 class FileSystemTools:
     """Ferramentas para manipulação de arquivos e diretórios"""
     
+    # Conteúdo de arquivos lidos, compartilhado entre turnos e agentes do
+    # processo; as escritas feitas por estas ferramentas o invalidam
+    cache = FileCache()
+    
     @staticmethod
-    def read_file(path: str, encoding: str = "utf-8") -> str:
-        """Lê o conteúdo de um arquivo"""
+    def read_file(path: str, encoding: str = "utf-8", start_line: Optional[int] = None,
+                  end_line: Optional[int] = None, byte_offset: Optional[int] = None,
+                  byte_count: Optional[int] = None, max_bytes: int = READ_LIMIT) -> Union[str, Dict[str, Any]]:
+        """Lê o conteúdo de um arquivo
+
+        Arquivos de até ``max_bytes`` são devolvidos inteiros, como texto.
+        Com um intervalo de linhas ou bytes (ou em arquivos maiores) devolve
+        um dicionário com o trecho lido e o tamanho do arquivo; só o trecho
+        é carregado na memória (ver ``openagent.file_reader``). Leituras
+        inteiras são servidas do ``cache`` enquanto o arquivo não muda.
+        """
         try:
-            with open(path, "r", encoding=encoding) as f:
-                return f.read()
+            return read_range(path, encoding, start_line, end_line, byte_offset, byte_count,
+                              max_bytes, cache=FileSystemTools.cache)
         except Exception as e:
             return f"Erro ao ler arquivo: {str(e)}"
     
@@ -31,6 +74,8 @@ class FileSystemTools:
             return f"Arquivo criado com sucesso: {os.path.abspath(path)}"
         except Exception as e:
             return f"Erro ao criar arquivo: {str(e)}"
+        finally:
+            _invalidate_cached(path)
     
     @staticmethod
     def append_file(path: str, content: str, encoding: str = "utf-8") -> str:
@@ -42,6 +87,8 @@ class FileSystemTools:
             return f"Conteúdo adicionado ao arquivo: {os.path.abspath(path)}"
         except Exception as e:
             return f"Erro ao adicionar conteúdo: {str(e)}"
+        finally:
+            _invalidate_cached(path)
     
     @staticmethod
     def delete_file(path: str) -> str:
@@ -54,35 +101,92 @@ class FileSystemTools:
                 return f"Arquivo não encontrado: {path}"
         except Exception as e:
             return f"Erro ao excluir arquivo: {str(e)}"
+        finally:
+            _invalidate_cached(path)
     
     @staticmethod
-    def list_directory(path: str = ".", show_hidden: bool = False) -> Dict[str, Any]:
-        """Lista conteúdo de um diretório"""
+    def list_directory(path: str = ".", show_hidden: bool = False, depth: int = 1,
+                       ignore: Optional[List[str]] = None, offset: int = 0,
+                       limit: int = LIST_LIMIT, format: str = "entries") -> Dict[str, Any]:
+        """Lista conteúdo de um diretório
+
+        Com ``depth`` > 1 desce recursivamente (sem seguir links simbólicos
+        de diretórios). Entradas cujo nome casa com algum padrão de
+        ``ignore`` são puladas, junto com o conteúdo. A listagem é ordenada
+        (diretórios primeiro, cada diretório seguido do seu conteúdo) e
+        paginada por ``offset``/``limit``; só as entradas da página são
+        consultadas com ``stat``. ``format="tree"`` devolve a página como
+        texto indentado, bem mais compacto para diretórios enormes.
+        """
         try:
             if not os.path.exists(path):
                 return {"error": f"Diretório não encontrado: {path}"}
             
+            ignore = ignore or []
+            
+            def visible(entry: os.DirEntry) -> bool:
+                if not show_hidden and entry.name.startswith('.'):
+                    return False
+                return not any(fnmatch.fnmatch(entry.name, pattern) for pattern in ignore)
+            
+            def order(entry: os.DirEntry):
+                return (not entry.is_dir(), entry.name.lower())
+            
+            # (nível, entrada) em pré-ordem; is_dir() vem do próprio scandir
+            listing = []
+            
+            def walk(directory: str, level: int):
+                with os.scandir(directory) as iterator:
+                    entries = sorted(filter(visible, iterator), key=order)
+                for entry in entries:
+                    listing.append((level, entry))
+                    if level < depth and entry.is_dir(follow_symlinks=False):
+                        try:
+                            walk(entry.path, level + 1)
+                        except OSError:
+                            continue
+            
+            walk(path, 1)
+            
+            offset = max(offset, 0)
+            page = listing[offset:offset + max(limit, 0)]
+            result = {
+                "path": os.path.abspath(path),
+                "total": len(listing),
+                "offset": offset,
+                "truncated": offset + len(page) < len(listing)
+            }
+            if result["truncated"]:
+                result["next_offset"] = offset + len(page)
+            
+            if format == "tree":
+                result["tree"] = "\n".join(
+                    "  " * (level - 1) + entry.name + ("/" if entry.is_dir() else "")
+                    for level, entry in page
+                )
+                return result
+            
             items = []
-            for item in os.listdir(path):
-                if not show_hidden and item.startswith('.'):
+            for level, entry in page:
+                try:
+                    stat = entry.stat()
+                except OSError:
                     continue
-                
-                item_path = os.path.join(path, item)
-                stat = os.stat(item_path)
-                
-                items.append({
-                    "name": item,
-                    "path": item_path,
-                    "type": "directory" if os.path.isdir(item_path) else "file",
+                is_dir = entry.is_dir()
+                item = {
+                    "name": entry.name,
+                    "path": entry.path,
+                    "type": "directory" if is_dir else "file",
                     "size": stat.st_size,
                     "modified": stat.st_mtime,
-                    "extension": os.path.splitext(item)[1] if os.path.isfile(item_path) else None
-                })
+                    "extension": os.path.splitext(entry.name)[1] if entry.is_file() else None
+                }
+                if depth > 1:
+                    item["depth"] = level
+                items.append(item)
             
-            return {
-                "path": os.path.abspath(path),
-                "items": sorted(items, key=lambda x: (x["type"] == "file", x["name"].lower()))
-            }
+            result["items"] = items
+            return result
         except Exception as e:
             return {"error": f"Erro ao listar diretório: {str(e)}"}
     
@@ -110,6 +214,8 @@ class FileSystemTools:
                 return f"Diretório excluído: {path}"
         except Exception as e:
             return f"Erro ao excluir diretório: {str(e)}"
+        finally:
+            _invalidate_cached(path)
     
     @staticmethod
     def copy_file(source: str, destination: str) -> str:
@@ -120,6 +226,8 @@ class FileSystemTools:
             return f"Arquivo copiado de {source} para {destination}"
         except Exception as e:
             return f"Erro ao copiar arquivo: {str(e)}"
+        finally:
+            _invalidate_cached(destination)
     
     @staticmethod
     def move_file(source: str, destination: str) -> str:
@@ -130,36 +238,33 @@ class FileSystemTools:
             return f"Arquivo movido de {source} para {destination}"
         except Exception as e:
             return f"Erro ao mover arquivo: {str(e)}"
+        finally:
+            _invalidate_cached(source, destination)
 
 class SystemTools:
     """Ferramentas de sistema e execução de comandos"""
     
     @staticmethod
-    def execute_command(command: str, shell: bool = True, timeout: int = 30) -> Dict[str, Any]:
-        """Executa um comando do sistema"""
+    def execute_command(command: str, shell: bool = True, timeout: int = 30,
+                        session: Optional[ShellSession] = None,
+                        max_output: int = OUTPUT_LIMIT, spill: bool = False,
+                        on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """Executa um comando do sistema
+
+        Com ``session``, o comando roda no shell persistente da sessão
+        (diretório e variáveis de ambiente se mantêm entre chamadas).
+        A saída é repassada a ``on_output`` enquanto o comando roda e só
+        ``max_output`` bytes de cada stream (começo e fim) são retornados;
+        com ``spill``, a saída de um stream truncado (até ``SPILL_LIMIT``
+        bytes, começo e fim) é gravada em arquivo e o caminho volta em
+        ``stdout_file``/``stderr_file``.
+        """
         try:
-            result = subprocess.run(
-                command,
-                shell=shell,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                encoding='utf-8'
-            )
-            
-            return {
-                "success": result.returncode == 0,
-                "returncode": result.returncode,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "command": command
-            }
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "error": f"Comando excedeu o tempo limite de {timeout} segundos",
-                "command": command
-            }
+            if session is not None and shell and session.available:
+                return session.run(command, timeout=timeout, limit=max_output,
+                                   spill=spill, on_output=on_output)
+            return run_process(command, shell=shell, timeout=timeout, limit=max_output,
+                               spill=spill, on_output=on_output)
         except Exception as e:
             return {
                 "success": False,
@@ -195,14 +300,21 @@ class SystemTools:
             return {"error": f"Erro ao obter informações do sistema: {str(e)}"}
     
     @staticmethod
-    def get_working_directory() -> str:
-        """Retorna o diretório de trabalho atual"""
-        return os.getcwd()
+    def get_working_directory(session: Optional[ShellSession] = None) -> str:
+        """Retorna o diretório de trabalho atual (o do shell da sessão, se houver)"""
+        return session.cwd if session is not None else os.getcwd()
     
     @staticmethod
-    def change_directory(path: str) -> str:
-        """Muda o diretório de trabalho"""
+    def change_directory(path: str, session: Optional[ShellSession] = None) -> str:
+        """Muda o diretório de trabalho
+
+        Com ``session``, muda o diretório do shell persistente, que é também
+        a base dos caminhos relativos das ferramentas de arquivo do
+        ``ToolRegistry``; o diretório do processo não é alterado.
+        """
         try:
+            if session is not None:
+                return f"Diretório alterado para: {session.change_directory(path)}"
             os.chdir(path)
             return f"Diretório alterado para: {os.getcwd()}"
         except Exception as e:
@@ -211,37 +323,77 @@ class SystemTools:
 class MediaTools:
     """Ferramentas para processamento de mídia"""
     
+    # Imagens já codificadas, por arquivo e parâmetros de conversão
+    cache = FileCache(budget=IMAGE_CACHE_BUDGET)
+    
     @staticmethod
-    def encode_image_to_base64(image_path: str, max_size: tuple = (1024, 1024)) -> Dict[str, Any]:
-        """Codifica uma imagem para base64"""
+    def encode_image_to_base64(image_path: str, max_size: tuple = (1024, 1024),
+                               resample: str = "auto") -> Dict[str, Any]:
+        """Codifica uma imagem para base64
+
+        O resultado fica em cache enquanto o arquivo não muda. JPEGs são
+        decodificados direto em escala reduzida (modo draft) e os que já
+        cabem em ``max_size`` são enviados sem recodificar. ``resample``:
+        ``lanczos`` (melhor qualidade), ``bilinear`` (mais rápido) ou
+        ``auto`` (bilinear em reduções de mais de ``FAST_RESAMPLE_FACTOR``
+        vezes, em que a diferença não aparece).
+        """
         try:
             if not os.path.exists(image_path):
                 return {"error": f"Arquivo de imagem não encontrado: {image_path}"}
             
+            stat = os.stat(image_path)
+            max_size = tuple(max_size)
+            variant = f"jpeg:{max_size[0]}x{max_size[1]}:{resample}"
+            cached = MediaTools.cache.get(image_path, variant, stat)
+            if cached is not None:
+                return dict(cached, cached=True)
+            
             with Image.open(image_path) as img:
-                # Redimensiona se necessário
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                
-                # Converte para RGB se necessário
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Salva em buffer
-                buffer = io.BytesIO()
-                img.save(buffer, format='JPEG', quality=85)
-                buffer.seek(0)
-                
-                # Codifica para base64
-                img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                return {
-                    "success": True,
-                    "base64": img_base64,
-                    "format": "JPEG",
-                    "size": img.size,
-                    "original_size": os.path.getsize(image_path),
-                    "encoded_size": len(img_base64)
-                }
+                fits = img.width <= max_size[0] and img.height <= max_size[1]
+                if (img.format == 'JPEG' and img.mode == 'RGB' and fits
+                        and img.getexif().get(EXIF_ORIENTATION, 1) == 1):
+                    # Já é um JPEG do tamanho certo: envia o arquivo como está
+                    with open(image_path, 'rb') as f:
+                        encoded = f.read()
+                    size = img.size
+                else:
+                    if img.format == 'JPEG':
+                        # Decodifica já reduzido (1/2, 1/4 ou 1/8), sem passar do alvo
+                        img.draft('RGB', max_size)
+                    
+                    factor = max(img.width / max_size[0], img.height / max_size[1])
+                    if resample == "bilinear" or (resample == "auto" and factor > FAST_RESAMPLE_FACTOR):
+                        method = Image.Resampling.BILINEAR
+                    else:
+                        method = Image.Resampling.LANCZOS
+                    
+                    # Redimensiona se necessário
+                    img.thumbnail(max_size, method)
+                    
+                    # Converte para RGB se necessário
+                    if img.mode != 'RGB':
+                        img = img.convert('RGB')
+                    
+                    # Salva em buffer
+                    buffer = io.BytesIO()
+                    img.save(buffer, format='JPEG', quality=85)
+                    encoded = buffer.getvalue()
+                    size = img.size
+            
+            # Codifica para base64
+            img_base64 = base64.b64encode(encoded).decode('utf-8')
+            
+            result = {
+                "success": True,
+                "base64": img_base64,
+                "format": "JPEG",
+                "size": size,
+                "original_size": stat.st_size,
+                "encoded_size": len(img_base64)
+            }
+            MediaTools.cache.put(image_path, variant, stat, result, cost=len(img_base64))
+            return dict(result, cached=False)
         except Exception as e:
             return {"error": f"Erro ao processar imagem: {str(e)}"}
     
@@ -267,54 +419,76 @@ class SearchTools:
     """Ferramentas de busca"""
     
     @staticmethod
-    def search_files(pattern: str, path: str = ".", recursive: bool = True) -> List[str]:
-        """Busca arquivos por padrão"""
+    def search_files(pattern: Union[str, List[str]], path: str = ".", recursive: bool = True,
+                     max_results: int = MAX_RESULTS, sort: str = "name") -> List[str]:
+        """Busca arquivos por padrão
+
+        Aceita um padrão ou uma lista deles. Não desce em diretórios
+        ignorados (``.gitignore``, ``.git``, ``node_modules``, ambientes
+        virtuais...) e para em ``max_results``. ``sort="mtime"`` devolve os
+        mais recentes primeiro (nesse caso a árvore é percorrida inteira).
+        """
         try:
-            if recursive:
-                search_pattern = os.path.join(path, "**", pattern)
-                return glob.glob(search_pattern, recursive=True)
-            else:
-                search_pattern = os.path.join(path, pattern)
-                return glob.glob(search_pattern)
+            matches = find_files(pattern, path, recursive)
+            if sort == "mtime":
+                def modified(file_path: str) -> float:
+                    try:
+                        return os.stat(file_path).st_mtime
+                    except OSError:
+                        return 0.0
+                return sorted(matches, key=modified, reverse=True)[:max_results]
+            return list(itertools.islice(matches, max_results))
         except Exception as e:
             return [f"Erro na busca: {str(e)}"]
     
     @staticmethod
-    def search_in_files(search_term: str, path: str = ".", file_pattern: str = "*") -> Dict[str, List[Dict[str, Any]]]:
-        """Busca texto dentro de arquivos"""
+    def search_in_files(search_term: str, path: str = ".", file_pattern: str = "*",
+                        regex: bool = False, case_sensitive: bool = False,
+                        max_results: int = MAX_RESULTS,
+                        index: Optional[TrigramIndex] = None) -> Dict[str, Any]:
+        """Busca texto dentro de arquivos
+
+        Respeita ``.gitignore`` e ignora arquivos binários e muito grandes
+        (ver ``openagent.search``). Com ``index``, só os arquivos candidatos
+        do índice de trigramas são lidos.
+        """
         try:
-            results = {}
-            files = SearchTools.search_files(file_pattern, path)
-            
-            for file_path in files:
-                if os.path.isfile(file_path):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            lines = f.readlines()
-                            
-                            matches = []
-                            for line_num, line in enumerate(lines, 1):
-                                if search_term.lower() in line.lower():
-                                    matches.append({
-                                        "line": line_num,
-                                        "content": line.strip(),
-                                        "column": line.lower().find(search_term.lower())
-                                    })
-                            
-                            if matches:
-                                results[file_path] = matches
-                    except Exception:
-                        continue
-            
-            return {"results": results, "total_files_searched": len(files)}
+            if index is not None:
+                return index.search(
+                    search_term, path, file_pattern,
+                    regex=regex, case_sensitive=case_sensitive, max_results=max_results
+                )
+            return search_content(
+                search_term, path, file_pattern,
+                regex=regex, case_sensitive=case_sensitive, max_results=max_results
+            )
+        except re.error as e:
+            return {"error": f"Expressão regular inválida: {str(e)}"}
         except Exception as e:
             return {"error": f"Erro na busca: {str(e)}"}
 
 class ToolRegistry:
     """Registro central de todas as ferramentas"""
     
-    def __init__(self):
+    def __init__(self, index_dir: Optional[str] = None):
         self.tools = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Shell persistente do agente, iniciado no primeiro execute_command.
+        # Seu diretório atual (mudado por cd) é a base dos caminhos relativos
+        # de todas as ferramentas
+        self.shell = ShellSession()
+        # Limite de saída devolvida ao modelo por stream de cada comando; o
+        # que passar disso fica em arquivo (spill_command_output)
+        self.command_output_limit = OUTPUT_LIMIT
+        self.spill_command_output = True
+        # Recebe (stream, texto) enquanto um comando roda (ex: para a UI)
+        self.on_command_output: Optional[OutputCallback] = None
+        # Com index_dir, buscas dentro do workspace usam um índice de
+        # trigramas persistente (criado na primeira busca)
+        self.index_dir = index_dir
+        self.workspace = os.getcwd()
+        self._search_index: Optional[TrigramIndex] = None
+        self._index_lock = threading.Lock()
         self._register_all_tools()
     
     def _register_all_tools(self):
@@ -322,15 +496,20 @@ class ToolRegistry:
         
         # FileSystem Tools
         self.tools["read_file"] = {
-            "description": "Lê o conteúdo de um arquivo",
+            "description": "Lê o conteúdo de um arquivo (arquivos grandes voltam truncados; use um intervalo para ler outros trechos)",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "path": {"type": "string", "description": "Caminho do arquivo"},
-                    "encoding": {"type": "string", "default": "utf-8"}
+                    "encoding": {"type": "string", "default": "utf-8"},
+                    "start_line": {"type": "integer", "description": "Primeira linha a ler (a partir de 1)"},
+                    "end_line": {"type": "integer", "description": "Última linha a ler (inclusiva)"},
+                    "byte_offset": {"type": "integer", "description": "Offset em bytes do início do trecho"},
+                    "byte_count": {"type": "integer", "description": "Quantidade de bytes a ler"}
                 },
                 "required": ["path"]
-            }
+            },
+            "concurrency": {"mode": "read", "paths": ["path"]}
         }
         
         self.tools["write_file"] = {
@@ -343,22 +522,29 @@ class ToolRegistry:
                     "encoding": {"type": "string", "default": "utf-8"}
                 },
                 "required": ["path", "content"]
-            }
+            },
+            "concurrency": {"mode": "write", "paths": ["path"]}
         }
         
         self.tools["list_directory"] = {
-            "description": "Lista conteúdo de um diretório",
+            "description": "Lista conteúdo de um diretório (opcionalmente recursivo e paginado)",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "path": {"type": "string", "default": ".", "description": "Caminho do diretório"},
-                    "show_hidden": {"type": "boolean", "default": False}
+                    "show_hidden": {"type": "boolean", "default": False},
+                    "depth": {"type": "integer", "default": 1, "description": "Níveis a percorrer (1 = só o diretório)"},
+                    "ignore": {"type": "array", "items": {"type": "string"}, "description": "Padrões de nome a ignorar (ex: node_modules, *.pyc)"},
+                    "offset": {"type": "integer", "default": 0},
+                    "limit": {"type": "integer", "default": LIST_LIMIT},
+                    "format": {"type": "string", "enum": ["entries", "tree"], "default": "entries", "description": "tree: texto indentado compacto"}
                 }
-            }
+            },
+            "concurrency": {"mode": "read", "paths": ["path"]}
         }
         
         self.tools["execute_command"] = {
-            "description": "Executa um comando do sistema",
+            "description": "Executa um comando do sistema em um shell persistente (cd e variáveis exportadas valem para os próximos comandos)",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -366,7 +552,9 @@ class ToolRegistry:
                     "timeout": {"type": "integer", "default": 30, "description": "Timeout em segundos"}
                 },
                 "required": ["command"]
-            }
+            },
+            # Um comando pode ler ou alterar qualquer coisa
+            "concurrency": {"mode": "exclusive"}
         }
         
         self.tools["encode_image_to_base64"] = {
@@ -375,23 +563,48 @@ class ToolRegistry:
                 "type": "object",
                 "properties": {
                     "image_path": {"type": "string", "description": "Caminho da imagem"},
-                    "max_size": {"type": "array", "items": {"type": "integer"}, "default": [1024, 1024]}
+                    "max_size": {"type": "array", "items": {"type": "integer"}, "default": [1024, 1024]},
+                    "resample": {"type": "string", "enum": ["auto", "lanczos", "bilinear"], "default": "auto"}
                 },
                 "required": ["image_path"]
-            }
+            },
+            "concurrency": {"mode": "read", "paths": ["image_path"]}
         }
         
         self.tools["search_files"] = {
-            "description": "Busca arquivos por padrão",
+            "description": "Busca arquivos por padrão (ignora .git, node_modules e o que estiver no .gitignore)",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "pattern": {"type": "string", "description": "Padrão de busca (ex: *.py)"},
+                    "pattern": {
+                        "type": ["string", "array"], "items": {"type": "string"},
+                        "description": "Padrão ou lista de padrões (ex: *.py ou [\"*.py\", \"*.md\"])"
+                    },
                     "path": {"type": "string", "default": ".", "description": "Diretório de busca"},
-                    "recursive": {"type": "boolean", "default": True}
+                    "recursive": {"type": "boolean", "default": True},
+                    "max_results": {"type": "integer", "default": MAX_RESULTS},
+                    "sort": {"type": "string", "enum": ["name", "mtime"], "default": "name", "description": "mtime: mais recentes primeiro"}
                 },
                 "required": ["pattern"]
-            }
+            },
+            "concurrency": {"mode": "read", "paths": ["path"]}
+        }
+        
+        self.tools["search_in_files"] = {
+            "description": "Busca texto dentro de arquivos (respeita .gitignore, ignora binários)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search_term": {"type": "string", "description": "Texto ou expressão regular a buscar"},
+                    "path": {"type": "string", "default": ".", "description": "Diretório de busca"},
+                    "file_pattern": {"type": "string", "default": "*", "description": "Padrão de nome dos arquivos (ex: *.py)"},
+                    "regex": {"type": "boolean", "default": False},
+                    "case_sensitive": {"type": "boolean", "default": False},
+                    "max_results": {"type": "integer", "default": MAX_RESULTS}
+                },
+                "required": ["search_term"]
+            },
+            "concurrency": {"mode": "read", "paths": ["path"]}
         }
     
     def get_tool_definitions(self) -> List[Dict]:
@@ -408,8 +621,26 @@ class ToolRegistry:
             })
         return definitions
     
+    def _resolve_paths(self, tool_name: str, arguments: Dict) -> Dict:
+        """Argumentos com os caminhos (inclusive os padrões) absolutos
+
+        Caminhos relativos são resolvidos a partir do diretório atual do
+        shell, para que um ``cd`` em ``execute_command`` valha também para
+        as ferramentas de arquivo.
+        """
+        tool = self.tools.get(tool_name)
+        if tool is None:
+            return arguments
+        resolved = dict(arguments)
+        for argument in tool.get("concurrency", {}).get("paths", []):
+            value = arguments.get(argument, tool["parameters"]["properties"].get(argument, {}).get("default"))
+            if isinstance(value, str):
+                resolved[argument] = self.shell.resolve(value)
+        return resolved
+    
     def execute_tool(self, tool_name: str, arguments: Dict) -> Any:
         """Executa uma ferramenta específica"""
+        arguments = self._resolve_paths(tool_name, arguments)
         if tool_name == "read_file":
             return FileSystemTools.read_file(**arguments)
         elif tool_name == "write_file":
@@ -417,10 +648,148 @@ class ToolRegistry:
         elif tool_name == "list_directory":
             return FileSystemTools.list_directory(**arguments)
         elif tool_name == "execute_command":
-            return SystemTools.execute_command(**arguments)
+            try:
+                return SystemTools.execute_command(
+                    session=self.shell,
+                    max_output=self.command_output_limit,
+                    spill=self.spill_command_output,
+                    on_output=self.on_command_output,
+                    **arguments
+                )
+            finally:
+                # Um comando pode ter mudado qualquer arquivo do workspace
+                if self._search_index is not None:
+                    self._search_index.mark_dirty(self.workspace)
         elif tool_name == "encode_image_to_base64":
             return MediaTools.encode_image_to_base64(**arguments)
         elif tool_name == "search_files":
             return SearchTools.search_files(**arguments)
+        elif tool_name == "search_in_files":
+            return SearchTools.search_in_files(
+                index=self.search_index_for(arguments.get("path", ".")), **arguments
+            )
         else:
-            return f"Ferramenta não encontrada: {tool_name}"
\ No newline at end of file
+            return f"Ferramenta não encontrada: {tool_name}"
+    
+    def _call_access(self, tool_name: str, arguments: Dict) -> Tuple[str, List[str]]:
+        """Modo de acesso (read, write ou exclusive) e caminhos de uma chamada
+
+        Ferramentas sem classe de concorrência declarada são exclusivas.
+        """
+        concurrency = self.tools.get(tool_name, {}).get("concurrency", {"mode": "exclusive"})
+        resolved = self._resolve_paths(tool_name, arguments)
+        paths = [resolved[argument] for argument in concurrency.get("paths", [])
+                 if isinstance(resolved.get(argument), str)]
+        return concurrency["mode"], paths
+    
+    @staticmethod
+    def _conflicts(first: Tuple[str, List[str]], second: Tuple[str, List[str]]) -> bool:
+        """Duas chamadas conflitam se uma for exclusiva ou se uma escrever em
+        um caminho que a outra usa (ou em um diretório acima/abaixo dele)"""
+        if "exclusive" in (first[0], second[0]):
+            return True
+        if first[0] == "read" and second[0] == "read":
+            return False
+        for a in first[1]:
+            for b in second[1]:
+                if a == b or b.startswith(a.rstrip(os.sep) + os.sep) or a.startswith(b.rstrip(os.sep) + os.sep):
+                    return True
+        return False
+    
+    def execute_tools(self, calls: List[Dict]) -> List[Any]:
+        """Executa as tool calls de um turno, em paralelo quando independentes
+
+        Cada chamada é ``{"name": ..., "arguments": {...}}`` (ou no formato
+        ``tool_calls`` da OpenAI, com ``function.arguments`` em JSON). Uma
+        chamada só espera as anteriores com que conflita (ex: escrita e
+        leitura do mesmo arquivo, ou comandos do sistema), então a ordem de
+        efeitos é a mesma da execução sequencial. Os resultados voltam na
+        ordem das chamadas.
+        """
+        results: List[Any] = [None] * len(calls)
+        parsed = []
+        for index, call in enumerate(calls):
+            # Uma chamada malformada vira erro só no seu resultado; as
+            # demais do turno executam normalmente
+            name = None
+            try:
+                function = call.get("function", call)
+                name = function.get("name")
+                arguments = function.get("arguments") or {}
+                if isinstance(arguments, str):
+                    arguments = json.loads(arguments)
+                if not name:
+                    raise ValueError("chamada sem nome de ferramenta")
+                if not isinstance(arguments, dict):
+                    raise ValueError("os argumentos devem ser um objeto JSON")
+            except Exception as e:
+                results[index] = f"Erro ao executar {name or 'ferramenta'}: {str(e)}"
+                continue
+            parsed.append((index, name, arguments))
+        
+        if len(parsed) == 1:
+            index, name, arguments = parsed[0]
+            results[index] = self._run_tool(name, arguments)
+            return results
+        
+        if self._executor is None and parsed:
+            self._executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+        
+        accesses = [self._call_access(name, arguments) for _, name, arguments in parsed]
+        futures: List[Future] = []
+        for position, (_, name, arguments) in enumerate(parsed):
+            # Tarefas anteriores já saíram da fila do executor, então esperar
+            # por elas dentro de um worker não causa deadlock
+            dependencies = [
+                futures[earlier] for earlier in range(position)
+                if self._conflicts(accesses[earlier], accesses[position])
+            ]
+            futures.append(self._executor.submit(self._run_after, dependencies, name, arguments))
+        
+        for (index, _, _), future in zip(parsed, futures):
+            results[index] = future.result()
+        return results
+    
+    def search_index_for(self, path: str) -> Optional[TrigramIndex]:
+        """Índice de trigramas do workspace, se ``path`` estiver dentro dele"""
+        if not self.index_dir:
+            return None
+        path = os.path.abspath(os.path.expanduser(path))
+        if path != self.workspace and not path.startswith(self.workspace.rstrip(os.sep) + os.sep):
+            return None
+        with self._index_lock:
+            if self._search_index is None:
+                self._search_index = TrigramIndex(self.workspace, self.index_dir)
+            return self._search_index
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estado do cache de arquivos, do shell e do índice de busca"""
+        stats = {
+            "file_cache": FileSystemTools.cache.stats(),
+            "image_cache": MediaTools.cache.stats(),
+            "shell": self.shell.stats()
+        }
+        if self._search_index is not None:
+            stats["search_index"] = self._search_index.stats()
+        return stats
+    
+    def close(self):
+        """Encerra o shell persistente, o índice de busca e os workers de tool calls"""
+        self.shell.close()
+        if self._search_index is not None:
+            self._search_index.close()
+            self._search_index = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def _run_after(self, dependencies: List[Future], tool_name: str, arguments: Dict) -> Any:
+        wait(dependencies)
+        return self._run_tool(tool_name, arguments)
+    
+    def _run_tool(self, tool_name: str, arguments: Dict) -> Any:
+        """Executa uma ferramenta, convertendo exceções em mensagem de erro"""
+        try:
+            return self.execute_tool(tool_name, arguments)
+        except Exception as e:
+            return f"Erro ao executar {tool_name}: {str(e)}"
@@ -0,0 +1,106 @@
+"""
+HTTP sobre Unix domain socket
+
+Clientes no mesmo host que o servidor podem falar com ele por um socket Unix
+em vez do loopback TCP. Endereços de servidor no formato
+``unix:///caminho/do/socket`` são convertidos para URLs ``http+unix://``,
+atendidas pelo ``UnixSocketAdapter`` de uma sessão ``requests``.
+"""
+
+import os
+import socket
+from typing import Any, Dict
+from urllib.parse import quote, unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+UNIX_SCHEME = "http+unix"
+
+# Variável de ambiente com o caminho do socket do servidor local
+SOCKET_ENV = "OPENAGENT_SOCKET"
+
+
+def server_base_url(address: str) -> str:
+    """Converte ``unix:///caminho.sock`` na URL base equivalente (HTTP fica igual)"""
+    if address.startswith("unix://"):
+        path = address[len("unix://"):]
+        return f"{UNIX_SCHEME}://{quote(path, safe='')}"
+    return address.rstrip("/")
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, socket_path: str, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class _UnixConnectionPool(HTTPConnectionPool):
+    def __init__(self, socket_path: str, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> _UnixHTTPConnection:
+        return _UnixHTTPConnection(self.socket_path, timeout=self.timeout.connect_timeout)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Adapter do ``requests`` para URLs ``http+unix://<caminho codificado>/...``"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._pools = {}
+
+    def _pool(self, url: str) -> _UnixConnectionPool:
+        socket_path = unquote(urlparse(url).netloc)
+        if socket_path not in self._pools:
+            self._pools[socket_path] = _UnixConnectionPool(socket_path, maxsize=self._pool_maxsize)
+        return self._pools[socket_path]
+
+    def get_connection(self, url, proxies=None):
+        return self._pool(url)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool(request.url)
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def close(self):
+        super().close()
+        for pool in self._pools.values():
+            pool.close()
+        self._pools.clear()
+
+
+def create_session() -> requests.Session:
+    """Sessão ``requests`` que aceita servidores HTTP e ``http+unix://``"""
+    session = requests.Session()
+    session.mount(f"{UNIX_SCHEME}://", UnixSocketAdapter())
+    return session
+
+
+def openai_client_options(base_url: str = "http://localhost:1234/v1") -> Dict[str, Any]:
+    """Argumentos de ``OpenAI(...)`` para falar com o servidor local
+
+    Com ``OPENAGENT_SOCKET`` definido, o cliente usa o Unix domain socket do
+    OpenAgent (via transporte do ``httpx``) em vez do loopback TCP.
+    """
+    socket_path = os.environ.get(SOCKET_ENV)
+    if not socket_path:
+        return {"base_url": base_url}
+
+    import httpx
+    return {
+        "base_url": "http://localhost/v1",
+        "http_client": httpx.Client(transport=httpx.HTTPTransport(uds=os.path.expanduser(socket_path)))
+    }
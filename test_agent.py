@@ -3,17 +3,17 @@ import os
 import sys
 from openai import OpenAI
 
+from openagent.uds import openai_client_options
+
 # Configurar encoding para Windows
 if sys.platform == "win32":
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-# Conecta no LM Studio
-client = OpenAI(
-    api_key="dummy",
-    base_url="http://localhost:1234/v1"
-)
+# Conecta no servidor local; com OPENAGENT_SOCKET usa o Unix domain socket
+# do OpenAgent em vez do loopback TCP
+client = OpenAI(api_key="dummy", **openai_client_options())
 
 # ========= TOOLS =========
 